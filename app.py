@@ -1,7 +1,6 @@
-import os
-
-from shiny import App, render, ui, reactive
+from shiny import App, ui
 from server import *
+from static_pages import markdown_html, markdown_file_html
 
 
 def ui_card(title, *args):
@@ -15,7 +14,7 @@ def ui_card(title, *args):
 
 
 home_page = ui.page_fluid(
-    ui.markdown(
+    markdown_html(
         """
         ### What this application does:
           This application queries [OpenAlex](https://openalex.org/) for information about publications submitted in a
@@ -36,19 +35,22 @@ home_page = ui.page_fluid(
     ui.panel_well(
         ui.h3("Upload a DOI file:"),
 
-        ui.input_file("user_file", "Choose a file to upload:", multiple=False),
-        ui.input_radio_buttons("type", "Type:", ["Text", "Other"]),
+        ui.input_file("user_file", "Choose a file to upload (several files to compare them):", multiple=True),
+        ui.input_radio_buttons("type", "Type:", ["Text", "Zotero CSV", "RIS", "BibTeX"]),
+        ui.input_file("snapshot_file", "Or open a saved snapshot:", accept=[SNAPSHOT_EXTENSION], multiple=False),
     ),
 
     ui.panel_well(
         ui.h3("Input data"),
         ui.output_text_verbatim("app_clean_input_list"),
         ui.h3("Query OpenAlex"),
+        ui.input_checkbox("incremental_query", "Only query DOIs added since the last query", value=True),
         ui.input_action_button("query_button", "Query OpenAlex")
     ),
 
     ui.panel_well(
         ui.h3("Query result dictionaries"),
+        ui.download_button("app_download_snapshot", "Save snapshot"),
 
         ui_card(
             ui.h4("Identifiers with errors:"),
@@ -57,29 +59,56 @@ home_page = ui.page_fluid(
 
         ui_card(
             ui.h4("Results for identifiers without errors:"),
-            ui.output_text_verbatim("app_query_result")
+            ui.layout_columns(
+                ui.input_text("result_filter", "Filter:", placeholder="e.g. article 2020"),
+                ui.input_numeric("result_page", "Page:", 1, min=1),
+                ui.input_select("result_page_size", "Rows per page:", [str(size) for size in RESULT_PAGE_SIZES]),
+            ),
+            ui.output_ui("app_query_result"),
+            ui.download_button("app_download_results_csv", "Download results (CSV)"),
+            ui.download_button("app_download_results_json_lines", "Download results (JSON Lines)"),
         ),
     ),
 
     ui.panel_well(
         ui.h3("Plots"),
-        ui.output_plot("type_frequency", height='90vh', width='90vw'),
-        ui.output_plot("type_frequency_pie", height='90vh', width='90vw'),
-        ui.output_plot("year_frequency", height='90vh', width='90vw'),
-        ui.output_plot("primary_location_frequency", height='90vh', width='90vw'),
-        ui.output_plot("keyword_frequency", height='90vh', width='90vw'),
-        ui.output_plot("concepts_frequency", height='90vh', width='90vw'),
-    )
+        ui.output_ui("type_frequency", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.output_ui("type_frequency_pie", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.output_ui("year_frequency", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.output_ui("primary_location_frequency", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.output_ui("keyword_frequency", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.output_ui("concepts_frequency", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.output_ui("authorship_network", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.layout_columns(
+            ui.input_select("topic_level", "Topic level:", TOPIC_LEVEL_CHOICES),
+            ui.input_select("topic_parent", "Within:", {ALL_TOPICS_CHOICE: "All"}),
+        ),
+        ui.output_ui("topic_frequency", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+    ),
+
+    ui.panel_well(
+        ui.h3("Compare lists"),
+        ui.output_text_verbatim("app_comparison_summary"),
+        ui.output_ui("comparison_overlap", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+        ui.input_select("comparison_attribute", "Compare:", COMPARISON_ATTRIBUTE_NAMES),
+        ui.output_ui("comparison_frequency", class_="shiny-report-size", style="height: 90vh; width: 90vw;"),
+    ),
+
+    ui.accordion(
+        ui.accordion_panel(
+            "Run diagnostics",
+            ui.output_text_verbatim("app_run_diagnostics"),
+            ui.download_button("app_download_metrics_json", "Download metrics (JSON)"),
+            ui.download_button("app_download_metrics_prometheus", "Download metrics (Prometheus)"),
+        ),
+        open=False,
+    ),
 )
 
-with open('how_to_instructions.md', 'r') as file:
-    how_to_markdown_file = file.read()
-how_to_page = ui.markdown(how_to_markdown_file)
+how_to_page = markdown_file_html('how_to_instructions.md')
 
-with open('example_page.md', 'r') as file:
-    example_markdown_file = file.read()
 example_page = ui.page_fluid(
-    ui.markdown(example_markdown_file)
+    markdown_file_html('example_page.md')
 )
 
 app_ui = ui.page_navbar(
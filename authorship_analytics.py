@@ -0,0 +1,326 @@
+import weakref
+from array import array
+
+from work_store import CategoryIndex, WorkStore
+
+TOP_AUTHOR_COUNT = 15
+COAUTHOR_MAX_AUTHORS = 100  # Works with more authors are left out of co-author pairs, which grow quadratically.
+
+authorship_network_memo = weakref.WeakKeyDictionary()
+
+
+class AuthorshipNetwork:
+    """
+    Sparse co-authorship and author-institution network built from the authorships of a WorkStore by
+    build_authorship_network(). Authors and institutions are interned as integer codes (keyed by OpenAlex ID, or by
+    display name if OpenAlex has no ID) and incidence matrices are stored in CSR form: row i of the work-author matrix
+    holds the author codes work_authors[work_author_offsets[i]:work_author_offsets[i + 1]].
+    """
+
+    def __init__(self):
+        self.work_count = 0
+        self.authorship_count = 0
+        self.author_index = CategoryIndex()
+        self.author_names = []
+        self.institution_index = CategoryIndex()
+        self.institution_names = []
+        self.work_author_offsets = None
+        self.work_authors = None
+        self.work_institution_offsets = None
+        self.work_institutions = None
+        self.author_institution_offsets = None
+        self.author_institutions = None
+        self.author_work_counts = None
+        self.institution_work_counts = None
+        self.coauthor_degrees = None
+        self.excluded_work_count = 0
+        self.component_labels = None
+        self.component_sizes = None
+
+
+def csr_from_pairs(rows: "numpy.ndarray", columns: "numpy.ndarray", row_count: int, column_count: int):
+    """
+    Builds a deduplicated binary incidence matrix in CSR form from (row, column) pairs.
+
+    :param rows: array of row codes
+    :param columns: array of column codes, same length as rows
+    :param row_count: number of rows
+    :param column_count: number of columns
+    :return: row offsets (length row_count + 1) and sorted column codes of each row
+    """
+    import numpy as np
+
+    keys = np.unique(rows.astype(np.int64) * max(column_count, 1) + columns)
+    offsets = np.zeros(row_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // max(column_count, 1), minlength=row_count), out=offsets[1:])
+    return offsets, (keys % max(column_count, 1)).astype(np.int32)
+
+
+def coauthor_pairs(offsets: "numpy.ndarray", indices: "numpy.ndarray", max_row_length: int):
+    """
+    Lists the co-author pairs of a work-author CSR matrix without a Python loop: every author of a work is paired
+    with every author of the same work, as in the product of the matrix with its transpose.
+
+    :param offsets: row offsets of the work-author matrix
+    :param indices: author codes of the work-author matrix
+    :param max_row_length: works with more authors are skipped
+    :return: arrays of first and second author codes with first < second, possibly repeated across works
+    """
+    import numpy as np
+
+    row_lengths = np.diff(offsets)
+    row_lengths[(row_lengths < 2) | (row_lengths > max_row_length)] = 0
+    entry_lengths = np.repeat(row_lengths, np.diff(offsets))
+    entry_starts = np.repeat(offsets[:-1], np.diff(offsets))
+    keep = entry_lengths > 0
+    entry_positions = np.flatnonzero(keep)
+    entry_lengths = entry_lengths[keep]
+    entry_starts = entry_starts[keep]
+
+    pair_count = int(entry_lengths.sum())
+    first_positions = np.repeat(entry_positions, entry_lengths)
+    group_starts = np.repeat(np.cumsum(entry_lengths) - entry_lengths, entry_lengths)
+    second_positions = np.repeat(entry_starts, entry_lengths) + np.arange(pair_count) - group_starts
+    first_authors = indices[first_positions]
+    second_authors = indices[second_positions]
+    is_upper = first_authors < second_authors
+    return first_authors[is_upper], second_authors[is_upper]
+
+
+def connected_components(offsets: "numpy.ndarray", indices: "numpy.ndarray", author_count: int):
+    """
+    Finds the connected components of the co-authorship network with a union-find over the work-author matrix. Each
+    author of a work is joined with its first author, so the cost is linear in the number of authorships.
+
+    :param offsets: row offsets of the work-author matrix
+    :param indices: author codes of the work-author matrix
+    :param author_count: number of authors
+    :return: component label of each author (labels count from 0 in order of size, largest first) and component sizes
+    """
+    import numpy as np
+
+    parents = list(range(author_count))
+
+    def find(author):
+        root = author
+        while parents[root] != root:
+            root = parents[root]
+        while parents[author] != root:
+            parents[author], author = root, parents[author]
+        return root
+
+    index_list = indices.tolist()
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        if end - start < 2:
+            continue
+        first_root = find(index_list[start])
+        for author in index_list[start + 1:end]:
+            root = find(author)
+            if root != first_root:
+                parents[root] = first_root
+    roots = np.fromiter((find(author) for author in range(author_count)), dtype=np.int64, count=author_count)
+    root_codes, root_labels = np.unique(roots, return_inverse=True)
+    sizes = np.bincount(root_labels, minlength=len(root_codes))
+    order = np.argsort(-sizes, kind="stable")
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order))
+    return ranks[root_labels].astype(np.int32), sizes[order]
+
+
+def build_authorship_network(work_store: WorkStore, max_coauthors: int = COAUTHOR_MAX_AUTHORS):
+    """
+    Builds the co-authorship and author-institution network of a WorkStore in one pass over its authorships, then
+    derives author and institution work counts, co-author degrees and connected components with array operations. The
+    result is memoized per WorkStore and rebuilt only if works have been added since.
+
+    Memory grows with the number of authorships, except for the co-author pairs, which grow with the square of the
+    authors per work; works with more than max_coauthors authors are therefore left out of the co-author degrees
+    (they still join their authors into one connected component).
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param max_coauthors: largest number of authors of a work counted in co-author degrees
+    :return: AuthorshipNetwork
+    """
+    import numpy as np
+
+    memoized = authorship_network_memo.get(work_store)
+    if memoized is not None and memoized[0] == (len(work_store), max_coauthors):
+        return memoized[1]
+
+    network = AuthorshipNetwork()
+    author_index = network.author_index
+    institution_index = network.institution_index
+    work_author_offsets = array("q", [0])
+    work_authors = array("i")
+    pair_authors = array("i")
+    pair_institutions = array("i")
+    work_institution_offsets = array("q", [0])
+    work_institutions = array("i")
+    for authorships in work_store.authorships:
+        author_codes = {}
+        institution_codes = {}
+        for authorship in authorships or []:
+            network.authorship_count += 1
+            author = authorship.get("author") or {}
+            author_key = author.get("id") or author.get("display_name")
+            if author_key is None:
+                continue
+            author_code = author_index.intern(author_key, author.get("id"))
+            if author_code == len(network.author_names):
+                network.author_names.append(author.get("display_name") or author_key)
+            author_codes[author_code] = None
+            for institution in authorship.get("institutions") or []:
+                institution_key = institution.get("id") or institution.get("display_name")
+                if institution_key is None:
+                    continue
+                institution_code = institution_index.intern(institution_key, institution.get("id"))
+                if institution_code == len(network.institution_names):
+                    network.institution_names.append(institution.get("display_name") or institution_key)
+                institution_codes[institution_code] = None
+                pair_authors.append(author_code)
+                pair_institutions.append(institution_code)
+        work_authors.extend(author_codes)
+        work_author_offsets.append(len(work_authors))
+        work_institutions.extend(institution_codes)
+        work_institution_offsets.append(len(work_institutions))
+
+    author_count = len(author_index)
+    institution_count = len(institution_index)
+    network.work_count = len(work_author_offsets) - 1
+    network.work_author_offsets = np.array(work_author_offsets, dtype=np.int64)
+    network.work_authors = np.array(work_authors, dtype=np.int32)
+    network.work_institution_offsets = np.array(work_institution_offsets, dtype=np.int64)
+    network.work_institutions = np.array(work_institutions, dtype=np.int32)
+    network.author_institution_offsets, network.author_institutions = csr_from_pairs(
+        np.array(pair_authors, dtype=np.int32), np.array(pair_institutions, dtype=np.int32),
+        author_count, institution_count)
+    network.author_work_counts = np.bincount(network.work_authors, minlength=author_count)
+    network.institution_work_counts = np.bincount(network.work_institutions, minlength=institution_count)
+
+    work_author_counts = np.diff(network.work_author_offsets)
+    network.excluded_work_count = int(np.count_nonzero(work_author_counts > max_coauthors))
+    first_authors, second_authors = coauthor_pairs(network.work_author_offsets, network.work_authors, max_coauthors)
+    coauthor_keys = np.unique(first_authors.astype(np.int64) * max(author_count, 1) + second_authors)
+    network.coauthor_degrees = (np.bincount(coauthor_keys // max(author_count, 1), minlength=author_count)
+                                + np.bincount(coauthor_keys % max(author_count, 1), minlength=author_count))
+    network.component_labels, network.component_sizes = connected_components(network.work_author_offsets,
+                                                                              network.work_authors, author_count)
+
+    authorship_network_memo[work_store] = ((len(work_store), max_coauthors), network)
+    return network
+
+
+def top_authors(network: AuthorshipNetwork, count: int = TOP_AUTHOR_COUNT):
+    """
+    :param network: AuthorshipNetwork from build_authorship_network()
+    :param count: number of authors
+    :return: dictionary of author display name to number of works, most frequent first
+    """
+    import numpy as np
+
+    order = np.argsort(-network.author_work_counts, kind="stable")[:count]
+    return {network.author_names[code]: int(network.author_work_counts[code]) for code in order}
+
+
+def top_institutions(network: AuthorshipNetwork, count: int = TOP_AUTHOR_COUNT):
+    """
+    :param network: AuthorshipNetwork from build_authorship_network()
+    :param count: number of institutions
+    :return: dictionary of institution display name to number of works, most frequent first
+    """
+    import numpy as np
+
+    order = np.argsort(-network.institution_work_counts, kind="stable")[:count]
+    return {network.institution_names[code]: int(network.institution_work_counts[code]) for code in order}
+
+
+def collaboration_summary(network: AuthorshipNetwork):
+    """
+    Summarizes the network. The degree of collaboration is the share of works with more than one author.
+
+    :param network: AuthorshipNetwork from build_authorship_network()
+    :return: dictionary of summary statistics
+    """
+    import numpy as np
+
+    work_author_counts = np.diff(network.work_author_offsets)
+    works_with_authors = int(np.count_nonzero(work_author_counts))
+    author_count = len(network.author_names)
+    largest_component = int(network.component_sizes[0]) if len(network.component_sizes) else 0
+    return {"works": network.work_count,
+            "authorships": network.authorship_count,
+            "authors": author_count,
+            "institutions": len(network.institution_names),
+            "mean_authors_per_work": (float(work_author_counts.sum() / works_with_authors)
+                                      if works_with_authors else 0.0),
+            "degree_of_collaboration": (float(np.count_nonzero(work_author_counts > 1) / works_with_authors)
+                                        if works_with_authors else 0.0),
+            "mean_coauthor_degree": float(network.coauthor_degrees.mean()) if author_count else 0.0,
+            "max_coauthor_degree": int(network.coauthor_degrees.max()) if author_count else 0,
+            "works_excluded_from_degrees": network.excluded_work_count,
+            "components": len(network.component_sizes),
+            "largest_component_authors": largest_component,
+            "largest_component_share": largest_component / author_count if author_count else 0.0}
+
+
+def create_authorship_network_plot(network: AuthorshipNetwork, top_count: int = TOP_AUTHOR_COUNT):
+    """
+    Creates a summary plot of the authorship network: top authors, top institutions, the distribution of co-author
+    degrees and the distribution of connected component sizes.
+
+    :param network: AuthorshipNetwork from build_authorship_network()
+    :param top_count: number of authors and institutions drawn
+    :return: figure
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    import numpy as np
+
+    summary = collaboration_summary(network)
+    fig7, ((ax_authors, ax_institutions), (ax_degrees, ax_components)) = plt.subplots(
+        2, 2, figsize=(14.0, 11.0), layout="constrained")
+    fig7.suptitle("Authorship Network")
+
+    for ax, table, title in ((ax_authors, top_authors(network, top_count), "Most Frequent Authors"),
+                             (ax_institutions, top_institutions(network, top_count), "Most Frequent Institutions")):
+        labels = [label[:37] + "..." if len(label) > 40 else label for label in reversed(table.keys())]
+        ax.barh(labels, list(reversed(table.values())))
+        ax.set_title(title)
+        ax.set_xlabel("Works")
+        ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+        ax.tick_params(axis='y', labelsize='x-small')
+        if ax.containers:
+            ax.bar_label(ax.containers[0], label_type='edge', padding=0.5)
+
+    degree_counts = np.bincount(network.coauthor_degrees)
+    degrees = np.flatnonzero(degree_counts)
+    ax_degrees.scatter(degrees + 1, degree_counts[degrees], s=10)
+    if len(degrees):
+        ax_degrees.set_xscale("log")
+        ax_degrees.set_yscale("log")
+    ax_degrees.set_title(f"Co-author Degrees (mean {summary['mean_coauthor_degree']:.1f})")
+    ax_degrees.set_xlabel("Distinct co-authors + 1")
+    ax_degrees.set_ylabel("Authors")
+
+    size_counts = np.bincount(network.component_sizes)
+    sizes = np.flatnonzero(size_counts)
+    ax_components.scatter(sizes, size_counts[sizes], s=10)
+    if len(sizes):
+        ax_components.set_xscale("log")
+        ax_components.set_yscale("log")
+    ax_components.set_title(f"{summary['components']} Connected Components "
+                            f"(largest: {summary['largest_component_share']:.0%} of authors)")
+    ax_components.set_xlabel("Component size (authors)")
+    ax_components.set_ylabel("Components")
+
+    plt.figtext(0.01,
+                0.005,
+                f"{summary['authors']} authors and {summary['institutions']} institutions in "
+                f"{summary['works']} works; {summary['mean_authors_per_work']:.1f} authors per work, "
+                f"{summary['degree_of_collaboration']:.0%} of works co-authored"
+                + (f"; {summary['works_excluded_from_degrees']} works with more than {COAUTHOR_MAX_AUTHORS} "
+                   f"authors excluded from degrees" if summary['works_excluded_from_degrees'] else ""),
+                horizontalalignment='left',
+                size='x-small')
+
+    return fig7
@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# Charts are only written to files, so matplotlib uses the non-interactive Agg backend, in this process and in the
+# render processes.
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from query_open_alex import (INPUT_FORMAT_EXTENSIONS, clean_input_list, create_concepts_frequency_plot,
+                             create_keyword_frequency_plot, create_primary_location_frequency_plot,
+                             create_type_frequency_bar_chart, create_type_frequency_pie_chart,
+                             create_year_frequency_plot, iter_input_file, query_open_alex)
+from instrumentation import RunMetrics
+from offline_index import OfflineIndex
+from work_aggregates import WorkAggregates, aggregate_works
+from work_cache import WorkCache
+
+BATCH_OUTPUT_DIRECTORY = "bibliography-reports"
+BATCH_IMAGE_FORMATS = ["png", "svg"]
+BATCH_DPI = 150
+SUMMARY_FILENAME = "summary.json"
+CHART_FUNCTIONS = {
+    "type_frequency": create_type_frequency_bar_chart,
+    "type_frequency_pie": create_type_frequency_pie_chart,
+    "year_frequency": lambda work_aggregates: create_year_frequency_plot(work_aggregates)[0],
+    "primary_location_frequency": lambda work_aggregates: create_primary_location_frequency_plot(work_aggregates)[0],
+    "keyword_frequency": lambda work_aggregates: create_keyword_frequency_plot(work_aggregates)[0],
+    "concepts_frequency": lambda work_aggregates: create_concepts_frequency_plot(work_aggregates)[0],
+}
+
+
+def find_input_files(path_list: list):
+    """
+    Expands directories into the DOI files they contain (files with an extension in INPUT_FORMAT_EXTENSIONS, not
+    recursively). Files given explicitly are kept whatever their extension.
+
+    :param path_list: list of file and directory paths
+    :return: list of file paths, without duplicates
+    """
+    filename_list = []
+    for path in path_list:
+        if os.path.isdir(path):
+            filename_list.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                                 if os.path.splitext(name)[1].lower() in INPUT_FORMAT_EXTENSIONS
+                                 and os.path.isfile(os.path.join(path, name)))
+        else:
+            filename_list.append(path)
+    return list(dict.fromkeys(filename_list))
+
+
+def report_directories(filename_list: list, output_directory: str):
+    """
+    :param filename_list: list of input file paths
+    :param output_directory: directory the reports are written to
+    :return: dictionary of input file path to its report directory, named after the file and made unique
+    """
+    directories = {}
+    used_names = set()
+    for filename in filename_list:
+        name = os.path.splitext(os.path.basename(filename))[0] or "bibliography"
+        unique_name = name
+        suffix = 2
+        while unique_name in used_names:
+            unique_name = f"{name}-{suffix}"
+            suffix += 1
+        used_names.add(unique_name)
+        directories[filename] = os.path.join(output_directory, unique_name)
+    return directories
+
+
+def render_chart(chart_name: str, work_aggregates: WorkAggregates, path_stem: str, image_formats: list):
+    """
+    Renders one chart of a bibliography to image files. Runs in a render process, see run_batch().
+
+    :param chart_name: key of CHART_FUNCTIONS
+    :param work_aggregates: frequency tables of the bibliography
+    :param path_stem: output path without extension
+    :param image_formats: list of image formats, e.g. ["png", "svg"]
+    :return: list of written file paths
+    """
+    import matplotlib.pyplot as plt
+
+    figure = CHART_FUNCTIONS[chart_name](work_aggregates)
+    path_list = []
+    try:
+        for image_format in image_formats:
+            path = f"{path_stem}.{image_format}"
+            figure.savefig(path, format=image_format, dpi=BATCH_DPI)
+            path_list.append(path)
+    finally:
+        plt.close(figure)
+    return path_list
+
+
+def table_summary(table: dict, names: dict = None):
+    """
+    :param table: frequency dictionary, possibly with non-string keys (e.g. publication years)
+    :param names: display names of canonical keys, for tables keyed by OpenAlex ID (venues, keywords and concepts)
+    :return: list of {"label", "count"} objects in table order (with "key" if names are given), which keeps key types
+    in JSON
+    """
+    if names is None:
+        return [{"label": label, "count": count} for label, count in table.items()]
+    return [{"label": names.get(key, key), "key": key, "count": count} for key, count in table.items()]
+
+
+def bibliography_summary(filename: str,
+                         cleaned_input_list: list,
+                         work_aggregates: WorkAggregates,
+                         identifier_with_error_list: list,
+                         chart_files: dict):
+    """
+    :param filename: input file path
+    :param cleaned_input_list: cleaned input list of the file
+    :param work_aggregates: frequency tables of the file's works
+    :param identifier_with_error_list: identifiers of the file that had errors
+    :param chart_files: dictionary of chart name to written file paths
+    :return: JSON-serializable summary of the bibliography
+    """
+    return {"input_file": filename,
+            "doi_count": len(cleaned_input_list),
+            "work_count": work_aggregates.total_count,
+            "identifiers_with_errors": identifier_with_error_list,
+            "frequency_tables": {"type": table_summary(work_aggregates.type_frequency),
+                                 "year": table_summary(work_aggregates.year_frequency),
+                                 "primary_location": table_summary(work_aggregates.primary_location_frequency,
+                                                                   work_aggregates.primary_location_names),
+                                 "keyword": table_summary(work_aggregates.keyword_frequency,
+                                                          work_aggregates.keyword_names),
+                                 "concepts": table_summary(work_aggregates.concepts_frequency,
+                                                           work_aggregates.concepts_names)},
+            "none_counts": {"type": len(work_aggregates.type_none_list),
+                            "year": len(work_aggregates.year_none_list),
+                            "primary_location": len(work_aggregates.primary_location_none_list),
+                            "keyword": len(work_aggregates.keyword_none_list),
+                            "concepts": len(work_aggregates.concepts_none_list)},
+            "charts": chart_files}
+
+
+def run_batch(path_list: list,
+              output_directory: str = BATCH_OUTPUT_DIRECTORY,
+              image_formats: list = BATCH_IMAGE_FORMATS,
+              input_format: str = None,
+              max_workers: int = None,
+              cache: WorkCache = None,
+              run_metrics: RunMetrics = None,
+              offline_index=None):
+    """
+    Creates reports for many bibliographies without a display. The DOIs of all input files are read and cleaned, and
+    their union is queried from OpenAlex once, so a DOI shared by several files is fetched only once. The works of
+    each file are then aggregated separately, all charts of all files are rendered on a process pool, and each file's
+    report directory receives its chart images and a SUMMARY_FILENAME with its frequency tables.
+
+    :param path_list: list of DOI files and directories of DOI files, see find_input_files()
+    :param output_directory: directory for the report directories
+    :param image_formats: list of image formats, e.g. ["png", "svg"]
+    :param input_format: input file format, or None to guess it from each file's extension
+    :param max_workers: number of render processes, or None for one per CPU
+    :param cache: persistent Work object cache, or None to always query OpenAlex
+    :param run_metrics: metrics to record the stages of the batch in, or None
+    :param offline_index: offline_index.OfflineIndex to look the DOIs up in instead of OpenAlex, or None
+    :return: list of bibliography summaries, see bibliography_summary()
+    """
+    run_metrics = run_metrics if run_metrics is not None else RunMetrics()
+    filename_list = find_input_files(path_list)
+    directories = report_directories(filename_list, output_directory)
+
+    with run_metrics.stage("read"):
+        input_lists = {filename: list(iter_input_file(filename, input_format)) for filename in filename_list}
+    with run_metrics.stage("clean"):
+        cleaned_input_lists = {filename: clean_input_list(input_list) for filename, input_list in input_lists.items()}
+        union_list = clean_input_list(identifier for cleaned_input_list in cleaned_input_lists.values()
+                                      for identifier in cleaned_input_list)
+    print(f"{len(union_list)} distinct DOIs in {len(filename_list)} files.")
+    with run_metrics.stage("fetch"):
+        work_store, identifier_with_error_list = query_open_alex(union_list, cache=cache, statistics=run_metrics,
+                                                                 offline_index=offline_index)
+    error_set = set(identifier_with_error_list)
+
+    with run_metrics.stage("aggregate"):
+        file_aggregates = {}
+        for filename, cleaned_input_list in cleaned_input_lists.items():
+            rows = [work_store.rows[identifier] for identifier in cleaned_input_list if identifier in work_store]
+            file_aggregates[filename] = aggregate_works(work_store.subset(rows))
+
+    with run_metrics.stage("render"):
+        chart_files = {filename: {} for filename in filename_list}
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for filename in filename_list:
+                os.makedirs(directories[filename], exist_ok=True)
+                for chart_name in CHART_FUNCTIONS:
+                    future = executor.submit(render_chart, chart_name, file_aggregates[filename],
+                                             os.path.join(directories[filename], chart_name), image_formats)
+                    futures[future] = (filename, chart_name)
+            for future, (filename, chart_name) in futures.items():
+                chart_files[filename][chart_name] = future.result()
+
+    summary_list = []
+    for filename in filename_list:
+        summary = bibliography_summary(filename,
+                                       cleaned_input_lists[filename],
+                                       file_aggregates[filename],
+                                       [identifier for identifier in cleaned_input_lists[filename]
+                                        if identifier in error_set],
+                                       chart_files[filename])
+        with open(os.path.join(directories[filename], SUMMARY_FILENAME), "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+        summary_list.append(summary)
+        print(f"{filename}: {summary['work_count']} works, report in {directories[filename]}")
+    return summary_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Creates chart and JSON reports for DOI files without a display, "
+                                                 "querying the DOIs shared between files only once.")
+    parser.add_argument("paths", nargs="+", help="DOI files, or directories of DOI files")
+    parser.add_argument("-o", "--output-directory", default=BATCH_OUTPUT_DIRECTORY,
+                        help="directory for the reports, one subdirectory per file")
+    parser.add_argument("--image-format", action="append", choices=["png", "svg", "pdf"], dest="image_formats",
+                        help="chart image format; may be repeated (default: png and svg)")
+    parser.add_argument("--format", choices=["text", "csv", "ris", "bibtex"], default=None,
+                        help="input file format; guessed from each file's extension by default")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: one per CPU)")
+    parser.add_argument("--no-cache", action="store_true", help="always query OpenAlex instead of the Work cache")
+    parser.add_argument("--offline-index", metavar="DIRECTORY",
+                        help="look DOIs up in an offline index of a local OpenAlex snapshot instead of OpenAlex")
+    parser.add_argument("--metrics-json", metavar="PATH", help="write the run metrics as JSON")
+    args = parser.parse_args()
+
+    run_metrics = RunMetrics()
+    summary_list = run_batch(args.paths,
+                             output_directory=args.output_directory,
+                             image_formats=args.image_formats or BATCH_IMAGE_FORMATS,
+                             input_format=args.format,
+                             max_workers=args.workers,
+                             cache=None if args.no_cache else WorkCache(),
+                             run_metrics=run_metrics,
+                             offline_index=OfflineIndex(args.offline_index) if args.offline_index else None)
+    print()
+    print(run_metrics.summary_table())
+    if args.metrics_json:
+        with open(args.metrics_json, "w") as file:
+            file.write(run_metrics.to_json())
+    sys.exit(0 if summary_list else 1)
+
+
+if __name__ == "__main__":
+    main()
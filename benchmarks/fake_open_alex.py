@@ -0,0 +1,400 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "works.jsonl")
+MISSING_DOI_MARKER = "missing"  # DOIs containing this marker are answered with 404 / left out of filter results.
+# Vocabulary sizes of the synthetic Work objects served when no fixtures are recorded. No fixtures are committed, so
+# the benchmarks run on these by default.
+SYNTHETIC_VENUE_COUNT = 60
+SYNTHETIC_KEYWORD_COUNT = 150
+SYNTHETIC_CONCEPT_COUNT = 400
+SYNTHETIC_AUTHOR_COUNT = 5000
+SYNTHETIC_INSTITUTION_COUNT = 300
+SYNTHETIC_TOPIC_COUNT = 200
+# Synthetic citation graph: work number i cites the numbers (i * A + (k + 1) * B) mod SYNTHETIC_WORK_ID_SPACE for k
+# below its reference count. A is invertible modulo the ID space, so the works citing a number can be computed too.
+SYNTHETIC_WORK_ID_SPACE = 10 ** 10
+SYNTHETIC_CITATION_MULTIPLIER = 5777941757
+SYNTHETIC_CITATION_INCREMENT = 3037000493
+SYNTHETIC_MAX_REFERENCES = 20
+
+
+def stable_hash(value: str):
+    """
+    :param value: string to hash
+    :return: non-negative integer that is the same in every process, unlike hash()
+    """
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def synthetic_reference_count(work_number: int):
+    """
+    :param work_number: number of a synthetic work, as in its OpenAlex ID "W<number>"
+    :return: number of works the work cites
+    """
+    return stable_hash(f"references {work_number}") % (SYNTHETIC_MAX_REFERENCES + 1)
+
+
+def synthetic_references(work_number: int):
+    """
+    :param work_number: number of a synthetic work
+    :return: list of the numbers of the works it cites
+    """
+    return [(work_number * SYNTHETIC_CITATION_MULTIPLIER + (k + 1) * SYNTHETIC_CITATION_INCREMENT)
+            % SYNTHETIC_WORK_ID_SPACE for k in range(synthetic_reference_count(work_number))]
+
+
+def synthetic_citing_works(work_number: int):
+    """
+    :param work_number: number of a synthetic work
+    :return: list of the numbers of the works that cite it, see synthetic_references()
+    """
+    inverse_multiplier = pow(SYNTHETIC_CITATION_MULTIPLIER, -1, SYNTHETIC_WORK_ID_SPACE)
+    citing_list = []
+    for k in range(SYNTHETIC_MAX_REFERENCES):
+        citing_number = ((work_number - (k + 1) * SYNTHETIC_CITATION_INCREMENT) * inverse_multiplier
+                         % SYNTHETIC_WORK_ID_SPACE)
+        if k < synthetic_reference_count(citing_number):
+            citing_list.append(citing_number)
+    return citing_list
+
+
+def synthetic_work_number(doi: str):
+    """
+    :param doi: normalized DOI
+    :return: number of the synthetic work served for the DOI
+    """
+    return stable_hash(doi) % SYNTHETIC_WORK_ID_SPACE
+
+
+def create_synthetic_work(doi: str, work_number: int = None):
+    """
+    Creates a deterministic Work object for a DOI with the fields used by the app. Category values follow a skewed
+    distribution so that frequency tables look like those of real bibliographies.
+
+    :param doi: normalized DOI
+    :param work_number: number of the work's OpenAlex ID, by default derived from the DOI
+    :return: Work object
+    """
+    if work_number is None:
+        work_number = synthetic_work_number(doi)
+    generator = random.Random(stable_hash(doi))
+
+    def skewed(count: int):
+        return min(count - 1, int(generator.paretovariate(1.2)) - 1)
+
+    venue = skewed(SYNTHETIC_VENUE_COUNT)
+    topic = skewed(SYNTHETIC_TOPIC_COUNT)
+    return {"id": f"https://openalex.org/W{work_number}",
+            "doi": f"https://doi.org/{doi}",
+            "type": generator.choices(["article", "book-chapter", "review", "preprint", None], [70, 10, 10, 8, 2])[0],
+            "publication_year": None if generator.random() < 0.01 else generator.randint(1990, 2025),
+            "primary_location": {"source": None} if generator.random() < 0.1 else {"source": {
+                "id": f"https://openalex.org/S{venue}",
+                "display_name": f"Journal of Synthetic Studies {venue}",
+                "issn_l": f"{venue:04d}-0000",
+                "type": "conference" if venue % 5 == 0 else "journal"}},
+            "authorships": [{"author_position": "first" if position == 0 else "middle",
+                             "author": {"id": f"https://openalex.org/A{author}", "display_name": f"Author {author}"},
+                             "institutions": [{"id": f"https://openalex.org/I{author % SYNTHETIC_INSTITUTION_COUNT}",
+                                               "display_name": f"Institution {author % SYNTHETIC_INSTITUTION_COUNT}"}]}
+                            for position, author in enumerate(skewed(SYNTHETIC_AUTHOR_COUNT)
+                                                              for _ in range(generator.randint(1, 6)))],
+            "concepts": [{"id": f"https://openalex.org/C{concept}", "display_name": f"Concept {concept}",
+                          "level": concept % 4, "score": round(generator.random(), 3)}
+                         for concept in {skewed(SYNTHETIC_CONCEPT_COUNT) for _ in range(generator.randint(0, 8))}],
+            "keywords": [{"id": f"https://openalex.org/keywords/keyword-{keyword}",
+                          "display_name": f"Keyword {keyword}",
+                          "score": round(generator.random(), 3)}
+                         for keyword in {skewed(SYNTHETIC_KEYWORD_COUNT) for _ in range(generator.randint(0, 4))}],
+            "topics": [{"id": f"https://openalex.org/T{topic}", "display_name": f"Topic {topic}",
+                        "score": round(generator.random(), 3),
+                        "subfield": {"id": f"https://openalex.org/subfields/{topic % 40}",
+                                     "display_name": f"Subfield {topic % 40}"},
+                        "field": {"id": f"https://openalex.org/fields/{topic % 12}",
+                                  "display_name": f"Field {topic % 12}"},
+                        "domain": {"id": f"https://openalex.org/domains/{topic % 4}",
+                                   "display_name": f"Domain {topic % 4}"}}],
+            "referenced_works": [f"https://openalex.org/W{number}" for number in synthetic_references(work_number)]}
+
+
+def load_fixtures(path: str = FIXTURES_PATH):
+    """
+    Reads recorded Work objects, see record_fixtures().
+
+    :param path: JSON Lines file with one Work object per line
+    :return: list of Work objects, empty if the file does not exist
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def record_fixtures(input_filename: str, output_path: str = FIXTURES_PATH):
+    """
+    Fetches full Work objects for the DOIs in an input file from OpenAlex and writes them as fixtures.
+
+    :param input_filename: DOI file, see query_open_alex.iter_input_file()
+    :param output_path: JSON Lines file to write
+    :return: number of Work objects written
+    """
+    from query_open_alex import clean_input_list, iter_input_file, iter_query_open_alex
+
+    count = 0
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as file:
+        for work_list, _ in iter_query_open_alex(clean_input_list(iter_input_file(input_filename)),
+                                                 select_fields=None):
+            for _, result in work_list:
+                file.write(json.dumps(result, separators=(",", ":")) + "\n")
+                count += 1
+    return count
+
+
+class FakeOpenAlexServer:
+    """
+    Local stand-in for the OpenAlex works endpoint, answering "/works/{identifier}" and "/works?filter=doi:a|b",
+    "filter=openalex:W1|W2" and "filter=cites:W1|W2" (with "select", "per-page" and "cursor") requests. Recorded Work
+    fixtures are replayed with the requested DOI substituted, so any number of distinct DOIs can be served; without
+    fixtures, synthetic Work objects are generated. References between works follow a synthetic citation graph.
+
+    Latency, server errors and throttling (HTTP 429 with Retry-After) can be injected to measure the fetch engine under
+    realistic conditions. Request and injection counts are kept in statistics.
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 fixtures: list = None,
+                 latency: float = 0.0,
+                 latency_jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 throttle_rate: float = 0.0,
+                 retry_after: float = 1.0,
+                 seed: int = 0):
+        """
+        :param host: address to listen on
+        :param port: port to listen on; 0 picks a free port
+        :param fixtures: list of Work objects to replay, or None to load FIXTURES_PATH if it exists
+        :param latency: seconds added to every response
+        :param latency_jitter: maximum random seconds added on top of latency
+        :param error_rate: fraction of requests answered with HTTP 500
+        :param throttle_rate: fraction of requests answered with HTTP 429
+        :param retry_after: Retry-After header value in seconds sent with HTTP 429 responses
+        :param seed: seed of the random number generator used for injection
+        """
+        self.fixtures = fixtures if fixtures is not None else load_fixtures()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.statistics = {"requests": 0, "errors": 0, "throttled": 0, "works": 0, "bytes": 0}
+        self.server = ThreadingHTTPServer((host, port), self.create_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        :return: works endpoint URL, to be used as query_open_alex.OPEN_ALEX_WORKS_URL
+        """
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/works"
+
+    def work(self, doi: str, work_number: int = None):
+        """
+        :param doi: normalized DOI
+        :param work_number: number of the work's OpenAlex ID, by default derived from the DOI
+        :return: Work object served for the DOI. References follow the synthetic citation graph, see
+        synthetic_references().
+        """
+        if work_number is None:
+            work_number = synthetic_work_number(doi)
+        if not self.fixtures:
+            return create_synthetic_work(doi, work_number)
+        fixture = self.fixtures[stable_hash(doi) % len(self.fixtures)]
+        return {**fixture,
+                "id": f"https://openalex.org/W{work_number}",
+                "doi": f"https://doi.org/{doi}",
+                "referenced_works": [f"https://openalex.org/W{number}" for number in synthetic_references(work_number)]}
+
+    def work_by_number(self, work_number: int):
+        """
+        :param work_number: number of an OpenAlex work ID "W<number>"
+        :return: Work object served for the ID, with a synthetic DOI
+        """
+        return self.work(f"10.9999/w{work_number}", work_number)
+
+    def create_handler(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body, headers: dict = None):
+                data = json.dumps(body, separators=(",", ":")).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with fake_server.lock:
+                    fake_server.statistics["bytes"] += len(data)
+
+            def do_GET(self):
+                with fake_server.lock:
+                    fake_server.statistics["requests"] += 1
+                    draw = fake_server.random.random()
+                    delay = fake_server.latency + fake_server.random.random() * fake_server.latency_jitter
+                if delay > 0:
+                    time.sleep(delay)
+                if draw < fake_server.throttle_rate:
+                    with fake_server.lock:
+                        fake_server.statistics["throttled"] += 1
+                    self.send_json(429, {"error": "Too Many Requests"}, {"Retry-After": str(fake_server.retry_after)})
+                    return
+                if draw < fake_server.throttle_rate + fake_server.error_rate:
+                    with fake_server.lock:
+                        fake_server.statistics["errors"] += 1
+                    self.send_json(500, {"error": "Internal Server Error"})
+                    return
+
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                select_fields = query["select"][0].split(",") if "select" in query else None
+
+                def project(work: dict):
+                    if select_fields is None:
+                        return work
+                    return {field: work.get(field) for field in select_fields}
+
+                if url.path.startswith("/works/"):
+                    doi = normalize_fake_doi(unquote(url.path[len("/works/"):]))
+                    if doi is None or MISSING_DOI_MARKER in doi:
+                        self.send_json(404, {"error": "Not Found"})
+                        return
+                    with fake_server.lock:
+                        fake_server.statistics["works"] += 1
+                    self.send_json(200, project(fake_server.work(doi)))
+                elif url.path == "/works":
+                    filter_name, _, filter_value = query.get("filter", [""])[0].partition(":")
+                    if filter_name == "doi":
+                        key_list = [doi for doi in (normalize_fake_doi(value) for value in filter_value.split("|"))
+                                    if doi is not None and MISSING_DOI_MARKER not in doi]
+                        create_work = fake_server.work
+                    elif filter_name in ("openalex", "ids.openalex", "cites"):
+                        number_list = [int(value.rsplit("/", 1)[-1].lstrip("Ww")) for value in filter_value.split("|")
+                                       if value.rsplit("/", 1)[-1].lstrip("Ww").isdigit()]
+                        if filter_name == "cites":
+                            number_list = [citing_number for number in number_list
+                                           for citing_number in synthetic_citing_works(number)]
+                        key_list = number_list
+                        create_work = fake_server.work_by_number
+                    else:
+                        self.send_json(400, {"error": "Only doi, openalex and cites filters are supported."})
+                        return
+                    per_page = int(query.get("per-page", ["25"])[0])
+                    cursor = query.get("cursor", ["*"])[0]
+                    start = 0 if cursor == "*" else int(cursor)
+                    unique_key_list = list(dict.fromkeys(key_list))
+                    page_key_list = unique_key_list[start:start + per_page]
+                    next_start = start + len(page_key_list)
+                    with fake_server.lock:
+                        fake_server.statistics["works"] += len(page_key_list)
+                    self.send_json(200, {"meta": {"count": len(unique_key_list),
+                                                  "per_page": per_page,
+                                                  "next_cursor": str(next_start) if page_key_list else None},
+                                         "results": [project(create_work(key)) for key in page_key_list]})
+                else:
+                    self.send_json(404, {"error": "Not Found"})
+
+        return Handler
+
+    def start(self):
+        """
+        Serves requests on a background thread.
+
+        :return: the server
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-open-alex", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def normalize_fake_doi(identifier: str):
+    """
+    :param identifier: DOI in any of the formats accepted by OpenAlex
+    :return: lowercase DOI "10.XXXX/XXX", or None if the identifier is not a DOI
+    """
+    identifier = identifier.strip().lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "doi.org/", "doi:"):
+        if identifier.startswith(prefix):
+            identifier = identifier[len(prefix):]
+            break
+    return identifier if identifier.startswith("10.") else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a local stand-in for the OpenAlex works endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="maximum random extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 500 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of HTTP 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of HTTP 429 responses")
+    parser.add_argument("--fixtures", default=FIXTURES_PATH, help="JSON Lines file of Work objects to replay")
+    parser.add_argument("--record", metavar="DOI_FILE",
+                        help="fetch the Work objects of a DOI file from OpenAlex into --fixtures, then exit")
+    args = parser.parse_args()
+
+    if args.record:
+        print(f"Recorded {record_fixtures(args.record, args.fixtures)} Work objects to {args.fixtures}")
+        return
+    server = FakeOpenAlexServer(port=args.port,
+                                fixtures=load_fixtures(args.fixtures),
+                                latency=args.latency,
+                                latency_jitter=args.latency_jitter,
+                                error_rate=args.error_rate,
+                                throttle_rate=args.throttle_rate,
+                                retry_after=args.retry_after)
+    print(f"Serving {len(server.fixtures) or 'synthetic'} Work fixtures at {server.url}", file=sys.stderr)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET = 1.0  # Seconds allowed for "import app" in a fresh interpreter, the bulk of time to first byte.
+IMPORT_TIME_RUNS = 5
+LAZY_MODULES = ["numpy", "matplotlib", "requests", "markdown_it"]  # Must not be imported by "import app".
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEASURE_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start_time
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {lazy_modules!r} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module: str = "app"):
+    """
+    Imports a module in a fresh interpreter, as on a cold start of the app.
+
+    :param module: module to import
+    :return: dictionary of import seconds and the lazily imported modules that were loaded anyway
+    """
+    script = MEASURE_SCRIPT.format(module=module, lazy_modules=LAZY_MODULES)
+    completed_process = subprocess.run([sys.executable, "-c", script],
+                                       cwd=REPOSITORY_DIRECTORY, capture_output=True, text=True, check=True)
+    return json.loads(completed_process.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str = "app", count: int = 10):
+    """
+    :param module: module to import
+    :param count: number of modules to report
+    :return: list of (cumulative microseconds, module name) of the slowest imports, from python -X importtime
+    """
+    completed_process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                       cwd=REPOSITORY_DIRECTORY, capture_output=True, text=True, check=True)
+    import_list = []
+    for line in completed_process.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            import_list.append((int(fields[1]), fields[2].strip()))
+    return sorted(import_list, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the cold start import time of the app against a budget.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=IMPORT_TIME_RUNS)
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET, help="maximum median seconds")
+    parser.add_argument("--output", help="JSON file to write")
+    args = parser.parse_args()
+
+    measure_import(args.module)  # Warms the file system cache and the page cache, see static_pages.py.
+    run_list = [measure_import(args.module) for _ in range(args.runs)]
+    median_seconds = statistics.median(run["seconds"] for run in run_list)
+    loaded_module_list = sorted({name for run in run_list for name in run["loaded"]})
+    slowest_import_list = slowest_imports(args.module)
+    import_time_results = {"module": args.module,
+                           "median_seconds": median_seconds,
+                           "runs": [run["seconds"] for run in run_list],
+                           "budget_seconds": args.budget,
+                           "within_budget": median_seconds <= args.budget and not loaded_module_list,
+                           "eagerly_loaded_modules": loaded_module_list,
+                           "slowest_imports": [{"module": name, "microseconds": microseconds}
+                                               for microseconds, name in slowest_import_list]}
+
+    print(f"import {args.module}: {median_seconds:.3f} s median of {args.runs} runs (budget {args.budget:.3f} s)")
+    for microseconds, name in slowest_import_list[:5]:
+        print(f"  {microseconds / 1e6:.3f} s  {name}")
+    if loaded_module_list:
+        print(f"Modules that should be imported lazily were loaded: {', '.join(loaded_module_list)}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(import_time_results, file, indent=2)
+    sys.exit(0 if import_time_results["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+
+import query_open_alex
+from benchmarks.fake_open_alex import FakeOpenAlexServer, MISSING_DOI_MARKER, load_fixtures, FIXTURES_PATH
+from fetch_engine import FetchEngine, FETCH_MAX_WORKERS, REQUESTS_PER_SECOND
+from query_open_alex import clean_input_list, query_open_alex as run_query_open_alex
+from work_aggregates import aggregate_works
+
+BENCHMARK_SIZES = [100, 1000, 10000, 100000]
+BENCHMARK_RESULTS_PATH = "benchmark_results.json"
+DUPLICATE_FRACTION = 0.05  # Share of input lines that repeat an earlier DOI in another format.
+MISSING_FRACTION = 0.01  # Share of DOIs the fake server does not know.
+PLOT_FUNCTIONS = {
+    "create_type_frequency_plot": lambda work_aggregates: query_open_alex.create_type_frequency_plot(
+        work_aggregates)[:2],
+    "create_year_frequency_plot": lambda work_aggregates: query_open_alex.create_year_frequency_plot(
+        work_aggregates)[:1],
+    "create_primary_location_frequency_plot": lambda work_aggregates:
+        query_open_alex.create_primary_location_frequency_plot(work_aggregates)[:1],
+    "create_keyword_frequency_plot": lambda work_aggregates: query_open_alex.create_keyword_frequency_plot(
+        work_aggregates)[:1],
+    "create_concepts_frequency_plot": lambda work_aggregates: query_open_alex.create_concepts_frequency_plot(
+        work_aggregates)[:1],
+}
+
+
+def create_input_list(size: int, seed: int = 0):
+    """
+    Creates raw input lines as found in DOI files: mixed DOI prefixes and letter case, blank lines, duplicates and DOIs
+    unknown to the fake server.
+
+    :param size: number of distinct DOIs
+    :param seed: random seed
+    :return: list of input lines
+    """
+    generator = random.Random(seed)
+    prefixes = ["", "https://doi.org/", "doi:", "http://dx.doi.org/"]
+    input_list = []
+    for i in range(size):
+        marker = MISSING_DOI_MARKER if generator.random() < MISSING_FRACTION else "bench"
+        doi = f"10.{1000 + i % 9000}/{marker}.{seed}.{i}"
+        input_list.append(generator.choice(prefixes) + doi)
+        if generator.random() < DUPLICATE_FRACTION:
+            input_list.append(generator.choice(prefixes) + doi.upper())
+        if generator.random() < 0.02:
+            input_list.append("")
+    return input_list
+
+
+def timed(function, *args, **kwargs):
+    """
+    :param function: function to time
+    :return: result of the function and elapsed seconds
+    """
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def summarize_timings(timing_list: list):
+    """
+    :param timing_list: seconds of each repeat
+    :return: dictionary of min, median and max seconds and the raw timings
+    """
+    return {"min": min(timing_list),
+            "median": statistics.median(timing_list),
+            "max": max(timing_list),
+            "runs": timing_list}
+
+
+def benchmark_size(size: int, args):
+    """
+    Times cleaning, querying, aggregation and every plot for one input size.
+
+    :param size: number of distinct DOIs
+    :param args: parsed command line arguments
+    :return: dictionary of timings and query counts
+    """
+    timings = {}
+    input_list = create_input_list(size)
+    clean_timings = []
+    for _ in range(args.repeat):
+        cleaned_input_list, seconds = timed(clean_input_list, input_list)
+        clean_timings.append(seconds)
+    timings["clean_input_list"] = summarize_timings(clean_timings)
+
+    query_timings = []
+    query_counts = Counter()
+    for _ in range(args.repeat):
+        engine_statistics = Counter()
+        engine = FetchEngine(max_workers=args.max_workers,
+                             requests_per_second=args.requests_per_second,
+                             statistics=engine_statistics)
+        try:
+            (work_store, identifier_with_error_list), seconds = timed(run_query_open_alex, cleaned_input_list,
+                                                                      engine=engine)
+        finally:
+            engine.close()
+        query_timings.append(seconds)
+        query_counts = engine_statistics
+    timings["query_open_alex"] = summarize_timings(query_timings)
+
+    aggregate_timings = []
+    for _ in range(args.repeat):
+        work_aggregates, seconds = timed(aggregate_works, work_store.copy())
+        aggregate_timings.append(seconds)
+    timings["aggregate_works"] = summarize_timings(aggregate_timings)
+
+    for name, create_figures in PLOT_FUNCTIONS.items():
+        plot_timings = []
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            figures = create_figures(work_aggregates)
+            for figure in figures:
+                figure.canvas.draw()
+            plot_timings.append(time.perf_counter() - start_time)
+            for figure in figures:
+                plt.close(figure)
+        timings[name] = summarize_timings(plot_timings)
+
+    query_median = timings["query_open_alex"]["median"]
+    return {"size": size,
+            "input_lines": len(input_list),
+            "cleaned_dois": len(cleaned_input_list),
+            "works": len(work_store),
+            "errors": len(identifier_with_error_list),
+            "requests": query_counts["requests"],
+            "retries": query_counts["retries"],
+            "throttled": query_counts["throttled"],
+            "dois_per_second": len(cleaned_input_list) / query_median if query_median else None,
+            "timings": timings}
+
+
+def git_commit():
+    """
+    :return: hash of the checked out commit, or None if it cannot be determined
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the Computable Bibliography pipeline against a local "
+                                                 "stand-in for OpenAlex and writes the timings as JSON.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCHMARK_SIZES, help="numbers of DOIs")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per measurement")
+    parser.add_argument("--output", default=BENCHMARK_RESULTS_PATH, help="JSON file to write")
+    parser.add_argument("--fixtures", default=FIXTURES_PATH, help="JSON Lines file of Work objects to replay")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--latency-jitter", type=float, default=0.05, help="maximum random extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 500 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of HTTP 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of HTTP 429 responses")
+    parser.add_argument("--max-workers", type=int, default=FETCH_MAX_WORKERS)
+    parser.add_argument("--requests-per-second", type=float, default=REQUESTS_PER_SECOND)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    server = FakeOpenAlexServer(fixtures=fixtures,
+                                latency=args.latency,
+                                latency_jitter=args.latency_jitter,
+                                error_rate=args.error_rate,
+                                throttle_rate=args.throttle_rate,
+                                retry_after=args.retry_after)
+    result_list = []
+    with server:
+        query_open_alex.OPEN_ALEX_WORKS_URL = server.url
+        for size in args.sizes:
+            print(f"Benchmarking {size} DOIs...", file=sys.stderr)
+            result = benchmark_size(size, args)
+            print(f"  query: {result['timings']['query_open_alex']['median']:.2f} s "
+                  f"({result['dois_per_second']:.0f} DOIs/s, {result['requests']} requests), "
+                  f"aggregate: {result['timings']['aggregate_works']['median']:.3f} s", file=sys.stderr)
+            result_list.append(result)
+
+    benchmark_results = {"commit": git_commit(),
+                         "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                         "python": platform.python_version(),
+                         "platform": platform.platform(),
+                         "config": {**vars(args), "fixture_count": len(fixtures)},
+                         "server": server.statistics,
+                         "results": result_list}
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(benchmark_results, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import argparse
+import csv
+import json
+import os
+import weakref
+
+from query_open_alex import CHART_MAX_HEIGHT, CHART_MAX_WIDTH, clean_input_list, iter_input_file, query_open_alex
+from work_aggregates import column_array, display_labels, split_type_codes
+from work_cache import WorkCache
+from work_store import WorkStore, NONE_CODE
+
+COMPARISON_ATTRIBUTES = ["type", "year", "primary_location", "keyword", "concepts"]
+COMPARISON_ATTRIBUTE_NAMES = {"type": "Item types", "year": "Publication years", "primary_location": "Venues",
+                              "keyword": "Keywords", "concepts": "Concepts"}
+COMPARISON_TOP_CATEGORIES = 25  # Categories drawn per attribute chart, the most frequent over all lists.
+COMPARISON_ANNOTATE_MAX_CELLS = 400  # Heatmap cells are labelled with their count only up to this many cells.
+
+comparison_tables_memo = weakref.WeakKeyDictionary()
+
+
+class BibliographyComparison:
+    """
+    Comparison of several DOI lists queried together, built by build_comparison(). The works of all lists are in one
+    WorkStore, and membership is a work x list boolean bitmap: membership[row, j] is True if work row is in list j.
+    Overlaps and per-list frequency tables are computed from the bitmap with array operations.
+    """
+
+    def __init__(self):
+        self.list_names = []
+        self.work_store = None
+        self.membership = None
+        self.doi_counts = []
+
+    def __len__(self):
+        return len(self.list_names)
+
+
+def unique_list_names(name_list: list):
+    """
+    :param name_list: list names, e.g. file names, possibly repeated
+    :return: list of the names without extension, made unique with a "-2", "-3"... suffix
+    """
+    unique_name_list = []
+    used_names = set()
+    for name in name_list:
+        name = os.path.splitext(os.path.basename(name))[0] or "bibliography"
+        unique_name = name
+        suffix = 2
+        while unique_name in used_names:
+            unique_name = f"{name}-{suffix}"
+            suffix += 1
+        used_names.add(unique_name)
+        unique_name_list.append(unique_name)
+    return unique_name_list
+
+
+def union_input_list(cleaned_input_lists: dict):
+    """
+    :param cleaned_input_lists: dictionary of list name to cleaned input list, see clean_input_list()
+    :return: cleaned input list of the identifiers of all lists, each once, to query them together
+    """
+    return clean_input_list(identifier for cleaned_input_list in cleaned_input_lists.values()
+                            for identifier in cleaned_input_list)
+
+
+def build_comparison(work_store: WorkStore, cleaned_input_lists: dict):
+    """
+    Builds the work x list membership bitmap of several lists whose union was queried into one WorkStore, e.g. with
+    query_open_alex(union_input_list(cleaned_input_lists)).
+
+    :param work_store: WorkStore of the works of all lists
+    :param cleaned_input_lists: dictionary of list name to cleaned input list, in display order
+    :return: BibliographyComparison
+    """
+    import numpy as np
+
+    comparison = BibliographyComparison()
+    comparison.list_names = list(cleaned_input_lists)
+    comparison.work_store = work_store
+    comparison.membership = np.zeros((len(work_store), len(cleaned_input_lists)), dtype=bool)
+    rows = work_store.rows
+    for j, cleaned_input_list in enumerate(cleaned_input_lists.values()):
+        list_rows = np.fromiter((rows.get(identifier, -1) for identifier in cleaned_input_list), dtype=np.int64,
+                                count=len(cleaned_input_list))
+        comparison.membership[list_rows[list_rows >= 0], j] = True
+        comparison.doi_counts.append(len(cleaned_input_list))
+    return comparison
+
+
+def overlap_matrix(comparison: BibliographyComparison):
+    """
+    :param comparison: BibliographyComparison from build_comparison()
+    :return: list x list array of the number of works in both lists; the diagonal holds the works of each list
+    """
+    import numpy as np
+
+    membership = comparison.membership.astype(np.float32)  # BLAS matrix product; exact for counts below 2 ** 24.
+    return np.rint(membership.T @ membership).astype(np.int64)
+
+
+def jaccard_matrix(comparison: BibliographyComparison):
+    """
+    :param comparison: BibliographyComparison from build_comparison()
+    :return: list x list array of Jaccard similarities (shared works / works in either list); 0 for two empty lists
+    """
+    import numpy as np
+
+    overlaps = overlap_matrix(comparison)
+    sizes = np.diag(overlaps)
+    unions = sizes[:, None] + sizes[None, :] - overlaps
+    return np.divide(overlaps, unions, out=np.zeros(overlaps.shape), where=unions > 0)
+
+
+def comparison_tables(comparison: BibliographyComparison):
+    """
+    Counts every attribute of COMPARISON_ATTRIBUTES per list at once. Each (work, list) membership pair is expanded
+    into the work's category codes and counted with a single np.bincount over code * list count + list, so the cost
+    is proportional to the number of memberships, whatever the number of lists. Item types are split like
+    aggregate_works() does. Venues, keywords and concepts are counted by canonical key, like aggregate_works() does;
+    the labels are their display names. The result is memoized per comparison.
+
+    :param comparison: BibliographyComparison from build_comparison()
+    :return: dictionary of attribute to (list of category keys, list of category labels, category x list array of
+    counts)
+    """
+    import numpy as np
+
+    memoized = comparison_tables_memo.get(comparison)
+    if memoized is not None:
+        return memoized
+
+    work_store = comparison.work_store
+    list_count = len(comparison)
+    pair_rows, pair_lists = np.nonzero(comparison.membership)
+    type_codes, type_labels = split_type_codes(work_store,
+                                               column_array(work_store.type_codes, np.intc),
+                                               column_array(work_store.venue_codes, np.intc),
+                                               column_array(work_store.venue_type_codes, np.intc))
+    single_columns = {"type": (type_codes, type_labels, type_labels),
+                      "year": (column_array(work_store.year_codes, np.intc), work_store.year_index.keys,
+                               work_store.year_index.labels),
+                      "primary_location": (column_array(work_store.venue_codes, np.intc), work_store.venue_index.keys,
+                                           work_store.venue_index.labels)}
+    multiple_columns = {"keyword": (work_store.keyword_codes, work_store.keyword_offsets,
+                                    work_store.keyword_index.keys, work_store.keyword_index.labels),
+                        "concepts": (work_store.concept_codes, work_store.concept_offsets,
+                                     work_store.concept_index.keys, work_store.concept_index.labels)}
+
+    def count_pairs(codes: "numpy.ndarray", lists: "numpy.ndarray", keys: list, labels: list):
+        keep = codes != NONE_CODE
+        counts = np.bincount(codes[keep].astype(np.int64) * list_count + lists[keep],
+                             minlength=len(keys) * list_count)
+        return list(keys), list(labels), counts.reshape(len(keys), list_count)
+
+    tables = {}
+    for attribute, (codes, keys, labels) in single_columns.items():
+        tables[attribute] = count_pairs(codes[pair_rows], pair_lists, keys, labels)
+    for attribute, (codes, offsets, keys, labels) in multiple_columns.items():
+        codes = column_array(codes, np.intc)
+        offsets = column_array(offsets, np.int64)
+        lengths = offsets[pair_rows + 1] - offsets[pair_rows]
+        pair_offsets = np.zeros(len(pair_rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=pair_offsets[1:])
+        # Position of every code of every pair in the flat code column, as in WorkStore.subset().
+        positions = (np.repeat(offsets[pair_rows] - pair_offsets[:-1], lengths)
+                     + np.arange(pair_offsets[-1], dtype=np.int64))
+        tables[attribute] = count_pairs(codes[positions], np.repeat(pair_lists, lengths), keys, labels)
+
+    comparison_tables_memo[comparison] = tables
+    return tables
+
+
+def list_frequency(comparison: BibliographyComparison, attribute: str, list_index: int):
+    """
+    :param comparison: BibliographyComparison from build_comparison()
+    :param attribute: attribute of COMPARISON_ATTRIBUTES
+    :param list_index: position of the list in comparison.list_names
+    :return: dictionary of category key to frequency in the list, for categories that occur, most frequent first (see
+    comparison_names() for the display names of the keys)
+    """
+    import numpy as np
+
+    keys, labels, counts = comparison_tables(comparison)[attribute]
+    list_counts = counts[:, list_index]
+    frequency = sorted(((keys[code], labels[code], int(list_counts[code])) for code in np.flatnonzero(list_counts)),
+                       key=lambda x: (-x[2], str(x[1]), str(x[0])))
+    return {key: count for key, label, count in frequency}
+
+
+def comparison_names(comparison: BibliographyComparison, attribute: str):
+    """
+    :param comparison: BibliographyComparison from build_comparison()
+    :param attribute: attribute of COMPARISON_ATTRIBUTES
+    :return: dictionary of category key to display name
+    """
+    keys, labels, counts = comparison_tables(comparison)[attribute]
+    return dict(zip(keys, labels))
+
+
+def top_comparison_categories(comparison: BibliographyComparison, attribute: str, top_count: int):
+    """
+    :param comparison: BibliographyComparison from build_comparison()
+    :param attribute: attribute of COMPARISON_ATTRIBUTES
+    :param top_count: number of categories
+    :return: keys and display labels of the categories with the most works over all lists and their category x list
+    counts, most frequent first
+    """
+    import numpy as np
+
+    keys, labels, counts = comparison_tables(comparison)[attribute]
+    totals = counts.sum(axis=1)
+    top_codes = np.argsort(-totals, kind="stable")[:top_count]
+    top_codes = top_codes[totals[top_codes] > 0]
+    return [keys[code] for code in top_codes], [labels[code] for code in top_codes], counts[top_codes]
+
+
+def create_overlap_plot(comparison: BibliographyComparison):
+    """
+    Creates a heatmap of the pairwise Jaccard similarity of the lists, labelled with the number of shared works.
+
+    :param comparison: BibliographyComparison from build_comparison()
+    :return: figure
+    """
+    import matplotlib.pyplot as plt
+
+    overlaps = overlap_matrix(comparison)
+    similarities = jaccard_matrix(comparison)
+    list_count = len(comparison)
+    size = min(CHART_MAX_WIDTH, max(5.0, 2.0 + 0.45 * list_count))
+    figure, axes = plt.subplots(figsize=(size + 1.5, size), layout="tight")
+    image = axes.imshow(similarities, cmap="viridis", vmin=0.0, vmax=1.0)
+    figure.colorbar(image, ax=axes, label="Jaccard similarity")
+    axes.set_xticks(range(list_count), comparison.list_names, rotation=90, fontsize="small")
+    axes.set_yticks(range(list_count), comparison.list_names, fontsize="small")
+    if list_count * list_count <= COMPARISON_ANNOTATE_MAX_CELLS:
+        for i in range(list_count):
+            for j in range(list_count):
+                axes.text(j, i, f"{overlaps[i, j]}", ha="center", va="center", fontsize="x-small",
+                          color="black" if similarities[i, j] > 0.6 else "white")
+    axes.set_title("Overlap between lists\n(shared works, colored by Jaccard similarity)")
+    return figure
+
+
+def create_comparison_frequency_plot(comparison: BibliographyComparison,
+                                     attribute: str,
+                                     top_count: int = COMPARISON_TOP_CATEGORIES):
+    """
+    Creates a side-by-side chart of one attribute for every list: a heatmap with one column per list and one row per
+    category (the most frequent over all lists), colored by the share of the list's works in the category.
+
+    :param comparison: BibliographyComparison from build_comparison()
+    :param attribute: attribute of COMPARISON_ATTRIBUTES
+    :param top_count: number of categories drawn
+    :return: figure
+    """
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    keys, labels, counts = top_comparison_categories(comparison, attribute, top_count)
+    labels = display_labels(keys, dict(zip(keys, labels)))
+    list_sizes = comparison.membership.sum(axis=0)
+    shares = counts / np.maximum(list_sizes, 1)[None, :]
+    list_count = len(comparison)
+    width = min(CHART_MAX_WIDTH, max(6.0, 4.0 + 0.5 * list_count))
+    height = min(CHART_MAX_HEIGHT, max(4.0, 1.5 + 0.3 * len(labels)))
+    figure, axes = plt.subplots(figsize=(width, height), layout="tight")
+    image = axes.imshow(shares, cmap="Blues", aspect="auto", vmin=0.0)
+    figure.colorbar(image, ax=axes, label="Share of the list's works")
+    axes.set_xticks(range(list_count), [f"{name}\n({size})" for name, size in zip(comparison.list_names, list_sizes)],
+                    rotation=90, fontsize="small")
+    axes.set_yticks(range(len(labels)), [str(label).replace("\n", " ") for label in labels], fontsize="x-small")
+    if shares.size <= COMPARISON_ANNOTATE_MAX_CELLS:
+        for i in range(len(labels)):
+            for j in range(list_count):
+                axes.text(j, i, f"{counts[i, j]}", ha="center", va="center", fontsize="x-small",
+                          color="white" if shares[i, j] > 0.6 * max(shares.max(), 1e-9) else "black")
+    axes.set_title(f"{COMPARISON_ATTRIBUTE_NAMES[attribute]} by list\n"
+                   f"({len(labels)} most frequent over all lists; works per list in parentheses)")
+    return figure
+
+
+def write_matrix(path: str, list_names: list, matrix):
+    """
+    Writes a list x list matrix as CSV with the list names as header row and first column.
+
+    :param path: CSV file to write
+    :param list_names: names of the lists
+    :param matrix: list x list array
+    :return: None
+    """
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow([""] + list_names)
+        writer.writerows([name] + [round(float(value), 6) if matrix.dtype.kind == "f" else int(value)
+                                   for value in row]
+                         for name, row in zip(list_names, matrix))
+
+
+def main():
+    os.environ.setdefault("MPLBACKEND", "Agg")  # Charts are only written to files.
+    import matplotlib.pyplot as plt
+
+    from instrumentation import RunMetrics
+
+    parser = argparse.ArgumentParser(description="Compares several DOI files: their overlap and their frequency "
+                                                 "tables side by side.")
+    parser.add_argument("filenames", nargs="+", help="DOI files, at least two")
+    parser.add_argument("-o", "--output-directory", default="comparison")
+    parser.add_argument("--format", choices=["text", "csv", "ris", "bibtex"], default=None,
+                        help="input file format; guessed from each file's extension by default")
+    parser.add_argument("--image-format", choices=["png", "svg", "pdf"], default="png")
+    args = parser.parse_args()
+
+    run_metrics = RunMetrics()
+    with run_metrics.stage("read"):
+        input_lists = [list(iter_input_file(filename, args.format)) for filename in args.filenames]
+    with run_metrics.stage("clean"):
+        cleaned_input_lists = dict(zip(unique_list_names(args.filenames), map(clean_input_list, input_lists)))
+        union_list = union_input_list(cleaned_input_lists)
+    print(f"{len(union_list)} distinct DOIs in {len(cleaned_input_lists)} files.")
+    with run_metrics.stage("fetch"):
+        work_store, identifier_with_error_list = query_open_alex(union_list, cache=WorkCache(),
+                                                                 statistics=run_metrics)
+    with run_metrics.stage("aggregate"):
+        comparison = build_comparison(work_store, cleaned_input_lists)
+        overlaps = overlap_matrix(comparison)
+        similarities = jaccard_matrix(comparison)
+        tables = {attribute: {name: list_frequency(comparison, attribute, j)
+                              for j, name in enumerate(comparison.list_names)}
+                  for attribute in COMPARISON_ATTRIBUTES}
+        names = {attribute: comparison_names(comparison, attribute) for attribute in COMPARISON_ATTRIBUTES}
+
+    os.makedirs(args.output_directory, exist_ok=True)
+    write_matrix(os.path.join(args.output_directory, "overlap.csv"), comparison.list_names, overlaps)
+    write_matrix(os.path.join(args.output_directory, "jaccard.csv"), comparison.list_names, similarities)
+    with open(os.path.join(args.output_directory, "frequency_tables.json"), "w", encoding="utf-8") as file:
+        json.dump({attribute: {name: [{"label": names[attribute][key], "key": key, "count": count}
+                                      for key, count in table.items()]
+                               for name, table in list_tables.items()}
+                   for attribute, list_tables in tables.items()}, file, indent=2)
+    with run_metrics.stage("render"):
+        figures = {"overlap": create_overlap_plot(comparison)}
+        figures.update((f"{attribute}_by_list", create_comparison_frequency_plot(comparison, attribute))
+                       for attribute in COMPARISON_ATTRIBUTES)
+        for name, figure in figures.items():
+            figure.savefig(os.path.join(args.output_directory, f"{name}.{args.image_format}"))
+            plt.close(figure)
+    print(f"{len(work_store)} works, {len(identifier_with_error_list)} DOIs with errors; "
+          f"comparison written to {args.output_directory}.")
+    print()
+    print(run_metrics.summary_table())
+
+
+if __name__ == "__main__":
+    main()
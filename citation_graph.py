@@ -0,0 +1,292 @@
+import argparse
+import csv
+import json
+import os
+from array import array
+from collections import Counter
+
+from fetch_engine import FetchEngine
+from instrumentation import RunMetrics
+import query_open_alex
+from query_open_alex import (WORK_FIELDS, DOI_PAGE_SIZE, clean_input_list, iter_input_file, iter_query_open_alex,
+                             is_complete_work)
+from work_aggregates import aggregate_works
+from work_cache import WorkCache
+from work_store import CategoryIndex, WorkStore
+
+CITATION_BATCH_SIZE = 50  # OpenAlex IDs per "filter=openalex:..." or "filter=cites:..." request.
+CITATION_MAX_DEPTH = 1
+CITATION_MAX_NODES = 5000  # Works in the expanded set, including the seed works.
+CITATION_DIRECTIONS = ["references", "cited_by", "both"]
+EXPANSION_FIELDS = WORK_FIELDS + ["referenced_works"]
+OPEN_ALEX_ID_PREFIX = "https://openalex.org/"
+
+
+class CitationGraph:
+    """
+    Citation graph around a bibliography, built by expand_citation_graph(). Works are nodes interned as integer codes
+    by OpenAlex ID, in order of discovery; the seed works come first. Edges are stored as two code columns: work
+    edge_sources[i] cites work edge_targets[i]. The works themselves are kept in a WorkStore keyed by OpenAlex ID, so
+    the frequency tables and plots of the bibliography work unchanged on the expanded set.
+    """
+
+    def __init__(self):
+        self.node_index = CategoryIndex()
+        self.depths = array("b")
+        self.work_store = WorkStore()
+        self.edge_sources = array("i")
+        self.edge_targets = array("i")
+        self.seed_count = 0
+        self.identifier_with_error_list = []
+        self.failed_batch_count = 0
+        self.truncated = False
+
+    def __len__(self):
+        return len(self.node_index)
+
+
+def short_work_id(work_id: str):
+    """
+    :param work_id: OpenAlex work ID, e.g. "https://openalex.org/W2741809807"
+    :return: ID without the URL prefix, e.g. "W2741809807", as accepted by OpenAlex filters
+    """
+    return work_id[len(OPEN_ALEX_ID_PREFIX):] if work_id.startswith(OPEN_ALEX_ID_PREFIX) else work_id
+
+
+def fetch_filtered_works(engine: FetchEngine,
+                         filter_name: str,
+                         work_id_list: list,
+                         select_fields: list = EXPANSION_FIELDS,
+                         max_results: int = None,
+                         statistics: Counter = None):
+    """
+    Queries OpenAlex for the works matching one pipe-joined filter, e.g. "openalex:W1|W2" for the works with these IDs
+    or "cites:W1|W2" for the works citing them, paging through the results with a cursor.
+
+    :param engine: fetch engine used to send the requests
+    :param filter_name: "openalex" or "cites"
+    :param work_id_list: OpenAlex work IDs, at most CITATION_BATCH_SIZE
+    :param select_fields: list of Work object fields to request
+    :param max_results: stop paging once this many works have been received; None for all
+    :param statistics: counter of the run, see FetchEngine.get_json()
+    :return: list of Work objects; raises the request's exception if a page cannot be fetched
+    """
+    params = {"filter": f"{filter_name}:" + "|".join(short_work_id(work_id) for work_id in work_id_list),
+              "select": ",".join(select_fields)}
+    results = []
+    cursor = "*"
+    while cursor is not None and (max_results is None or len(results) < max_results):
+        # The last page only asks for the works still missing, so no more than max_results works are downloaded.
+        page_size = DOI_PAGE_SIZE if max_results is None else min(DOI_PAGE_SIZE, max_results - len(results))
+        page = engine.get_json(query_open_alex.OPEN_ALEX_WORKS_URL,
+                               params={**params, "per-page": page_size, "cursor": cursor}, statistics=statistics)
+        results.extend(page["results"])
+        cursor = page["meta"].get("next_cursor")
+        # The last page is recognized by the result count, saving the request for an empty page after it.
+        if not page["results"] or len(results) >= page["meta"].get("count", len(results) + 1):
+            cursor = None
+    return results if max_results is None else results[:max_results]
+
+
+def expand_citation_graph(cleaned_input_list: list,
+                          max_depth: int = CITATION_MAX_DEPTH,
+                          max_nodes: int = CITATION_MAX_NODES,
+                          direction: str = "both",
+                          engine: FetchEngine = None,
+                          cache: WorkCache = None,
+                          statistics: Counter = None):
+    """
+    Expands a bibliography into the citation graph around it, breadth-first. The seed works are queried like
+    query_open_alex() does (with "referenced_works"). Each level then follows the references of the previous level's
+    works and/or the works citing them ("cites" filter), fetching each frontier in batches of CITATION_BATCH_SIZE IDs
+    on the fetch engine. A visited set ensures no work is fetched twice. Batches that fail after the fetch engine's
+    retries are counted in failed_batch_count and left out.
+
+    The crawl stops after max_depth levels or once max_nodes works are in the graph. The budget also bounds fetching:
+    each level fetches at most the remaining budget. If the references of a frontier do not fit in it, the most
+    frequently cited works are kept first; the citing works may fetch the rest of the budget, split between the
+    frontier's batches. With both directions, the references get at most half of each level's budget.
+
+    :param cleaned_input_list: cleaned input list of DOIs, see clean_input_list()
+    :param max_depth: number of levels to expand beyond the seed works
+    :param max_nodes: maximum number of works in the graph
+    :param direction: "references" (works cited by the graph), "cited_by" (works citing it) or "both"
+    :param engine: shared fetch engine; if None, a fetch engine is created for the crawl and closed afterward
+    :param cache: persistent Work object cache for the seed works, or None
+    :param statistics: counter of the run, see FetchEngine.get_json()
+    :return: CitationGraph
+    """
+    graph = CitationGraph()
+    reference_lists = []
+    own_engine = engine is None
+    if own_engine:
+        engine = FetchEngine()
+
+    def fetch_task(task: tuple):
+        filter_name, work_id_list, max_results = task
+        try:
+            return fetch_filtered_works(engine, filter_name, work_id_list, max_results=max_results,
+                                        statistics=statistics)
+        except Exception:
+            return None  # Counted by the crawl's thread; the works of the batch are left out.
+
+    def add_node(result: dict, depth: int):
+        work_id = result.get("id")
+        if work_id is None or work_id in graph.node_index.codes or not is_complete_work(result):
+            return False
+        if len(graph.node_index) >= max_nodes:
+            graph.truncated = True
+            return False
+        graph.node_index.intern(work_id, work_id)
+        graph.depths.append(depth)
+        graph.work_store.add_work(work_id, result)
+        reference_lists.append(result.get("referenced_works") or [])
+        return True
+
+    try:
+        for work_list, error_list in iter_query_open_alex(cleaned_input_list, engine=engine, cache=cache,
+                                                          statistics=statistics, select_fields=EXPANSION_FIELDS):
+            graph.identifier_with_error_list.extend(error_list)
+            for _, result in work_list:
+                add_node(result, 0)
+        graph.seed_count = len(graph.node_index)
+
+        frontier_start = 0
+        for depth in range(1, max_depth + 1):
+            frontier_end = len(graph.node_index)
+            if frontier_start == frontier_end or len(graph.node_index) >= max_nodes:
+                break
+            frontier_id_list = graph.node_index.labels[frontier_start:frontier_end]
+            remaining = max_nodes - len(graph.node_index)
+            task_list = []
+            if direction in ("references", "both"):
+                reference_counts = Counter(work_id for reference_list in reference_lists[frontier_start:frontier_end]
+                                           for work_id in reference_list if work_id not in graph.node_index.codes)
+                reference_budget = remaining if direction == "references" else remaining - remaining // 2
+                if len(reference_counts) > reference_budget:
+                    graph.truncated = True
+                cited_id_list = [work_id for work_id, _ in reference_counts.most_common(reference_budget)]
+                remaining -= len(cited_id_list)
+                task_list.extend(("openalex", cited_id_list[i:i + CITATION_BATCH_SIZE], None)
+                                 for i in range(0, len(cited_id_list), CITATION_BATCH_SIZE))
+            if direction in ("cited_by", "both"):
+                batch_list = [frontier_id_list[i:i + CITATION_BATCH_SIZE]
+                              for i in range(0, len(frontier_id_list), CITATION_BATCH_SIZE)]
+                # Each batch fetches at most its share of the budget, so together they fetch at most the budget.
+                share_list = [remaining // len(batch_list) + (i < remaining % len(batch_list))
+                              for i in range(len(batch_list))]
+                task_list.extend(("cites", batch, share) for batch, share in zip(batch_list, share_list) if share > 0)
+                if remaining < len(batch_list):
+                    graph.truncated = True
+            for task, results in engine.map_unordered(fetch_task, task_list, max_in_flight=engine.max_workers):
+                if results is None:
+                    graph.failed_batch_count += 1
+                    continue
+                if task[2] is not None and len(results) >= task[2]:
+                    graph.truncated = True  # The batch used up its share; more works cite the frontier.
+                for result in results:
+                    add_node(result, depth)
+            frontier_start = frontier_end
+    finally:
+        if own_engine:
+            engine.close()
+
+    codes = graph.node_index.codes
+    for source, reference_list in enumerate(reference_lists):
+        for work_id in reference_list:
+            target = codes.get(work_id)
+            if target is not None:
+                graph.edge_sources.append(source)
+                graph.edge_targets.append(target)
+    return graph
+
+
+def write_edge_list(graph: CitationGraph, path: str):
+    """
+    Writes the edges as CSV with "source" and "target" columns of short OpenAlex IDs; source cites target.
+
+    :param graph: CitationGraph from expand_citation_graph()
+    :param path: CSV file to write
+    :return: number of edges written
+    """
+    labels = [short_work_id(work_id) for work_id in graph.node_index.labels]
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["source", "target"])
+        writer.writerows((labels[source], labels[target])
+                         for source, target in zip(graph.edge_sources, graph.edge_targets))
+    return len(graph.edge_sources)
+
+
+def write_node_list(graph: CitationGraph, path: str):
+    """
+    Writes the works as CSV with their short OpenAlex ID, crawl depth (0 for seed works), in-degree and out-degree
+    within the graph.
+
+    :param graph: CitationGraph from expand_citation_graph()
+    :param path: CSV file to write
+    :return: number of works written
+    """
+    in_degrees = Counter(graph.edge_targets)
+    out_degrees = Counter(graph.edge_sources)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "depth", "in_degree", "out_degree"])
+        writer.writerows((short_work_id(work_id), graph.depths[code], in_degrees[code], out_degrees[code])
+                         for code, work_id in enumerate(graph.node_index.labels))
+    return len(graph)
+
+
+def main():
+    from batch import CHART_FUNCTIONS, SUMMARY_FILENAME, bibliography_summary, render_chart
+
+    parser = argparse.ArgumentParser(description="Expands a DOI file into the citation graph around it and writes "
+                                                 "its edge list and charts.")
+    parser.add_argument("filename", help="DOI file")
+    parser.add_argument("-o", "--output-directory", default="citation-graph")
+    parser.add_argument("--depth", type=int, default=CITATION_MAX_DEPTH, help="levels to expand beyond the seeds")
+    parser.add_argument("--max-nodes", type=int, default=CITATION_MAX_NODES, help="maximum works in the graph")
+    parser.add_argument("--direction", choices=CITATION_DIRECTIONS, default="both")
+    parser.add_argument("--format", choices=["text", "csv", "ris", "bibtex"], default=None,
+                        help="input file format; guessed from the file extension by default")
+    parser.add_argument("--image-format", action="append", choices=["png", "svg", "pdf"], dest="image_formats",
+                        help="chart image format; may be repeated (default: png)")
+    args = parser.parse_args()
+
+    run_metrics = RunMetrics()
+    with run_metrics.stage("read"):
+        input_list = list(iter_input_file(args.filename, args.format))
+    with run_metrics.stage("clean"):
+        cleaned_input_list = clean_input_list(input_list)
+    with run_metrics.stage("fetch"):
+        graph = expand_citation_graph(cleaned_input_list, max_depth=args.depth, max_nodes=args.max_nodes,
+                                      direction=args.direction, cache=WorkCache(), statistics=run_metrics)
+    print(f"{len(graph)} works ({graph.seed_count} seeds) and {len(graph.edge_sources)} citations"
+          + (f"; stopped at the budget of {args.max_nodes} works" if graph.truncated else ""))
+
+    os.makedirs(args.output_directory, exist_ok=True)
+    write_edge_list(graph, os.path.join(args.output_directory, "edges.csv"))
+    write_node_list(graph, os.path.join(args.output_directory, "nodes.csv"))
+    with run_metrics.stage("aggregate"):
+        work_aggregates = aggregate_works(graph.work_store)
+    with run_metrics.stage("render"):
+        chart_files = {chart_name: render_chart(chart_name, work_aggregates,
+                                                os.path.join(args.output_directory, chart_name),
+                                                args.image_formats or ["png"])
+                       for chart_name in CHART_FUNCTIONS}
+    summary = bibliography_summary(args.filename, cleaned_input_list, work_aggregates,
+                                   graph.identifier_with_error_list, chart_files)
+    summary["citation_graph"] = {"works": len(graph),
+                                 "seed_works": graph.seed_count,
+                                 "citations": len(graph.edge_sources),
+                                 "works_per_depth": dict(Counter(graph.depths)),
+                                 "failed_batches": graph.failed_batch_count,
+                                 "truncated": graph.truncated}
+    with open(os.path.join(args.output_directory, SUMMARY_FILENAME), "w", encoding="utf-8") as file:
+        json.dump(summary, file, indent=2)
+    print()
+    print(run_metrics.summary_table())
+
+
+if __name__ == "__main__":
+    main()
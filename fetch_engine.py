@@ -0,0 +1,302 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+from instrumentation import RunMetrics
+
+FETCH_MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 10.0  # OpenAlex has a limit of max 10 requests per second.
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = 30.0  # Seconds before a single request is abandoned and retried.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Guards the counters of every statistics Counter updated by the fetch threads; "+=" on a Counter is not atomic.
+statistics_lock = threading.Lock()
+
+
+def count_events(statistics_list: list, **counts):
+    """
+    Adds event counts to several statistics counters at once, under statistics_lock.
+
+    :param statistics_list: list of Counters, e.g. the engine's statistics and the run's
+    :param counts: event name to number of events, e.g. requests=1
+    :return: None
+    """
+    with statistics_lock:
+        for statistics in statistics_list:
+            for name, count in counts.items():
+                statistics[name] += count
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that caps the request rate shared by every thread using it.
+    """
+
+    def __init__(self, rate: float = REQUESTS_PER_SECOND, capacity: float = None):
+        """
+        :param rate: tokens added per second, i.e. the sustained request rate
+        :param capacity: maximum number of tokens that can be saved up for a burst; defaults to one second of tokens
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available, then takes it.
+
+        :return: None
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1.0:
+                        self.tokens -= 1.0
+                        return
+                    wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Stops handing out tokens for the given number of seconds, e.g. after a Retry-After response header. Saved up
+        tokens are dropped so that requests resume at the sustained rate instead of in a burst.
+
+        :param seconds: pause length in seconds
+        :return: None
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of requests in flight, adjusting the limit with additive increase/multiplicative decrease
+    (AIMD): the limit grows by one after a full window of successful requests and is halved when the API throttles.
+    """
+
+    def __init__(self, max_limit: int = FETCH_MAX_WORKERS, min_limit: int = 1):
+        """
+        :param max_limit: maximum number of requests in flight, and the starting limit
+        :param min_limit: minimum number of requests in flight
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self.successes = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Blocks until fewer than limit requests are in flight, then takes a slot.
+
+        :return: None
+        """
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        """
+        Frees a slot and adjusts the limit.
+
+        :param throttled: True if the request was throttled (HTTP 429) by the API
+        :return: None
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                # Requests already in flight when the API starts throttling count as one congestion event.
+                if now - self.last_decrease > 1.0:
+                    self.limit = max(self.min_limit, self.limit // 2)
+                    self.last_decrease = now
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+def parse_retry_after(value: str, default: float = 1.0):
+    """
+    Parses a Retry-After response header given in seconds or as an HTTP date.
+
+    :param value: Retry-After header value, or None
+    :param default: seconds to wait if the header is missing or invalid
+    :return: seconds to wait
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class FetchEngine:
+    """
+    Concurrent HTTP fetch engine for the OpenAlex API. Requests run on a thread pool and share pooled keep-alive
+    connections, a token bucket that caps the global request rate and an AIMD concurrency limiter. Throttled (HTTP
+    429) and failed requests are retried after the Retry-After delay or with exponential backoff.
+
+    One engine can be shared by several queries, e.g. every session of the Shiny app, so the rate limit is global.
+    """
+
+    def __init__(self,
+                 max_workers: int = FETCH_MAX_WORKERS,
+                 requests_per_second: float = REQUESTS_PER_SECOND,
+                 max_retries: int = MAX_RETRIES,
+                 statistics: Counter = None):
+        """
+        :param max_workers: number of threads, and the maximum number of requests in flight
+        :param requests_per_second: global request rate cap
+        :param max_retries: number of retries for throttled or failed requests
+        :param statistics: counter updated with "requests", "retries", "throttled" and "bytes" counts; defaults to a
+        RunMetrics, which also records request latencies
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.statistics = statistics if statistics is not None else RunMetrics()
+        self.token_bucket = TokenBucket(requests_per_second)
+        self.concurrency_limiter = AdaptiveConcurrencyLimiter(self.max_workers)
+        self.session_lock = threading.Lock()
+        self._session = None
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="open-alex-fetch")
+
+    @property
+    def session(self):
+        """
+        Pooled keep-alive HTTP session, created on first use so that the HTTP stack is only imported when a request
+        is sent.
+
+        :return: requests.Session
+        """
+        with self.session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                self._session.mount("https://", adapter)
+                self._session.mount("http://", adapter)
+            return self._session
+
+    def get_json(self, url: str, params: dict = None, statistics: Counter = None):
+        """
+        Sends a rate limited GET request and decodes the JSON response, retrying throttled and failed requests.
+
+        :param url: request URL
+        :param params: query string parameters
+        :param statistics: counter of the run the request belongs to, updated like the engine's statistics. If it is
+        an instrumentation.RunMetrics, request latencies are added to its histogram.
+        :return: decoded JSON response. Raises requests.RequestException or ValueError if the request fails.
+        """
+        import requests
+
+        session = self.session
+        statistics_list = [self.statistics] if statistics is None else [self.statistics, statistics]
+        attempt = 0
+        while True:
+            self.concurrency_limiter.acquire()
+            throttled = False
+            try:
+                self.token_bucket.acquire()
+                count_events(statistics_list, requests=1)
+                start_time = time.perf_counter()
+                try:
+                    response = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+                except requests.RequestException:
+                    if attempt >= self.max_retries:
+                        raise
+                    response = None
+                latency = time.perf_counter() - start_time
+                for run_statistics in statistics_list:
+                    if isinstance(run_statistics, RunMetrics):
+                        run_statistics.observe_latency(latency)
+                if response is not None:
+                    content_length = response.headers.get("Content-Length")
+                    count_events(statistics_list,
+                                 bytes=int(content_length) if content_length is not None else len(response.content))
+                if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                throttled = response is not None and response.status_code == 429
+            finally:
+                self.concurrency_limiter.release(throttled=throttled)
+
+            if attempt >= self.max_retries:
+                response.raise_for_status()
+            attempt += 1
+            if throttled:
+                count_events(statistics_list, retries=1, throttled=1)
+            else:
+                count_events(statistics_list, retries=1)
+            if throttled:
+                self.token_bucket.pause(parse_retry_after(response.headers.get("Retry-After")))
+            else:
+                time.sleep(min(30.0, 0.5 * 2 ** attempt))
+
+    def map_unordered(self, function, items, max_in_flight: int = None):
+        """
+        Runs a function over items on the thread pool, yielding (item, result) pairs as they complete.
+
+        :param function: function taking one item
+        :param items: items to run the function over
+        :param max_in_flight: maximum number of items submitted to the thread pool at once, or None to submit every
+        item up front. Bounding it keeps one large query from filling the shared thread pool's queue, so concurrent
+        queries take turns.
+        :return: generator of (item, result) pairs. Exceptions raised by the function are re-raised.
+        """
+        item_iterator = iter(items)
+        if max_in_flight is None:
+            max_in_flight = float("inf")
+        futures = {}
+        try:
+            for item in item_iterator:
+                futures[self.executor.submit(function, item)] = item
+                if len(futures) >= max_in_flight:
+                    break
+            while futures:
+                done_futures, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    item = futures.pop(future)
+                    for next_item in item_iterator:
+                        futures[self.executor.submit(function, next_item)] = next_item
+                        break
+                    yield item, future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        """
+        Shuts down the thread pool and closes pooled connections.
+
+        :return: None
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.session_lock:
+            if self._session is not None:
+                self._session.close()
@@ -0,0 +1,149 @@
+import base64
+import hashlib
+import io
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from instrumentation import RunMetrics
+
+FIGURE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+FIGURE_DPI = 96  # CSS pixels per inch, so a figure rendered at width / FIGURE_DPI inches fills width pixels.
+IMAGE_MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def content_hash(*values):
+    """
+    Hashes the data a figure is drawn from, e.g. frequency tables from aggregate_works().
+
+    :param values: values with a deterministic repr()
+    :return: hexadecimal digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        digest.update(repr(value).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """
+    Thread-safe cache of rendered figures, stored as PNG or SVG bytes. Entries are keyed by plot name, a content hash
+    of the plotted data and the render size, so repeat views of the same data at the same size are served without
+    running matplotlib. The least recently used entries are evicted once the cache is over max_bytes.
+
+    Render times and hit counts are recorded to help size the cache, see statistics().
+    """
+
+    def __init__(self, max_bytes: int = FIGURE_CACHE_MAX_BYTES):
+        """
+        :param max_bytes: memory budget for the stored image bytes
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.render_count = 0
+        self.render_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def get_or_render(self,
+                      name: str,
+                      data_hash: str,
+                      create_figure,
+                      width: float,
+                      height: float,
+                      pixel_ratio: float = 1.0,
+                      image_format: str = "png",
+                      statistics: Counter = None):
+        """
+        Returns the rendered image for a plot, rendering and storing it on a cache miss.
+
+        :param name: plot name, e.g. the output ID
+        :param data_hash: content hash of the plotted data, see content_hash()
+        :param create_figure: function without arguments returning the matplotlib figure
+        :param width: render width in CSS pixels
+        :param height: render height in CSS pixels
+        :param pixel_ratio: device pixel ratio of the display, used to render PNGs at full resolution
+        :param image_format: "png" or "svg"
+        :param statistics: counter of the run, updated with "figure_cache_hits" and "figure_cache_misses"; the render
+        time is added to the "render" stage of an instrumentation.RunMetrics
+        :return: image bytes
+        """
+        key = (name, data_hash, round(width), round(height), pixel_ratio, image_format)
+        with self.lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                if statistics is not None:
+                    statistics["figure_cache_hits"] += 1
+                return image
+            self.misses += 1
+        if statistics is not None:
+            statistics["figure_cache_misses"] += 1
+
+        import matplotlib.pyplot as plt
+
+        start_time = time.perf_counter()
+        figure = create_figure()
+        try:
+            figure.set_size_inches(width / FIGURE_DPI, height / FIGURE_DPI)
+            buffer = io.BytesIO()
+            figure.savefig(buffer, format=image_format, dpi=FIGURE_DPI * pixel_ratio)
+        finally:
+            plt.close(figure)
+        image = buffer.getvalue()
+        render_seconds = time.perf_counter() - start_time
+        if isinstance(statistics, RunMetrics):
+            statistics.add_stage_seconds("render", render_seconds)
+
+        with self.lock:
+            self.render_count += 1
+            self.render_seconds += render_seconds
+            if key not in self.entries and len(image) <= self.max_bytes:
+                self.entries[key] = image
+                self.total_bytes += len(image)
+                while self.total_bytes > self.max_bytes:
+                    evicted_key, evicted_image = self.entries.popitem(last=False)
+                    self.total_bytes -= len(evicted_image)
+                    self.evictions += 1
+        return image
+
+    def statistics(self):
+        """
+        :return: dictionary of hit and miss counts, hit rate, evictions, entry count, stored bytes and render times
+        """
+        with self.lock:
+            lookup_count = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / lookup_count if lookup_count else 0.0,
+                    "evictions": self.evictions,
+                    "entries": len(self.entries),
+                    "bytes": self.total_bytes,
+                    "max_bytes": self.max_bytes,
+                    "render_count": self.render_count,
+                    "render_seconds": self.render_seconds,
+                    "mean_render_seconds": self.render_seconds / self.render_count if self.render_count else 0.0}
+
+    def clear(self):
+        """
+        Removes every entry.
+
+        :return: None
+        """
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+def image_data_uri(image: bytes, image_format: str = "png"):
+    """
+    :param image: image bytes
+    :param image_format: "png" or "svg"
+    :return: data URI for the src attribute of an <img> tag
+    """
+    return f"data:{IMAGE_MIME_TYPES[image_format]};base64,{base64.b64encode(image).decode('ascii')}"
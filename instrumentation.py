@@ -0,0 +1,227 @@
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+STAGES = ["read", "clean", "fetch", "aggregate", "render"]
+# Upper bounds in seconds of the HTTP latency histogram buckets, as in Prometheus histograms.
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf")]
+METRIC_PREFIX = "computable_bibliography"
+
+
+def peak_memory_bytes():
+    """
+    :return: peak resident memory of the process in bytes, or None if the platform does not report it
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # ru_maxrss is in kilobytes on Linux.
+
+
+class RunMetrics(Counter):
+    """
+    Performance metrics of one run of the pipeline. Event counts are kept as a Counter, so a RunMetrics can be passed
+    wherever a statistics counter is accepted (e.g. iter_query_open_alex() and FetchEngine); in addition it records
+    the wall time of each stage (read, clean, fetch, aggregate, render), an HTTP latency histogram and the peak
+    memory of the process.
+
+    Counts recorded by the pipeline: "requests", "retries", "throttled", "bytes" (response bodies downloaded),
+    "cache_hits" and "cache_misses" (Work cache), "offline_hits" and "offline_misses" (offline index),
+    "shared_hits" and "shared_waits" (shared work store), "figure_cache_hits" and "figure_cache_misses".
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stage_seconds = {}
+        self.latency_bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.peak_memory = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times a block of code as part of a stage, e.g. "with run_metrics.stage('fetch'): ...". Repeated blocks of the
+        same stage add up.
+
+        :param name: stage name, see STAGES
+        :return: context manager
+        """
+        start_time = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_stage_seconds(name, time.perf_counter() - start_time)
+
+    def add_stage_seconds(self, name: str, seconds: float):
+        """
+        :param name: stage name, see STAGES
+        :param seconds: wall time to add to the stage
+        :return: None
+        """
+        with self.lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+        self.record_peak_memory()
+
+    def observe_latency(self, seconds: float):
+        """
+        Adds one HTTP request to the latency histogram.
+
+        :param seconds: time from sending the request to receiving the response
+        :return: None
+        """
+        with self.lock:
+            for i, upper_bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= upper_bound:
+                    self.latency_bucket_counts[i] += 1
+                    break
+            self.latency_sum += seconds
+            self.latency_count += 1
+
+    def record_peak_memory(self):
+        """
+        Updates the peak memory with the process's current peak.
+
+        :return: None
+        """
+        peak_memory = peak_memory_bytes()
+        if peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, peak_memory)
+
+    def cache_hit_ratio(self):
+        """
+        :return: share of identifiers served from the Work cache, or None if the cache was not used
+        """
+        lookup_count = self["cache_hits"] + self["cache_misses"]
+        return self["cache_hits"] / lookup_count if lookup_count else None
+
+    def latency_quantile(self, quantile: float):
+        """
+        Estimates a latency quantile from the histogram, reporting the upper bound of the bucket it falls in.
+
+        :param quantile: quantile between 0 and 1, e.g. 0.95
+        :return: seconds, or None if no requests were recorded
+        """
+        with self.lock:
+            if self.latency_count == 0:
+                return None
+            rank = quantile * self.latency_count
+            cumulative_count = 0
+            for upper_bound, count in zip(LATENCY_BUCKETS, self.latency_bucket_counts):
+                cumulative_count += count
+                if cumulative_count >= rank:
+                    return upper_bound
+            return LATENCY_BUCKETS[-1]
+
+    def copy(self):
+        """
+        :return: independent copy of the metrics
+        """
+        run_metrics = RunMetrics(self)
+        with self.lock:
+            run_metrics.stage_seconds = dict(self.stage_seconds)
+            run_metrics.latency_bucket_counts = list(self.latency_bucket_counts)
+            run_metrics.latency_sum = self.latency_sum
+            run_metrics.latency_count = self.latency_count
+            run_metrics.peak_memory = self.peak_memory
+        return run_metrics
+
+    def to_dictionary(self):
+        """
+        :return: dictionary of counts, stage times, latency histogram, cache hit ratio and peak memory, e.g. for JSON
+        """
+        with self.lock:
+            latency_buckets = {str(upper_bound): count
+                               for upper_bound, count in zip(LATENCY_BUCKETS, self.latency_bucket_counts)}
+            latency = {"count": self.latency_count, "sum_seconds": self.latency_sum, "buckets": latency_buckets}
+            stage_seconds = dict(self.stage_seconds)
+        latency["p50_seconds"] = self.latency_quantile(0.5)
+        latency["p95_seconds"] = self.latency_quantile(0.95)
+        return {"counts": dict(self),
+                "stage_seconds": stage_seconds,
+                "http_latency": latency,
+                "cache_hit_ratio": self.cache_hit_ratio(),
+                "peak_memory_bytes": self.peak_memory}
+
+    def to_json(self):
+        """
+        :return: metrics as a JSON string, see to_dictionary()
+        """
+        return json.dumps(self.to_dictionary(), indent=2)
+
+    def to_prometheus(self, prefix: str = METRIC_PREFIX):
+        """
+        Formats the metrics in the Prometheus text exposition format.
+
+        :param prefix: metric name prefix
+        :return: metrics text
+        """
+        lines = [f"# TYPE {prefix}_stage_seconds gauge"]
+        with self.lock:
+            stage_seconds = dict(self.stage_seconds)
+            bucket_counts = list(self.latency_bucket_counts)
+            latency_sum = self.latency_sum
+            latency_count = self.latency_count
+        for name, seconds in stage_seconds.items():
+            lines.append(f'{prefix}_stage_seconds{{stage="{name}"}} {seconds}')
+        for name, count in sorted(self.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {count}")
+        lines.append(f"# TYPE {prefix}_http_request_seconds histogram")
+        cumulative_count = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS, bucket_counts):
+            cumulative_count += count
+            label = "+Inf" if upper_bound == float("inf") else str(upper_bound)
+            lines.append(f'{prefix}_http_request_seconds_bucket{{le="{label}"}} {cumulative_count}')
+        lines.append(f"{prefix}_http_request_seconds_sum {latency_sum}")
+        lines.append(f"{prefix}_http_request_seconds_count {latency_count}")
+        if self.cache_hit_ratio() is not None:
+            lines.append(f"# TYPE {prefix}_cache_hit_ratio gauge")
+            lines.append(f"{prefix}_cache_hit_ratio {self.cache_hit_ratio()}")
+        if self.peak_memory is not None:
+            lines.append(f"# TYPE {prefix}_peak_memory_bytes gauge")
+            lines.append(f"{prefix}_peak_memory_bytes {self.peak_memory}")
+        return "\n".join(lines) + "\n"
+
+    def summary_table(self):
+        """
+        Formats the metrics as a plain text table for the command line and the app.
+
+        :return: table text
+        """
+        rows = []
+        total_seconds = 0.0
+        stage_seconds = dict(self.stage_seconds)
+        for name in STAGES + [name for name in stage_seconds if name not in STAGES]:
+            if name in stage_seconds:
+                rows.append((f"{name} time", f"{stage_seconds[name]:.3f} s"))
+                total_seconds += stage_seconds[name]
+        rows.append(("total time", f"{total_seconds:.3f} s"))
+        rows.append(("HTTP requests", f"{self['requests']}"))
+        if self.latency_count:
+            rows.append(("HTTP latency", f"mean {self.latency_sum / self.latency_count * 1000:.0f} ms, "
+                                         f"p50 <= {self.latency_quantile(0.5) * 1000:.0f} ms, "
+                                         f"p95 <= {self.latency_quantile(0.95) * 1000:.0f} ms"))
+        rows.append(("downloaded", f"{self['bytes'] / 1024 / 1024:.2f} MB"))
+        rows.append(("retries", f"{self['retries']} ({self['throttled']} throttled, HTTP 429)"))
+        cache_hit_ratio = self.cache_hit_ratio()
+        rows.append(("Work cache", f"{self['cache_hits']} hits, {self['cache_misses']} misses"
+                                   + (f" ({cache_hit_ratio:.0%} hit ratio)" if cache_hit_ratio is not None else "")))
+        if self["shared_hits"] or self["shared_waits"]:
+            rows.append(("shared works", f"{self['shared_hits']} stored, {self['shared_waits']} fetched by other "
+                                         f"queries"))
+        if self["offline_hits"] or self["offline_misses"]:
+            rows.append(("offline index", f"{self['offline_hits']} found, {self['offline_misses']} missing"))
+        if self["figure_cache_hits"] or self["figure_cache_misses"]:
+            rows.append(("figure cache", f"{self['figure_cache_hits']} hits, {self['figure_cache_misses']} misses"))
+        if self.peak_memory is not None:
+            rows.append(("peak memory", f"{self.peak_memory / 1024 / 1024:.0f} MB"))
+        name_width = max(len(name) for name, _ in rows)
+        return "\n".join(f"{name.ljust(name_width)}  {value}" for name, value in rows)
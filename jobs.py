@@ -0,0 +1,358 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+
+from fetch_engine import FetchEngine
+from instrumentation import RunMetrics
+from query_open_alex import iter_query_open_alex
+from shared_work_store import SharedWorkStore, iter_query_shared
+from work_cache import WorkCache
+from work_aggregates import inherit_aggregates
+from work_store import WorkStore
+
+JOB_MAX_RUNNING = 2  # Queries running at once; further jobs wait in the queue.
+JOB_MAX_QUEUED = 16  # Jobs waiting to run across all sessions; submitting more raises JobQueueFullError.
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class JobQueueFullError(Exception):
+    """
+    Raised by JobManager.submit() when the global job queue is full.
+    """
+
+
+class QueryJob:
+    """
+    Background OpenAlex query run by a JobManager. Results are accumulated batch by batch from iter_query_open_alex()
+    so that the submitting session can poll for partial results and progress without blocking the server.
+    """
+
+    def __init__(self,
+                 session_id: str,
+                 query_input: list,
+                 engine: FetchEngine = None,
+                 cache: WorkCache = None,
+                 run_metrics: RunMetrics = None,
+                 work_store: WorkStore = None,
+                 offline_index=None,
+                 shared_store: SharedWorkStore = None):
+        """
+        :param session_id: ID of the session that submitted the job, used for fair scheduling and job status
+        :param query_input: cleaned input list of DOIs
+        :param engine: shared fetch engine, see iter_query_open_alex()
+        :param cache: persistent Work object cache, see iter_query_open_alex()
+        :param run_metrics: metrics of the run the job belongs to; the query's counts and the "fetch" stage time are
+        added to it
+        :param work_store: store to add the results to, e.g. the previous result without the works removed from the
+        input list (see work_aggregates.remove_works()); None for a new store
+        :param offline_index: offline index of a local OpenAlex snapshot to query instead of OpenAlex, see
+        iter_query_open_alex()
+        :param shared_store: process-wide store of Work objects to share with the jobs of other sessions, with the
+        session ID as owner (see shared_work_store.iter_query_shared()), or None
+        """
+        self.session_id = session_id
+        self.query_input = query_input
+        self.engine = engine
+        self.cache = cache
+        self.offline_index = offline_index
+        self.shared_store = shared_store
+        self.session_ended = False
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.work_store = work_store if work_store is not None else WorkStore()
+        self.snapshot_store = self.work_store
+        self.snapshot_error_list = []
+        self.snapshot_version = None
+        self.identifier_with_error_list = []
+        self.query_statistics = run_metrics if run_metrics is not None else RunMetrics()
+        self.completed_count = 0
+        self.version = 0
+        self.status = QUEUED
+        self.error = None
+        self.queue_position = None
+        self.submit_time = time.monotonic()
+        self.start_time = None
+        self.end_time = None
+
+    def run(self):
+        """
+        Runs the query on the calling thread until it completes or is cancelled. Called by the JobManager.
+
+        :return: None
+        """
+        with self.lock:
+            if self.cancelled.is_set():
+                self.finish(CANCELLED)
+                self.release_shared_store()
+                return
+            self.status = RUNNING
+            self.start_time = time.monotonic()
+            self.version += 1
+        status = DONE
+        query_arguments = {"engine": self.engine,
+                           "cache": self.cache,
+                           "statistics": self.query_statistics,
+                           "offline_index": self.offline_index}
+        if self.shared_store is not None:
+            batches = iter_query_shared(self.shared_store, self.session_id, self.query_input, **query_arguments)
+        else:
+            batches = iter_query_open_alex(self.query_input, **query_arguments)
+        try:
+            for work_list, error_list in batches:
+                with self.lock:
+                    for identifier, result in work_list:
+                        self.work_store.add_work(identifier, result)
+                    self.identifier_with_error_list.extend(error_list)
+                    self.completed_count += len(work_list) + len(error_list)
+                    self.version += 1
+                if self.cancelled.is_set():
+                    status = CANCELLED
+                    break
+        except Exception as error:
+            status = FAILED
+            self.error = error
+        finally:
+            batches.close()
+            self.query_statistics.add_stage_seconds("fetch", time.monotonic() - self.start_time)
+            with self.lock:
+                self.finish(status)
+                self.release_shared_store()
+
+    def finish(self, status: str):
+        """
+        Records the final status. Must be called with the lock held.
+
+        :param status: DONE, CANCELLED or FAILED
+        :return: None
+        """
+        self.status = status
+        self.end_time = time.monotonic()
+        self.version += 1
+
+    def cancel(self):
+        """
+        Stops the query after the batch in progress, or before it starts if it is still queued.
+
+        :return: None
+        """
+        self.cancelled.set()
+
+    def end_session(self):
+        """
+        Cancels the job because its session ended. The session's references to shared works are dropped once the job
+        has stopped, so a running job cannot add references after the release.
+
+        :return: None
+        """
+        self.cancel()
+        with self.lock:
+            self.session_ended = True
+            if self.done:
+                self.release_shared_store()
+
+    def release_shared_store(self):
+        """
+        Drops the session's references to shared works if the session has ended. Must be called with the lock held.
+
+        :return: None
+        """
+        if self.session_ended and self.shared_store is not None:
+            self.shared_store.release(self.session_id)
+
+    @property
+    def done(self):
+        return self.status in (DONE, CANCELLED, FAILED)
+
+    def snapshot(self):
+        """
+        Copies the results received so far. The copy is only taken when results have changed since the previous
+        snapshot (see version); otherwise the previous copy is returned again, so polling an idle or finished job is
+        cheap. The copy reuses the aggregates of the previous copy, so aggregating it only counts the works received
+        since (see work_aggregates.inherit_aggregates()).
+
+        :return: dictionary of query result WorkStore, error list, copy of the statistics, status and progress, and the
+        job's live RunMetrics, to which later stages of the run are added
+        """
+        with self.lock:
+            running_seconds = 0.0
+            if self.start_time is not None:
+                running_seconds = (self.end_time or time.monotonic()) - self.start_time
+            if self.snapshot_version != self.version:
+                work_store = self.work_store.copy()
+                inherit_aggregates(self.snapshot_store, work_store)
+                self.snapshot_store = work_store
+                self.snapshot_error_list = list(self.identifier_with_error_list)
+                self.snapshot_version = self.version
+            return {'work_store': self.snapshot_store,
+                    'identifier_with_error_list': self.snapshot_error_list,
+                    'query_statistics': self.query_statistics.copy(),
+                    'run_metrics': self.query_statistics,
+                    'completed_count': self.completed_count,
+                    'total_count': len(self.query_input),
+                    'rate': self.completed_count / max(running_seconds, 1e-9),
+                    'status': self.status,
+                    'queue_position': self.queue_position,
+                    'error': self.error,
+                    'version': self.version,
+                    'done': self.done}
+
+
+class JobManager:
+    """
+    Runs QueryJobs on a fixed number of worker threads with a bounded global queue. Queued jobs are scheduled round
+    robin across sessions, so a session that submits many jobs does not delay the others, and each session can look
+    up the status of its own jobs.
+
+    One manager is shared by every session of the Shiny app.
+    """
+
+    def __init__(self, max_running: int = JOB_MAX_RUNNING, max_queued: int = JOB_MAX_QUEUED):
+        """
+        :param max_running: number of worker threads, i.e. jobs running at once
+        :param max_queued: maximum number of jobs waiting to run
+        """
+        self.max_running = max(1, max_running)
+        self.max_queued = max_queued
+        self.session_queues = OrderedDict()
+        self.session_jobs = {}
+        self.queued_count = 0
+        self.running_jobs = set()
+        self.condition = threading.Condition()
+        self.threads = [threading.Thread(target=self.work, name=f"query-job-{i}", daemon=True)
+                        for i in range(self.max_running)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, job: QueryJob):
+        """
+        Queues a job.
+
+        :param job: job to run
+        :return: the job. Raises JobQueueFullError if max_queued jobs are already waiting.
+        """
+        with self.condition:
+            if self.queued_count >= self.max_queued:
+                raise JobQueueFullError(f"{self.queued_count} jobs are already waiting to run.")
+            self.session_queues.setdefault(job.session_id, deque()).append(job)
+            session_jobs = [session_job for session_job in self.session_jobs.get(job.session_id, [])
+                            if not session_job.done]
+            self.session_jobs[job.session_id] = session_jobs + [job]
+            self.queued_count += 1
+            self.update_queue_positions()
+            self.condition.notify()
+        return job
+
+    def next_job(self):
+        """
+        Takes the first job of the session at the front of the rotation, then moves that session to the back. Must be
+        called with the condition's lock held.
+
+        :return: QueryJob, or None if no job is queued
+        """
+        while self.session_queues:
+            session_id, session_queue = next(iter(self.session_queues.items()))
+            job = session_queue.popleft()
+            if session_queue:
+                self.session_queues.move_to_end(session_id)
+            else:
+                del self.session_queues[session_id]
+            self.queued_count -= 1
+            if not job.cancelled.is_set():
+                job.queue_position = None
+                return job
+            job.run()  # Records the cancellation without querying.
+        return None
+
+    def dequeue(self, job: QueryJob):
+        """
+        Removes a cancelled job from its session's queue and records the cancellation, so that it no longer counts
+        towards max_queued. Must be called with the condition's lock held.
+
+        :param job: cancelled job
+        :return: None
+        """
+        session_queue = self.session_queues.get(job.session_id)
+        if session_queue is None or job not in session_queue:
+            return
+        session_queue.remove(job)
+        if not session_queue:
+            del self.session_queues[job.session_id]
+        self.queued_count -= 1
+        job.queue_position = None
+        job.run()  # Records the cancellation without querying.
+        self.update_queue_positions()
+
+    def update_queue_positions(self):
+        """
+        Sets each queued job's position in the order the round robin will start them. Must be called with the
+        condition's lock held.
+
+        :return: None
+        """
+        queues = [list(session_queue) for session_queue in self.session_queues.values()]
+        scheduled_jobs = itertools.chain.from_iterable(itertools.zip_longest(*queues))
+        for position, job in enumerate(job for job in scheduled_jobs if job is not None):
+            job.queue_position = position + 1
+
+    def work(self):
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self.next_job()
+                self.running_jobs.add(job)
+                self.update_queue_positions()
+            try:
+                job.run()
+            finally:
+                with self.condition:
+                    self.running_jobs.discard(job)
+
+    def cancel(self, job: QueryJob):
+        """
+        Cancels a job. A queued job leaves the queue at once; a running job stops after the batch in progress.
+
+        :param job: job submitted to this manager
+        :return: None
+        """
+        with self.condition:
+            job.cancel()
+            self.dequeue(job)
+
+    def cancel_session(self, session_id: str):
+        """
+        Cancels every queued or running job of a session and forgets the session's jobs, e.g. when the session ends.
+
+        :param session_id: session ID
+        :return: None
+        """
+        with self.condition:
+            for job in self.session_jobs.pop(session_id, []):
+                job.end_session()
+                self.dequeue(job)
+
+    def jobs(self, session_id: str):
+        """
+        :param session_id: session ID
+        :return: list of the session's unfinished jobs and latest job, in submission order
+        """
+        with self.condition:
+            return list(self.session_jobs.get(session_id, []))
+
+    def statistics(self):
+        """
+        :return: dictionary of the number of running and queued jobs and the number of sessions with queued jobs
+        """
+        with self.condition:
+            return {"running": len(self.running_jobs),
+                    "queued": self.queued_count,
+                    "max_running": self.max_running,
+                    "max_queued": self.max_queued,
+                    "waiting_sessions": len(self.session_queues)}
@@ -0,0 +1,161 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+NORMALIZATION_INDEX_PATH = os.environ.get("NORMALIZATION_INDEX_PATH",
+                                          os.path.join(os.path.expanduser("~"), ".cache", "computable_bibliography",
+                                                       "normalization.json"))
+NORMALIZATION_INDEX_VERSION = 2  # Version 1 entries had no expiry and access times; they are migrated on load.
+NORMALIZATION_INDEX_TTL = 30 * 24 * 60 * 60  # Seconds a canonical name stays valid before it is refreshed.
+NORMALIZATION_INDEX_MAX_ENTRIES = 200000  # Entries kept per kind; the least recently used are dropped on save.
+NORMALIZED_KINDS = ["venue", "keyword", "concept"]
+ISSN_KEY_PREFIX = "issn:"  # Key of a venue with an ISSN-L, shared by every OpenAlex source with that ISSN-L.
+NAME_KEY_PREFIX = "name:"  # Key of a value without an OpenAlex ID, by case-folded display name.
+
+default_index = None
+default_index_lock = threading.Lock()
+
+
+class NormalizationIndex:
+    """
+    Lookup table from the venues, keywords and concepts of Work objects to one canonical entry each, so that aliases
+    are counted together. Venues are keyed by ISSN-L, which links the OpenAlex sources of one journal (e.g. its print
+    and electronic editions), and otherwise by OpenAlex ID; keywords and concepts by OpenAlex ID. Values without an ID
+    are keyed by their case-folded display name. Each key has a canonical OpenAlex ID and display name: those of the
+    first value seen with the key, so the display names of renamed sources and casing variants are counted as one.
+
+    The table is kept in a JSON file between runs, so canonical names stay the same from run to run. Like WorkCache,
+    entries expire after ttl seconds, after which the next value seen with the key becomes its canonical entry (e.g.
+    the new name of a renamed source), and the table is bounded: on save, expired entries and the least recently used
+    entries beyond max_entries per kind are dropped. It is thread-safe and shared by every WorkStore of the process,
+    see default_normalization_index().
+    """
+
+    def __init__(self,
+                 path: str = None,
+                 ttl: float = NORMALIZATION_INDEX_TTL,
+                 max_entries: int = NORMALIZATION_INDEX_MAX_ENTRIES):
+        """
+        :param path: JSON file the table is loaded from and saved to, or None for a table kept in memory only
+        :param ttl: number of seconds an entry stays valid
+        :param max_entries: maximum number of entries per kind kept when saving
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # Key to [canonical OpenAlex ID, canonical name, expiry time, last access time].
+        self.entries = {kind: {} for kind in NORMALIZED_KINDS}
+        self.aliases = {kind: {} for kind in NORMALIZED_KINDS}  # OpenAlex ID to the key it was first seen under.
+        self.changed = False
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    stored = json.load(file)
+            except (OSError, ValueError):
+                stored = None  # An unreadable table is rebuilt; it only holds what the works themselves contain.
+            if stored is not None and stored.get("version") in (1, NORMALIZATION_INDEX_VERSION):
+                now = time.time()
+                for kind in NORMALIZED_KINDS:
+                    self.entries[kind].update(stored["entries"].get(kind, {}))
+                    self.aliases[kind].update(stored["aliases"].get(kind, {}))
+                    if stored["version"] == 1:
+                        for entry in self.entries[kind].values():
+                            entry.extend([now + ttl, now])
+
+    def canonical(self, kind: str, openalex_id: str, display_name: str, issn_l: str = None):
+        """
+        Looks up the canonical entry of a venue, keyword or concept, adding it if it is new.
+
+        :param kind: "venue", "keyword" or "concept"
+        :param openalex_id: OpenAlex ID of the value, or None
+        :param display_name: display name of the value, or None
+        :param issn_l: ISSN-L of a venue, or None
+        :return: key, canonical OpenAlex ID and canonical display name; (None, None, None) if the value has neither
+        an ID nor a display name
+        """
+        if issn_l:
+            key = ISSN_KEY_PREFIX + issn_l.upper()
+        elif openalex_id:
+            key = openalex_id
+        elif display_name is not None:
+            key = NAME_KEY_PREFIX + display_name.casefold()
+        else:
+            return None, None, None
+        now = time.time()
+        with self.lock:
+            # An OpenAlex ID keeps the key it was first seen under, e.g. when a later Work object omits the ISSN-L.
+            key = self.aliases[kind].get(openalex_id, key) if openalex_id else key
+            entry = self.entries[kind].get(key)
+            if entry is None or entry[2] <= now:
+                entry = self.entries[kind][key] = [openalex_id, display_name if display_name is not None else key,
+                                                   now + self.ttl, now]
+            else:
+                entry[3] = now
+            self.changed = True
+            if openalex_id and openalex_id not in self.aliases[kind]:
+                self.aliases[kind][openalex_id] = key
+                self.changed = True
+        return key, entry[0], entry[1]
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently used entries of each kind beyond max_entries, and the aliases
+        of removed entries. Must be called with the lock held.
+
+        :return: None
+        """
+        now = time.time()
+        for kind in NORMALIZED_KINDS:
+            entries = self.entries[kind]
+            evicted_keys = {key for key, entry in entries.items() if entry[2] <= now}
+            if len(entries) - len(evicted_keys) > self.max_entries:
+                kept_keys = sorted((key for key in entries if key not in evicted_keys), key=lambda key: entries[key][3])
+                evicted_keys.update(kept_keys[:len(kept_keys) - self.max_entries])
+            if not evicted_keys:
+                continue
+            for key in evicted_keys:
+                del entries[key]
+            self.aliases[kind] = {openalex_id: key for openalex_id, key in self.aliases[kind].items()
+                                  if key not in evicted_keys}
+
+    def save(self):
+        """
+        Writes the table to its file if it has changed, atomically, so concurrent runs never read a partial file.
+        Expired and least recently used entries are dropped first, see evict().
+
+        :return: None
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            if not self.changed:
+                return
+            self.evict()
+            stored = json.dumps({"version": NORMALIZATION_INDEX_VERSION,
+                                 "entries": self.entries,
+                                 "aliases": self.aliases}, separators=(",", ":"))
+            self.changed = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(stored)
+        os.replace(temporary_path, self.path)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+
+def default_normalization_index():
+    """
+    :return: NormalizationIndex of the process, loaded from NORMALIZATION_INDEX_PATH on first use and saved when the
+    process exits
+    """
+    global default_index
+    with default_index_lock:
+        if default_index is None:
+            default_index = NormalizationIndex(NORMALIZATION_INDEX_PATH)
+            atexit.register(default_index.save)
+        return default_index
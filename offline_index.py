@@ -0,0 +1,338 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import threading
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from query_open_alex import CACHED_BATCH_SIZE, WORK_FIELDS, normalize_doi, is_complete_work, project_work
+
+# Directory of an offline index built by ingest_snapshot(); if set, the app looks DOIs up there instead of on OpenAlex.
+OFFLINE_INDEX_PATH = os.environ.get("OPEN_ALEX_OFFLINE_INDEX")
+OFFLINE_INDEX_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+SHARD_DIRECTORY = "shards"
+# One file per column of the DOI index, sorted by DOI key, so each column can be memory-mapped as a flat NumPy array.
+INDEX_COLUMNS = {"keys": "<u8", "shards": "<u4", "offsets": "<u8", "lengths": "<u4"}
+OFFLINE_PARALLEL_MIN_LOOKUPS = 10000  # Smaller lookups are read in-process; process start-up would dominate.
+SNAPSHOT_FILE_EXTENSION = ".gz"
+
+
+def doi_key(doi: str):
+    """
+    :param doi: normalized DOI, see query_open_alex.normalize_doi()
+    :return: 64-bit hash of the DOI used as its key in the DOI index
+    """
+    return int.from_bytes(hashlib.blake2b(doi.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def find_snapshot_files(path_list: list):
+    """
+    Expands directories into the gzipped JSON Lines files they contain, recursively, e.g. the
+    "data/works/updated_date=.../part_000.gz" files of an OpenAlex snapshot. Files are sorted by path, which orders
+    the "updated_date=" partitions of a snapshot from the oldest to the newest.
+
+    :param path_list: list of file and directory paths
+    :return: list of file paths, without duplicates
+    """
+    filename_list = []
+    for path in path_list:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                filename_list.extend(os.path.join(directory, name) for name in names
+                                     if name.endswith(SNAPSHOT_FILE_EXTENSION))
+        else:
+            filename_list.append(path)
+    return sorted(dict.fromkeys(filename_list))
+
+
+def ingest_snapshot_file(source_path: str, shard_path: str, select_fields: list):
+    """
+    Decompresses one snapshot file and writes the selected fields of its works with a DOI as one JSON line each, so
+    that works can be read back by byte offset. Gzip files cannot be read from an offset, so the index points into
+    these shard files instead. Runs in an ingest process, see ingest_snapshot().
+
+    :param source_path: gzipped JSON Lines file of Work objects
+    :param shard_path: shard file to write
+    :param select_fields: list of Work object fields to keep
+    :return: arrays of the DOI keys, byte offsets and byte lengths of the written works, in file order
+    """
+    keys = array("Q")
+    offsets = array("Q")
+    lengths = array("I")
+    offset = 0
+    with gzip.open(source_path, "rb") as source, open(shard_path, "wb") as shard:
+        for line in source:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            doi = normalize_doi(result.get("doi"))
+            if doi is None:
+                continue
+            record = json.dumps(project_work(result, select_fields), separators=(",", ":")).encode("utf-8")
+            shard.write(record + b"\n")
+            keys.append(doi_key(doi))
+            offsets.append(offset)
+            lengths.append(len(record))
+            offset += len(record) + 1
+    return keys, offsets, lengths
+
+
+def ingest_snapshot(path_list: list, index_directory: str, select_fields: list = WORK_FIELDS, max_workers: int = None):
+    """
+    Builds an offline index from local OpenAlex snapshot files, once. Each snapshot file is decompressed into a shard
+    of the index on a process pool, then the DOI keys of all shards are sorted into the DOI index (see INDEX_COLUMNS)
+    together with the shard, offset and length of their work. Sorting holds the index in memory once, 24 bytes per
+    work.
+
+    A DOI that occurs in several snapshot files keeps all its entries; lookups use the one from the newest file.
+
+    :param path_list: list of snapshot files and directories, see find_snapshot_files()
+    :param index_directory: directory to write the index to, created if it does not exist
+    :param select_fields: list of Work object fields to keep; lookups can only return these fields
+    :param max_workers: number of ingest processes, or None for one per CPU
+    :return: number of works indexed
+    """
+    import numpy as np
+
+    source_list = find_snapshot_files(path_list)
+    os.makedirs(os.path.join(index_directory, SHARD_DIRECTORY), exist_ok=True)
+    shard_list = [os.path.join(SHARD_DIRECTORY, f"{shard:05d}.jsonl") for shard in range(len(source_list))]
+    columns = {name: [] for name in INDEX_COLUMNS}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(ingest_snapshot_file, source_path, os.path.join(index_directory, shard_name),
+                                   select_fields)
+                   for source_path, shard_name in zip(source_list, shard_list)]
+        for shard, future in enumerate(futures):
+            keys, offsets, lengths = future.result()
+            columns["keys"].append(np.frombuffer(keys, dtype=np.uint64))
+            columns["shards"].append(np.full(len(keys), shard, dtype=np.uint32))
+            columns["offsets"].append(np.frombuffer(offsets, dtype=np.uint64))
+            columns["lengths"].append(np.frombuffer(lengths, dtype=np.uint32))
+
+    columns = {name: np.concatenate(arrays).astype(INDEX_COLUMNS[name]) if arrays
+               else np.zeros(0, dtype=INDEX_COLUMNS[name])
+               for name, arrays in columns.items()}
+    order = np.lexsort((columns["offsets"], columns["shards"], columns["keys"]))
+    for name, column in columns.items():
+        np.save(os.path.join(index_directory, f"{name}.npy"), column[order])
+    manifest = {"version": OFFLINE_INDEX_VERSION,
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "fields": select_fields,
+                "work_count": len(order),
+                "source_files": source_list,
+                "shards": shard_list}
+    with open(os.path.join(index_directory, MANIFEST_FILENAME), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return len(order)
+
+
+def read_shard_records(shard_path: str, offsets: list, lengths: list):
+    """
+    Reads and decodes works from one shard file. Runs in a lookup process, see OfflineIndex.lookup().
+
+    :param shard_path: shard file of an offline index
+    :param offsets: byte offsets of the works
+    :param lengths: byte lengths of the works
+    :return: list of Work objects, in the order of offsets
+    """
+    with open(shard_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return [json.loads(buffer[offset:offset + length]) for offset, length in zip(offsets, lengths)]
+
+
+class OfflineIndex:
+    """
+    Read-only OpenAlex works lookup backed by an offline index built by ingest_snapshot(). The DOI index columns are
+    memory-mapped and binary-searched with NumPy, and works are read from memory-mapped shard files, so lookups need
+    no network access and only touch the pages they read.
+    """
+
+    def __init__(self, index_directory: str, max_workers: int = None):
+        """
+        :param index_directory: directory of the index, see ingest_snapshot()
+        :param max_workers: number of lookup processes for large lookups, or None for one per CPU. With 1, every lookup
+        is read in-process; use it in multithreaded processes such as the app's server, where forking is unsafe.
+        """
+        import numpy as np
+
+        self.index_directory = index_directory
+        self.max_workers = max_workers
+        with open(os.path.join(index_directory, MANIFEST_FILENAME), encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        if self.manifest.get("version") != OFFLINE_INDEX_VERSION:
+            raise ValueError(f"Unsupported offline index version in {index_directory}; ingest the snapshot again.")
+        self.fields = self.manifest["fields"]
+        self.shard_paths = [os.path.join(index_directory, shard_name) for shard_name in self.manifest["shards"]]
+        # np.load() cannot memory-map an empty array.
+        mmap_mode = "r" if self.manifest["work_count"] else None
+        self.columns = {name: np.load(os.path.join(index_directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                        for name in INDEX_COLUMNS}
+        self.shard_buffers = {}
+        self.shard_lock = threading.Lock()
+
+    def shard_buffer(self, shard: int):
+        """
+        :param shard: shard number
+        :return: memory map of the shard file, opened on first use
+        """
+        with self.shard_lock:
+            buffer = self.shard_buffers.get(shard)
+            if buffer is None:
+                with open(self.shard_paths[shard], "rb") as file:
+                    buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.shard_buffers[shard] = buffer
+            return buffer
+
+    def lookup(self, doi_list: list):
+        """
+        Looks up works by normalized DOI. The keys of all DOIs are binary-searched in the DOI index at once, and the
+        matching entries are read shard by shard. Lookups of at least OFFLINE_PARALLEL_MIN_LOOKUPS DOIs in several
+        shards are read and decoded on a process pool, one task per shard, unless max_workers is 1. Entries are
+        checked against the DOI of the work read, so key collisions cannot return the wrong work.
+
+        :param doi_list: list of normalized DOIs, see query_open_alex.normalize_doi()
+        :return: dictionary of normalized DOI to Work object, for the DOIs found
+        """
+        import numpy as np
+
+        doi_list = list(dict.fromkeys(doi_list))
+        if not doi_list or not self.manifest["work_count"]:
+            return {}
+        index_keys = self.columns["keys"]
+        keys = np.fromiter((doi_key(doi) for doi in doi_list), dtype=np.uint64, count=len(doi_list))
+        starts = np.searchsorted(index_keys, keys, side="left")
+        ends = np.searchsorted(index_keys, keys, side="right")
+        run_lengths = ends - starts
+        found = np.flatnonzero(run_lengths)
+        # Every index entry with a matching key is a candidate; usually there is exactly one per DOI.
+        candidate_dois = np.repeat(found, run_lengths[found])
+        candidate_offsets = np.zeros(len(found) + 1, dtype=np.int64)
+        np.cumsum(run_lengths[found], out=candidate_offsets[1:])
+        entries = (np.repeat(starts[found] - candidate_offsets[:-1], run_lengths[found])
+                   + np.arange(candidate_offsets[-1], dtype=np.int64))
+        shards = np.asarray(self.columns["shards"][entries])
+        offsets = np.asarray(self.columns["offsets"][entries])
+        lengths = np.asarray(self.columns["lengths"][entries])
+
+        shard_positions = {int(shard): np.flatnonzero(shards == shard) for shard in np.unique(shards)}
+        records = [None] * len(entries)
+        if len(doi_list) >= OFFLINE_PARALLEL_MIN_LOOKUPS and len(shard_positions) > 1 and self.max_workers != 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {shard: executor.submit(read_shard_records, self.shard_paths[shard],
+                                                  offsets[positions].tolist(), lengths[positions].tolist())
+                           for shard, positions in shard_positions.items()}
+                for shard, future in futures.items():
+                    for position, result in zip(shard_positions[shard], future.result()):
+                        records[position] = result
+        else:
+            for shard, positions in shard_positions.items():
+                buffer = self.shard_buffer(shard)
+                for position in positions:
+                    offset = int(offsets[position])
+                    records[position] = json.loads(buffer[offset:offset + int(lengths[position])])
+
+        work_dictionary = {}
+        # Candidates of a DOI are ordered by shard, so the newest snapshot file's version of a work is kept last.
+        for doi_position, result in zip(candidate_dois, records):
+            doi = doi_list[doi_position]
+            if normalize_doi(result.get("doi")) == doi:
+                work_dictionary[doi] = result
+        return work_dictionary
+
+    def iter_query(self,
+                   cleaned_input_list: list,
+                   statistics: Counter = None,
+                   select_fields: list = WORK_FIELDS,
+                   batch_size: int = CACHED_BATCH_SIZE):
+        """
+        Looks up the works of an input list in the index, yielding them in the batches of
+        query_open_alex.iter_query_open_alex(), so results of the index are used wherever OpenAlex results are.
+        Identifiers that are not DOIs or not in the index are reported as errors.
+
+        :param cleaned_input_list: input list of DOIs in format "https://doi.org/10.XXX/XXX" or "doi:10.XXXX/XXX"
+        :param statistics: counter updated with "offline_hits" and "offline_misses"
+        :param select_fields: list of Work object fields to return, or None for every field of the index. Raises
+        ValueError if a field was not kept by ingest_snapshot().
+        :param batch_size: number of works per yielded batch
+        :return: generator of (list of (identifier, Work object) pairs, list of identifiers with errors) tuples
+        """
+        missing_fields = [field for field in select_fields or [] if field not in self.fields]
+        if missing_fields:
+            raise ValueError(f"The offline index in {self.index_directory} does not keep the fields {missing_fields}; "
+                             f"ingest the snapshot again with these fields.")
+        if statistics is None:
+            statistics = Counter()
+        work_dictionary = self.lookup([doi for doi in map(normalize_doi, cleaned_input_list) if doi is not None])
+        work_list = []
+        error_list = []
+        for identifier in cleaned_input_list:
+            result = work_dictionary.get(normalize_doi(identifier))
+            if result is None or not is_complete_work(result):
+                error_list.append(identifier)
+            else:
+                work_list.append((identifier, project_work(result, select_fields)))
+        statistics["offline_hits"] += len(work_list)
+        statistics["offline_misses"] += len(error_list)
+        for i in range(0, max(len(work_list), len(error_list)), batch_size):
+            yield work_list[i:i + batch_size], error_list[i:i + batch_size]
+
+    def close(self):
+        """
+        Closes the memory maps of the shard files.
+
+        :return: None
+        """
+        with self.shard_lock:
+            for buffer in self.shard_buffers.values():
+                buffer.close()
+            self.shard_buffers.clear()
+
+    def __len__(self):
+        return self.manifest["work_count"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds an offline index from local OpenAlex snapshot files, or "
+                                                 "looks up a DOI file in one.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="index gzipped JSON Lines snapshot files")
+    ingest_parser.add_argument("paths", nargs="+", help="snapshot files, or directories such as data/works")
+    ingest_parser.add_argument("-o", "--index-directory", required=True)
+    ingest_parser.add_argument("--field", action="append", dest="fields",
+                               help="additional Work object field to keep, e.g. referenced_works; may be repeated")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="ingest processes (default: one per CPU)")
+    lookup_parser = subparsers.add_parser("lookup", help="look up the DOIs of a file and print the number found")
+    lookup_parser.add_argument("filename", help="DOI file")
+    lookup_parser.add_argument("-i", "--index-directory", required=True)
+    lookup_parser.add_argument("--format", choices=["text", "csv", "ris", "bibtex"], default=None,
+                               help="input file format; guessed from the file extension by default")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        work_count = ingest_snapshot(args.paths, args.index_directory,
+                                     select_fields=WORK_FIELDS + [field for field in args.fields or []
+                                                                  if field not in WORK_FIELDS],
+                                     max_workers=args.workers)
+        print(f"{work_count} works indexed in {args.index_directory}.")
+    else:
+        from instrumentation import RunMetrics
+        from query_open_alex import clean_input_list, iter_input_file, query_open_alex
+
+        run_metrics = RunMetrics()
+        with run_metrics.stage("read"):
+            cleaned_input_list = clean_input_list(iter_input_file(args.filename, args.format))
+        with run_metrics.stage("fetch"):
+            work_store, identifier_with_error_list = query_open_alex(
+                cleaned_input_list, statistics=run_metrics, offline_index=OfflineIndex(args.index_directory))
+        print(f"{len(work_store)} works found, {len(identifier_with_error_list)} DOIs not in the index.")
+        print()
+        print(run_metrics.summary_table())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,175 +1,510 @@
+import argparse
+import csv
+import os
 import string
-from re import search
-import requests
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import numpy as np
 import re
-import time
 import itertools
 from collections import Counter
+# matplotlib and numpy are imported by the functions that draw plots, so importing this module (e.g. when the app
+# starts) does not load them.
+from fetch_engine import FetchEngine, FETCH_MAX_WORKERS, REQUESTS_PER_SECOND
+from instrumentation import RunMetrics
+from work_cache import WorkCache
+from work_store import WorkStore
+from work_aggregates import WorkAggregates, aggregate_works, display_frequency, remove_works
+from snapshot import load_snapshot, save_snapshot
+from topic_hierarchy import TopicHierarchy, build_topic_hierarchy, roll_up
+from authorship_analytics import build_authorship_network, create_authorship_network_plot
 
 
-def read_input_file(filename: str):
+INPUT_FORMAT_EXTENSIONS = {".txt": "text", ".csv": "csv", ".ris": "ris", ".bib": "bibtex", ".bibtex": "bibtex"}
+RIS_DOI_PATTERN = re.compile(r'^DO  - (.*)$')
+BIBTEX_DOI_PATTERN = re.compile(r'\bdoi\s*=\s*[{"]\s*([^}"]+?)\s*[}"]', re.IGNORECASE)
+
+
+def detect_input_format(filename: str):
+    """
+    Guesses the format of an input file from its extension.
+
+    :param filename: path to the input file
+    :return: "text", "csv" (Zotero CSV export), "ris" or "bibtex"
+    """
+    return INPUT_FORMAT_EXTENSIONS.get(os.path.splitext(filename)[1].lower(), "text")
+
+
+def iter_input_file(filename: str, input_format: str = None):
     """
-    Reads an input text file and returns it as a list.
+    Reads an input file line by line, yielding the DOI field of each entry without loading the whole file into memory.
 
     :param filename: path to the input file
+    :param input_format: "text" (one DOI per line), "csv" (Zotero CSV export with a "DOI" column), "ris" (DO tags) or
+    "bibtex" (doi fields); if None, the format is guessed from the file extension
+    :return: generator of DOIs as written in the file
+    """
+    if input_format is None:
+        input_format = detect_input_format(filename)
+    with open(filename, "r", encoding="utf-8-sig", errors="replace", newline="") as file:
+        if input_format == "csv":
+            for row in csv.DictReader(file):
+                yield row.get("DOI") or ""
+        elif input_format == "ris":
+            for line in file:
+                match = RIS_DOI_PATTERN.match(line.rstrip("\r\n"))
+                if match:
+                    yield match.group(1)
+        elif input_format == "bibtex":
+            for line in file:
+                for match in BIBTEX_DOI_PATTERN.finditer(line):
+                    yield match.group(1)
+        else:
+            for line in file:
+                yield line.rstrip("\r\n")
+
+
+def read_input_file(filename: str, input_format: str = "text"):
+    """
+    Reads an input file and returns it as a list. Use iter_input_file() to stream large files.
+
+    :param filename: path to the input file
+    :param input_format: see iter_input_file()
     :return: file contents as a list
     """
-    print(filename)
-    file = open(filename, "r")
-    input_data = file.read()
-    input_list = input_data.split("\n")
-    file.close()
-    return input_list
+    return list(iter_input_file(filename, input_format))
 
 
-def clean_input_list(input_list: list):
+def clean_input_list(input_list):
     """
-    Cleans common errors in input list to get DOIs in format "https://doi.org/10.XXX/XXX" or "doi:10.XXXX/XXX",
-    removing duplicates.
+    Cleans common errors in input list to get DOIs in the canonical format "https://doi.org/10.xxx/xxx", removing
+    duplicates in one pass and keeping the order of first appearance. DOIs are case-insensitive, so "10.X/ABC",
+    "doi:10.x/abc" and "https://doi.org/10.x/abc" are duplicates. Items that are not DOIs are kept as they are.
 
-    :param input_list: list of DOIs
+    :param input_list: list or iterable of DOIs, e.g. from iter_input_file()
     :return: cleaned list of DOIs
     """
     cleaned_input_list = []
+    seen_item_set = set()
     for item in input_list:
+        item = item.strip()
         if item == '':
             continue
-        elif re.search(r'^10\.', item):
-            search_item = f"https://doi.org/{item}"
-        elif re.search(r'^DOI:', item):
-            # OpenAlex can handle searching DOIs listed as "doi:10.XXXX/XXXX", but not with upper case "DOI:"
-            new_item = re.sub(r'DOI:', 'doi:', item, 1)
-            search_item = new_item
-        elif re.search(r'^doi.org', item):
-            new_item = re.sub(r'doi.org/', '', item, 1)
-            search_item = f"https://doi.org/{new_item}"
-        else:
-            search_item = item
-        cleaned_input_list.append(search_item.strip())
-        cleaned_input_list = list(set(cleaned_input_list))
+        doi = normalize_doi(item)
+        search_item = f"https://doi.org/{doi}" if doi is not None else item
+        if search_item not in seen_item_set:
+            seen_item_set.add(search_item)
+            cleaned_input_list.append(search_item)
     return cleaned_input_list
 
 
-def query_open_alex(cleaned_input_list: list):
+# Can be pointed at a local stand-in server, e.g. benchmarks/fake_open_alex.py.
+OPEN_ALEX_WORKS_URL = os.environ.get("OPEN_ALEX_WORKS_URL", "https://api.openalex.org/works")
+DOI_BATCH_SIZE = 50  # Number of DOIs sent in one pipe-joined "filter=doi:..." request.
+DOI_PAGE_SIZE = 200  # Maximum "per-page" value accepted by OpenAlex.
+# Work object attributes used by the analysis and plot functions, plus "id" and "doi" to match results to input
+# identifiers. Passed to OpenAlex as "select=" so only these fields are downloaded and decoded.
+WORK_FIELDS = ["id",
+               "doi",
+               "authorships",
+               "concepts",
+               "keywords",
+               "topics",
+               "type",
+               "publication_year",
+               "primary_location"]
+# Work object attributes stored by WorkStore.add_work().
+WORK_RESULT_FIELDS = ["authorships",
+                      "concepts",
+                      "keywords",
+                      "topics",
+                      "type",
+                      "publication_year",
+                      "primary_location"]
+CACHED_BATCH_SIZE = 500  # Number of cached works yielded per batch by iter_query_open_alex().
+DOI_PREFIX_PATTERN = re.compile(r'^(?:(?:https?://)?(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+
+
+def normalize_doi(identifier: str):
+    """
+    Normalizes a DOI to the bare, lower case form "10.XXXX/XXX" used to match OpenAlex results back to input
+    identifiers. DOIs are case-insensitive, so "10.X/ABC" and "https://doi.org/10.x/abc" normalize to the same value.
+
+    :param identifier: DOI in format "https://doi.org/10.XXX/XXX", "doi:10.XXXX/XXX" or "10.XXXX/XXX"
+    :return: normalized DOI, or None if the identifier is not a DOI
+    """
+    if identifier is None:
+        return None
+    doi = DOI_PREFIX_PATTERN.sub('', identifier.strip(), 1)
+    if not doi.startswith('10.'):
+        return None
+    return doi.lower()
+
+
+def project_work(result: dict, select_fields: list):
+    """
+    Keeps only the selected top-level fields of a Work object.
+
+    :param result: Work object from OpenAlex
+    :param select_fields: list of field names to keep, or None to keep every field
+    :return: projected Work object
+    """
+    if select_fields is None:
+        return result
+    return {field: result[field] for field in select_fields if field in result}
+
+
+def is_complete_work(result: dict, select_fields: list = None):
+    """
+    Checks that a Work object has every attribute stored by WorkStore.add_work() and every selected field.
+
+    :param result: Work object from OpenAlex, or an error response
+    :param select_fields: list of additional field names that must be present, or None
+    :return: True if the Work object is complete
+    """
+    return isinstance(result, dict) and all(field in result for field in WORK_RESULT_FIELDS + (select_fields or []))
+
+
+def fetch_single_work(engine: FetchEngine,
+                      identifier: str,
+                      select_fields: list = WORK_FIELDS,
+                      statistics: Counter = None):
+    """
+    Queries OpenAlex for one Work object at "/works/{identifier}".
+
+    :param engine: fetch engine used to send the request
+    :param identifier: DOI in format "https://doi.org/10.XXX/XXX" or "doi:10.XXXX/XXX"
+    :param select_fields: list of Work object fields to request, or None to request the full Work object
+    :param statistics: counter of the run, see FetchEngine.get_json()
+    :return: list of (identifier, Work object) pairs and list of identifiers with errors
+    """
+    params = {"select": ",".join(select_fields)} if select_fields is not None else None
+    try:
+        result = engine.get_json(f"{OPEN_ALEX_WORKS_URL}/{identifier}", params=params, statistics=statistics)
+        return [(identifier, result)], []
+    except Exception:
+        return [], [identifier]
+
+
+def fetch_work_batch(engine: FetchEngine,
+                     doi_to_identifiers: dict,
+                     select_fields: list = WORK_FIELDS,
+                     statistics: Counter = None):
+    """
+    Queries OpenAlex for a batch of DOIs with one pipe-joined "filter=doi:..." request. A batch has at most
+    DOI_BATCH_SIZE DOIs, fewer than DOI_PAGE_SIZE, so its results always fit on one page and no cursor is needed.
+    Every returned Work object is matched back to the input identifier(s) it came from. If the batch request fails,
+    the batch falls back to one query per identifier.
+
+    :param engine: fetch engine used to send the requests
+    :param doi_to_identifiers: dictionary of normalized DOIs (see normalize_doi()) to the input identifiers that
+    normalize to them
+    :param select_fields: list of Work object fields to request, or None to request full Work objects. "doi" is
+    always requested because it is needed to match results to identifiers.
+    :param statistics: counter of the run, see FetchEngine.get_json()
+    :return: list of (identifier, Work object) pairs and list of identifiers without a returned Work object
+    """
+    params = {"filter": "doi:" + "|".join(f"https://doi.org/{doi}" for doi in doi_to_identifiers),
+              "per-page": DOI_PAGE_SIZE}
+    if select_fields is not None:
+        params["select"] = ",".join(dict.fromkeys(["doi"] + list(select_fields)))
+    try:
+        results = engine.get_json(OPEN_ALEX_WORKS_URL, params=params, statistics=statistics)["results"]
+    except Exception:
+        work_list = []
+        identifier_with_error_list = []
+        for identifiers in doi_to_identifiers.values():
+            for identifier in identifiers:
+                single_work_list, single_error_list = fetch_single_work(engine, identifier, select_fields,
+                                                                        statistics)
+                work_list.extend(single_work_list)
+                identifier_with_error_list.extend(single_error_list)
+        return work_list, identifier_with_error_list
+
+    work_list = []
+    found_doi_set = set()
+    for result in results:
+        doi = normalize_doi(result.get("doi"))
+        if doi not in doi_to_identifiers or doi in found_doi_set:
+            continue
+        for identifier in doi_to_identifiers[doi]:
+            work_list.append((identifier, result))
+        found_doi_set.add(doi)
+
+    identifier_with_error_list = []
+    for doi, identifiers in doi_to_identifiers.items():
+        if doi not in found_doi_set:
+            identifier_with_error_list.extend(identifiers)
+    return work_list, identifier_with_error_list
+
+
+def iter_query_open_alex(cleaned_input_list: list,
+                         batch_size: int = DOI_BATCH_SIZE,
+                         max_workers: int = FETCH_MAX_WORKERS,
+                         requests_per_second: float = REQUESTS_PER_SECOND,
+                         engine: FetchEngine = None,
+                         cache: WorkCache = None,
+                         statistics: Counter = None,
+                         select_fields: list = WORK_FIELDS,
+                         offline_index=None):
+    """
+    Queries OpenAlex for attributes of items with specific DOIs, yielding results batch by batch as they arrive. See
+    query_open_alex() for how identifiers are looked up.
+
+    Every input identifier appears in exactly one yielded batch, either with its Work object or in the error list, so
+    the number of identifiers yielded so far measures progress. Closing the generator early cancels queued requests.
+    At most engine.max_workers requests of one query are queued on the engine at a time, so queries sharing an engine
+    take turns instead of waiting for each other to finish.
+
+    :param cleaned_input_list: input list of DOIs in format "https://doi.org/10.XXX/XXX" or "doi:10.XXXX/XXX"
+    :param batch_size: maximum number of DOIs per request, up to 50; 1 queries each identifier separately
+    :param max_workers: number of concurrent requests, used if no engine is given
+    :param requests_per_second: request rate cap, used if no engine is given
+    :param engine: shared fetch engine; if None, a fetch engine is created for this query and closed afterward
+    :param cache: persistent Work object cache (see work_cache.WorkCache), or None to always query OpenAlex
+    :param statistics: counter updated with "cache_hits" and "cache_misses", the number of identifiers served from
+    the cache and the number queried from OpenAlex, and with the request counts of FetchEngine.get_json(); pass an
+    instrumentation.RunMetrics to also record request latencies
+    :param select_fields: list of Work object fields to request, or None to request full Work objects. Must include
+    the fields read by WorkStore.add_work().
+    :param offline_index: offline_index.OfflineIndex of a local OpenAlex snapshot to look the DOIs up in instead of
+    OpenAlex, or None; the engine and cache are then not used
+    :return: generator of (list of (identifier, Work object) pairs, list of identifiers with errors) tuples
+    """
+    if offline_index is not None:
+        yield from offline_index.iter_query(cleaned_input_list, statistics=statistics, select_fields=select_fields)
+        return
+    identifier_list = cleaned_input_list
+    if statistics is None:
+        statistics = Counter()
+
+    if cache is not None:
+        cached_work_dictionary = cache.get_many(list({normalize_doi(identifier) for identifier in identifier_list}
+                                                     - {None}))
+        cached_work_list = []
+        uncached_identifier_list = []
+        for identifier in identifier_list:
+            result = cached_work_dictionary.get(normalize_doi(identifier))
+            # Entries cached with a narrower projection than requested count as misses.
+            if result is None or not is_complete_work(result, select_fields):
+                uncached_identifier_list.append(identifier)
+            else:
+                cached_work_list.append((identifier, result))
+        statistics["cache_hits"] += len(cached_work_list)
+        statistics["cache_misses"] += len(uncached_identifier_list)
+        for i in range(0, len(cached_work_list), CACHED_BATCH_SIZE):
+            yield cached_work_list[i:i + CACHED_BATCH_SIZE], []
+        identifier_list = uncached_identifier_list
+
+    batch_size = max(1, min(batch_size, DOI_BATCH_SIZE))
+    doi_to_identifiers = {}
+    single_identifier_list = []
+    for identifier in identifier_list:
+        doi = normalize_doi(identifier)
+        # Commas separate filters and pipes separate values in OpenAlex filters, so those DOIs are queried singly.
+        if batch_size == 1 or doi is None or "," in doi or "|" in doi:
+            single_identifier_list.append(identifier)
+        else:
+            doi_to_identifiers.setdefault(doi, []).append(identifier)
+
+    doi_batch_list = list(doi_to_identifiers.items())
+    fetch_task_list = [(fetch_work_batch, dict(doi_batch_list[i:i + batch_size]))
+                       for i in range(0, len(doi_batch_list), batch_size)]
+    fetch_task_list.extend((fetch_single_work, identifier) for identifier in single_identifier_list)
+    if not fetch_task_list:
+        return
+    cache_fields = select_fields if select_fields is not None else WORK_FIELDS
+
+    own_engine = engine is None
+    if own_engine:
+        engine = FetchEngine(max_workers=max_workers, requests_per_second=requests_per_second)
+    try:
+        for fetch_task, (work_list, error_list) in engine.map_unordered(
+                lambda task: task[0](engine, task[1], select_fields, statistics), fetch_task_list,
+                max_in_flight=engine.max_workers):
+            complete_work_list = []
+            fetched_work_dictionary = {}
+            for identifier, result in work_list:
+                if not is_complete_work(result):
+                    error_list.append(identifier)
+                    continue
+                complete_work_list.append((identifier, result))
+                doi = normalize_doi(identifier)
+                if doi is not None:
+                    fetched_work_dictionary[doi] = project_work(result, cache_fields)
+            if cache is not None and fetched_work_dictionary:
+                cache.put_many(fetched_work_dictionary)
+            yield complete_work_list, error_list
+    finally:
+        if own_engine:
+            engine.close()
+
+
+def query_open_alex(cleaned_input_list: list,
+                    batch_size: int = DOI_BATCH_SIZE,
+                    max_workers: int = FETCH_MAX_WORKERS,
+                    requests_per_second: float = REQUESTS_PER_SECOND,
+                    engine: FetchEngine = None,
+                    cache: WorkCache = None,
+                    statistics: Counter = None,
+                    select_fields: list = WORK_FIELDS,
+                    work_store: WorkStore = None,
+                    offline_index=None):
     """
     Queries OpenAlex for attributes of items with specific DOIs. See OpenAlex Work Object documentation for more
     details: https://docs.openalex.org/api-entities/works/work-object.
 
+    DOIs are looked up in batches of up to batch_size per request using OpenAlex's multi-DOI filter. Identifiers that
+    are not DOIs, or that cannot be pipe-joined into a filter, are looked up one at a time. Requests run concurrently
+    on a fetch engine (see fetch_engine.FetchEngine) that caps the request rate and backs off when throttled. If a
+    cache is given, DOIs found in it are not queried and newly fetched Work objects are added to it. Only the fields
+    in select_fields are requested from OpenAlex and stored in the cache.
+
+    Fetched works are collected in a columnar WorkStore (see work_store.WorkStore), or added to the given one, e.g. to
+    update a previous result, see diff_input_list(). To receive results as they arrive, use iter_query_open_alex()
+    instead.
+
     :param cleaned_input_list: input list of DOIs in format "https://doi.org/10.XXX/XXX" or "doi:10.XXXX/XXX"
-    :return: list of dictionaries with attributes for Work objects from returned queries in OpenAlex.
+    :param batch_size: maximum number of DOIs per request, up to 50; 1 queries each identifier separately
+    :param max_workers: number of concurrent requests, used if no engine is given
+    :param requests_per_second: request rate cap, used if no engine is given
+    :param engine: shared fetch engine; if None, a fetch engine is created for this query and closed afterward
+    :param cache: persistent Work object cache (see work_cache.WorkCache), or None to always query OpenAlex
+    :param statistics: counter updated with "cache_hits" and "cache_misses", the number of identifiers served from
+    the cache and the number queried from OpenAlex, and with the request counts of FetchEngine.get_json(); pass an
+    instrumentation.RunMetrics to also record request latencies
+    :param select_fields: list of Work object fields to request, or None to request full Work objects. Must include
+    the fields read by WorkStore.add_work().
+    :param work_store: WorkStore to add the fetched works to, or None for a new one
+    :param offline_index: offline_index.OfflineIndex to look the DOIs up in instead of OpenAlex, or None
+    :return: WorkStore with attributes for Work objects from returned queries in OpenAlex, and list of identifiers
+    with errors.
     """
-    identifier_list = cleaned_input_list
+    if work_store is None:
+        work_store = WorkStore()
     identifier_with_error_list = []
 
-    authorships_dictionary = {}
-    concepts_dictionary = {}
-    keywords_dictionary = {}
-    topics_dictionary = {}
-    type_dictionary = {}
-    publication_year_dictionary = {}
-    primary_location_dictionary = {}
-
-    for identifier in identifier_list:
-        try:
-            response = requests.get(f"https://api.openalex.org/works/{identifier}")
-            result = response.json()
-            authorships_dictionary[identifier] = result["authorships"]
-            concepts_dictionary[identifier] = result["concepts"]
-            keywords_dictionary[identifier] = result["keywords"]
-            topics_dictionary[identifier] = result["topics"]
-            type_dictionary[identifier] = result["type"]
-            publication_year_dictionary[identifier] = result["publication_year"]
-            primary_location_dictionary[identifier] = result["primary_location"]
-            time.sleep(0.1)  # OpenAlex has a limit of max 10 requests per second.
-        except Exception:
-            identifier_with_error_list.append(identifier)
-            continue
+    for work_list, error_list in iter_query_open_alex(cleaned_input_list,
+                                                      batch_size=batch_size,
+                                                      max_workers=max_workers,
+                                                      requests_per_second=requests_per_second,
+                                                      engine=engine,
+                                                      cache=cache,
+                                                      statistics=statistics,
+                                                      select_fields=select_fields,
+                                                      offline_index=offline_index):
+        identifier_with_error_list.extend(error_list)
+        for identifier, result in work_list:
+            work_store.add_work(identifier, result)
 
     # print(f"DOIs with errors: {len(identifier_with_error_list)}")
     # print(f"List of identifiers with errors: {identifier_with_error_list}")
 
-    return (authorships_dictionary,
-            concepts_dictionary,
-            keywords_dictionary,
-            topics_dictionary,
-            type_dictionary,
-            publication_year_dictionary,
-            primary_location_dictionary,
-            identifier_with_error_list)
-
-
-def create_alphabet_tick_labels():
-    alphabet = string.ascii_letters
-    alphabet_tick_labels_list = []
-    for i in range(len(alphabet)):
-        alphabet_tick_labels_list.append(alphabet[i])
-    for j in range(len(alphabet)):
-        for k in range(len(alphabet)):
-            alphabet_tick_labels_list.append(alphabet[j] + alphabet[k])
-    return alphabet_tick_labels_list
-
-
-def print_for_testing(authorships_dictionary,
-                      concepts_dictionary,
-                      keywords_dictionary,
-                      topics_dictionary,
-                      type_dictionary,
-                      publication_year_dictionary,
-                      primary_location_dictionary,
-                      identifier_with_error_list):
+    return work_store, identifier_with_error_list
+
+
+def diff_input_list(work_store: WorkStore, cleaned_input_list: list):
+    """
+    Compares an edited input list with the works of a previous query, so that only the change has to be queried.
+    Identifiers that had errors before are not in the store and are queried again.
+
+    :param work_store: WorkStore of the previous query
+    :param cleaned_input_list: new cleaned input list, see clean_input_list()
+    :return: list of identifiers to query, in input order, and list of identifiers of works to remove
+    """
+    input_set = set(cleaned_input_list)
+    added_list = [identifier for identifier in cleaned_input_list if identifier not in work_store]
+    removed_list = [identifier for identifier in work_store.identifiers if identifier not in input_set]
+    return added_list, removed_list
+
+
+CHART_TOP_CATEGORIES = 40  # Venues, keywords or concepts drawn as bars; the rest are summed into one "Other" bar.
+CHART_MAX_HEIGHT = 24.0  # Maximum figure height in inches, however many categories there are.
+CHART_MAX_WIDTH = 18.0  # Maximum figure width in inches.
+KEYWORD_CHART_TOP_CATEGORIES = 25
+CONCEPT_CHART_TOP_CATEGORIES = 20
+TOPIC_CHART_TOP_CATEGORIES = 25
+TOPIC_LEVEL_NAMES = {"domain": "domains", "field": "fields", "subfield": "subfields", "topic": "topics"}
+
+alphabet_tick_label_cache = []
+
+
+def iter_alphabet_tick_labels():
+    """
+    Generates tick labels without an upper bound: a ... Z, then aa ... ZZ, then aaa ... ZZZ and so on.
+
+    :return: generator of tick label strings
+    """
+    for length in itertools.count(1):
+        for letters in itertools.product(string.ascii_letters, repeat=length):
+            yield "".join(letters)
+
+
+def create_alphabet_tick_labels(count: int = len(string.ascii_letters) * (len(string.ascii_letters) + 1)):
+    """
+    Returns the first tick labels of iter_alphabet_tick_labels(). Labels are generated once and cached, so repeated
+    plots only extend the cache when they need more labels than before.
+
+    :param count: number of labels; by default every label of one or two letters
+    :return: list of tick label strings
+    """
+    if len(alphabet_tick_label_cache) < count:
+        alphabet_tick_label_cache.extend(itertools.islice(iter_alphabet_tick_labels(),
+                                                          len(alphabet_tick_label_cache), count))
+    return alphabet_tick_label_cache[:count]
+
+
+def top_categories(sorted_frequency: dict, top_count: int, category_name: str):
+    """
+    Keeps the most frequent categories of a frequency table and sums the rest into one "Other" category, so plots
+    draw a bounded number of bars.
+
+    :param sorted_frequency: frequency dictionary sorted by ascending frequency, see aggregate_works()
+    :param top_count: number of categories to keep
+    :param category_name: plural name of the categories, e.g. "venues", used in the "Other" label
+    :return: frequency dictionary in the same order, with the "Other" category first; the table itself if it has no
+    more than top_count + 1 categories
+    """
+    if len(sorted_frequency) <= top_count + 1:
+        return sorted_frequency
+    frequency_list = list(sorted_frequency.items())
+    other_list = frequency_list[:-top_count]
+    other_label = f"Other ({len(other_list)} {category_name})"
+    return {other_label: sum(frequency for _, frequency in other_list), **dict(frequency_list[-top_count:])}
+
+
+def bar_chart_height(bar_count: int, inches_per_bar: float, minimum_height: float = 6.0):
+    """
+    :param bar_count: number of bars of a horizontal bar chart
+    :param inches_per_bar: height per bar
+    :param minimum_height: smallest height in inches
+    :return: figure height in inches, at most CHART_MAX_HEIGHT
+    """
+    return min(CHART_MAX_HEIGHT, max(minimum_height, bar_count * inches_per_bar))
+
+
+def print_for_testing(work_store: WorkStore, identifier_with_error_list: list):
     """
     Prints query output when needed for testing.
 
-    :param authorships_dictionary: dictionary of authorships for DOIs from OpenAlex
-    :param concepts_dictionary: dictionary of concepts for DOIs from OpenAlex
-    :param keywords_dictionary: dictionary of keywords for DOIs from OpenAlex
-    :param topics_dictionary: dictionary of topics for DOIs from OpenAlex
-    :param type_dictionary: dictionary of item type for DOIs from OpenAlex
-    :param publication_year_dictionary: dictionary of publication year for DOIs from OpenAlex
-    :param primary_location_dictionary: dictionary of primary location for DOIs from OpenAlex
-    :param identifier_with_error_list: dictionary of identifier with errors when querying OpenAlex
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param identifier_with_error_list: list of identifiers with errors when querying OpenAlex
     :return: print
     """
-    print(authorships_dictionary)
-    print(concepts_dictionary)
-    print(keywords_dictionary)
-    print(topics_dictionary)
-    print(type_dictionary)
-    print(publication_year_dictionary)
-    print(primary_location_dictionary)
+    for dictionary in work_store.to_dictionaries():
+        print(dictionary)
     print(identifier_with_error_list)
 
 
-def create_type_frequency_plot(type_dictionary: dict, primary_location_dictionary: dict):
+def create_type_frequency_bar_chart(work_aggregates: WorkAggregates):
     """
-    Creates frequency plot for item types.
+    Creates frequency bar chart for item types.
 
-    :param type_dictionary: dictionary of item type for DOIs from OpenAlex
-    :param primary_location_dictionary: dictionary of primary location for DOIs from OpenAlex. Used to separate
-    conference proceedings from journal articles.
-    :return: plot of item type frequency, pie chart of item type frequency, sorted frequency dictionary, and
-    list of items with type None.
+    :param work_aggregates: frequency tables from aggregate_works()
+    :return: plot of item type frequency
     """
-    type_list = []
-    type_none_list = []
-    for doi_key, response_value in type_dictionary.items():
-        if response_value is None:
-            type_none_list.append(doi_key)
-        elif response_value == 'article' and primary_location_dictionary[doi_key]['source'] is not None:
-            if primary_location_dictionary[doi_key]['source']['type'] == 'journal':
-                article_type = 'journal\narticle'
-                type_list.append(article_type)
-            elif primary_location_dictionary[doi_key]['source']['type'] == 'conference':
-                article_type = 'conference\nproceeding'
-                type_list.append(article_type)
-        else:
-            type_list.append(response_value)
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
 
-    type_frequency = Counter(type_list)
-    sorted_type_frequency = dict(sorted(type_frequency.items(), key=lambda x: (x[1], x[0]), reverse=True))
+    sorted_type_frequency = work_aggregates.type_frequency
+    type_none_list = work_aggregates.type_none_list
 
     fig_width = max(6.0, len(sorted_type_frequency) * 0.5)
     fig_height = fig_width
@@ -179,7 +514,8 @@ def create_type_frequency_plot(type_dictionary: dict, primary_location_dictionar
     ax1.set_title("Frequency of Item Type(s)")
     plt.figtext(0.01,
                 0.01,
-                f'Excludes {len(type_none_list)} items with None value out of {len(type_dictionary)} total items',
+                f'Excludes {len(type_none_list)} items with None value '
+                f'out of {work_aggregates.total_count} total items',
                 horizontalalignment='left',
                 size='x-small')
     ax1.set_xlabel("Item Type")
@@ -189,6 +525,24 @@ def create_type_frequency_plot(type_dictionary: dict, primary_location_dictionar
     ax1.bar_label(ax1.containers[0], label_type='edge', padding=0.5)
     # plt.show()
 
+    return fig1
+
+
+def create_type_frequency_pie_chart(work_aggregates: WorkAggregates):
+    """
+    Creates frequency pie chart for item types.
+
+    :param work_aggregates: frequency tables from aggregate_works()
+    :return: pie chart of item type frequency
+    """
+    import matplotlib.pyplot as plt
+
+    sorted_type_frequency = work_aggregates.type_frequency
+    type_none_list = work_aggregates.type_none_list
+
+    fig_width = max(6.0, len(sorted_type_frequency) * 0.5)
+    fig_height = fig_width
+
     label_list = []
     alphabet_list = []
     alphabet = create_alphabet_tick_labels()
@@ -208,32 +562,43 @@ def create_type_frequency_plot(type_dictionary: dict, primary_location_dictionar
     ax2.set_title("Frequency of Item Type(s)")
     plt.figtext(0.01,
                 0.01,
-                f'Excludes {len(type_none_list)} items with None value out of {len(type_dictionary)} total items',
+                f'Excludes {len(type_none_list)} items with None value '
+                f'out of {work_aggregates.total_count} total items',
                 horizontalalignment='left',
                 size='x-small')
     ax2.pie(sorted_type_frequency.values(), labels=alphabet_list, autopct='%1.1f%%')
     plt.legend(labels=label_list, loc='upper right')
     # plt.show()
 
-    return fig1, fig2, sorted_type_frequency, type_none_list
+    return fig2
+
 
+def create_type_frequency_plot(work_aggregates: WorkAggregates):
+    """
+    Creates frequency plot for item types. Articles are separated into journal articles and conference proceedings
+    using the type of their primary location, see aggregate_works().
 
-def create_year_frequency_plot(publication_year_dictionary: dict):
+    :param work_aggregates: frequency tables from aggregate_works()
+    :return: plot of item type frequency, pie chart of item type frequency, sorted frequency dictionary, and
+    list of items with type None.
+    """
+    return (create_type_frequency_bar_chart(work_aggregates),
+            create_type_frequency_pie_chart(work_aggregates),
+            work_aggregates.type_frequency,
+            work_aggregates.type_none_list)
+
+
+def create_year_frequency_plot(work_aggregates: WorkAggregates):
     """
     Creates frequency plot for publication years.
-    :param publication_year_dictionary: dictionary of publication year for DOIs from OpenAlex
+    :param work_aggregates: frequency tables from aggregate_works()
     :return: publication year frequency plot and sorted frequency dictionary
     """
-    year_list = []
-    year_none_list = []
-    for doi_key, response_value in publication_year_dictionary.items():
-        if response_value is None:
-            year_none_list.append(doi_key)
-        else:
-            year_list.append(response_value)
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
 
-    year_frequency = Counter(year_list)
-    sorted_year_frequency = dict(sorted(year_frequency.items(), key=lambda x: (x[1], x[0]), reverse=True))
+    sorted_year_frequency = work_aggregates.year_frequency
+    year_none_list = work_aggregates.year_none_list
 
     fig_width = max(6.0, len(sorted_year_frequency) * 0.5)
     fig_height = fig_width * 0.6
@@ -244,7 +609,7 @@ def create_year_frequency_plot(publication_year_dictionary: dict):
     plt.figtext(0.01,
                 0.01,
                 f'Excludes {len(year_none_list)} items with None value '
-                f'out of {len(publication_year_dictionary)} total items',
+                f'out of {work_aggregates.total_count} total items',
                 horizontalalignment='left',
                 size='x-small')
     ax3.set_xlabel("Publication Year")
@@ -257,34 +622,33 @@ def create_year_frequency_plot(publication_year_dictionary: dict):
     return fig3, sorted_year_frequency
 
 
-def create_primary_location_frequency_plot(primary_location_dictionary: dict):
+def create_primary_location_frequency_plot(work_aggregates: WorkAggregates, top_count: int = CHART_TOP_CATEGORIES):
     """
-    Creates frequency plot for primary locations (venues).
+    Creates frequency plot for primary locations (venues). Only the top_count most frequent venues are drawn; the
+    others are summed into one "Other" bar, so the figure size is bounded.
 
-    :param primary_location_dictionary: dictionary of primary locations for DOIs from OpenAlex
-    :return: plot of location frequency, sorted frequency dictionary, and list of items with primary location None.
+    :param work_aggregates: frequency tables from aggregate_works()
+    :param top_count: number of venues drawn as their own bar
+    :return: plot of location frequency, sorted frequency dictionary keyed by canonical venue key (see
+    WorkAggregates.primary_location_names), and list of items with primary location None.
     """
-    primary_location_list = []
-    primary_location_none_list = []
-    for doi_key, response_value in primary_location_dictionary.items():
-        if response_value["source"] is None:
-            primary_location_none_list.append(doi_key)
-        else:
-            source = response_value["source"]["display_name"]
-            primary_location_list.append(source)
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    import numpy as np
 
-    primary_location_frequency = Counter(primary_location_list)
-    sorted_primary_location_frequency = dict(sorted(primary_location_frequency.items(),
-                                                    key=lambda x: (x[1], x[0].lower())))
+    sorted_primary_location_frequency = work_aggregates.primary_location_frequency
+    primary_location_none_list = work_aggregates.primary_location_none_list
+    plotted_frequency = display_frequency(top_categories(sorted_primary_location_frequency, top_count, "publishers"),
+                                          work_aggregates.primary_location_names)
 
-    fig_height = max(6.0, len(sorted_primary_location_frequency) * 0.462)
-    fig_width = max(9.0, fig_height * 0.7)
+    fig_height = bar_chart_height(len(plotted_frequency), 0.462)
+    fig_width = min(CHART_MAX_WIDTH, max(9.0, fig_height * 0.7))
 
     label_list = []
     alphabet_list = []
-    alphabet = create_alphabet_tick_labels()
-    count = len(sorted_primary_location_frequency) - 1
-    for key in sorted_primary_location_frequency.keys():
+    alphabet = create_alphabet_tick_labels(len(plotted_frequency))
+    count = len(plotted_frequency) - 1
+    for key in plotted_frequency.keys():
         truncated_key = key[:67] + "..." if len(key) > 67 else key
         label = f"{alphabet[count]} {truncated_key}"
         label_list.append(label)
@@ -292,9 +656,9 @@ def create_primary_location_frequency_plot(primary_location_dictionary: dict):
         count = count - 1
 
     fig6, ax6 = plt.subplots(figsize=(fig_width, fig_height), layout="constrained")
-    ax6.barh(sorted_primary_location_frequency.keys(),
-             sorted_primary_location_frequency.values(),
-             color=plt.cm.viridis(np.linspace(0, 1, len(sorted_primary_location_frequency.values()))),
+    ax6.barh(plotted_frequency.keys(),
+             plotted_frequency.values(),
+             color=plt.cm.viridis(np.linspace(0, 1, len(plotted_frequency))),
              label=label_list,
              tick_label=alphabet_list)
     ax6.set_title("Frequency of Publishers")
@@ -303,10 +667,10 @@ def create_primary_location_frequency_plot(primary_location_dictionary: dict):
     plt.figtext(0.01,
                 0.01,
                 f'Excludes {len(primary_location_none_list)} items with None value '
-                f'out of {len(primary_location_dictionary)} total items',
+                f'out of {work_aggregates.total_count} total items',
                 horizontalalignment='left',
                 size='x-small')
-    y_max = len(sorted_primary_location_frequency)
+    y_max = len(plotted_frequency)
     plt.ylim(-1, y_max)
     ax6.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
     ax6.legend(reverse=True, loc='lower right', framealpha=1, fontsize='x-small')
@@ -316,122 +680,233 @@ def create_primary_location_frequency_plot(primary_location_dictionary: dict):
     return fig6, sorted_primary_location_frequency, primary_location_none_list
 
 
-def create_keyword_frequency_plot(keywords_dictionary: dict):
+def create_keyword_frequency_plot(work_aggregates: WorkAggregates, top_count: int = KEYWORD_CHART_TOP_CATEGORIES):
     """
-    Creates frequency plot for keywords.
+    Creates frequency plot for the most frequent keywords, with the others summed into one "Other" bar.
 
-    :param keywords_dictionary: dictionary of keywords for DOIs from OpenAlex
-    :return: plot of keyword frequency, sorted frequency dictionary, and list of items with keyword None.
+    :param work_aggregates: frequency tables from aggregate_works()
+    :param top_count: number of keywords drawn as their own bar
+    :return: plot of keyword frequency, sorted frequency dictionary keyed by canonical keyword key (see
+    WorkAggregates.keyword_names), and list of items with keyword None.
     """
-    keyword_list = []
-    keyword_none_list = []
-    for doi_key, response_value in keywords_dictionary.items():
-        if response_value is None:
-            keyword_none_list.append(doi_key)
-        else:
-            for sub_item in response_value:
-                keyword_list.append(sub_item["display_name"])
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
 
-    keyword_frequency = Counter(keyword_list)
-    sorted_keyword_frequency = dict(sorted(keyword_frequency.items(), key=lambda x: (x[1], x[0])))
+    sorted_keyword_frequency = work_aggregates.keyword_frequency
+    keyword_none_list = work_aggregates.keyword_none_list
+    plotted_frequency = display_frequency(top_categories(sorted_keyword_frequency, top_count, "keywords"),
+                                          work_aggregates.keyword_names)
 
-    fig_height = max(6.0, len(sorted_keyword_frequency) * 0.25)
-    fig_width = max(4.0, fig_height * 1)
+    fig_height = bar_chart_height(len(plotted_frequency), 0.25)
+    fig_width = min(CHART_MAX_WIDTH, max(4.0, fig_height * 1))
 
     fig4, ax4 = plt.subplots(figsize=(fig_width, fig_height), layout="constrained")
-    ax4.barh(list(sorted_keyword_frequency.keys())[-25:], list(sorted_keyword_frequency.values())[-25:])
+    ax4.barh(list(plotted_frequency.keys()), list(plotted_frequency.values()))
     ax4.set_title("Most Frequent of Keywords\n")
     plt.figtext(0.01,
                 0.01,
                 f'Excludes {len(keyword_none_list)} items with None value '
-                f'out of {len(keywords_dictionary)} total items',
+                f'out of {work_aggregates.total_count} total items',
                 horizontalalignment='left',
                 size='x-small')
     ax4.set_ylabel("Keyword")
     ax4.set_xlabel("Frequency")
     ax4.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-    y_max = len(sorted_keyword_frequency)
-    plt.ylim(-1, 25)
+    y_max = max(top_count, len(plotted_frequency))
+    plt.ylim(-1, y_max)
     ax4.bar_label(ax4.containers[0], label_type='edge', padding=0.5)
     # plt.show()
     return fig4, sorted_keyword_frequency, keyword_none_list
 
 
-def create_concepts_frequency_plot(concepts_dictionary: dict):
+def create_concepts_frequency_plot(work_aggregates: WorkAggregates, top_count: int = CONCEPT_CHART_TOP_CATEGORIES):
     """
-    Creates frequency plot for most and least frequent concepts.
+    Creates frequency plot for the most frequent concepts, with the others summed into one "Other" bar.
 
-    :param concepts_dictionary: dictionary of concepts for DOIs from OpenAlex
-    :return: plot of concept frequency, sorted frequency dictionary, and list of items with concept None.
+    :param work_aggregates: frequency tables from aggregate_works()
+    :param top_count: number of concepts drawn as their own bar
+    :return: plot of concept frequency, sorted frequency dictionary keyed by canonical concept key (see
+    WorkAggregates.concepts_names), and list of items with concept None.
     """
-    concepts_list = []
-    concepts_none_list = []
-    for doi_key, response_value in concepts_dictionary.items():
-        if response_value is None:
-            concepts_none_list.append(doi_key)
-        else:
-            for sub_item in response_value:
-                concepts_list.append(sub_item["display_name"])
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
 
-    concepts_frequency = Counter(concepts_list)
-    sorted_concepts_frequency = dict(sorted(concepts_frequency.items(), key=lambda x: (x[1], x[0])))
+    sorted_concepts_frequency = work_aggregates.concepts_frequency
+    concepts_none_list = work_aggregates.concepts_none_list
+    plotted_frequency = display_frequency(top_categories(sorted_concepts_frequency, top_count, "concepts"),
+                                          work_aggregates.concepts_names)
 
     fig_width = 6.0
-    fig_height = 5.0
+    fig_height = bar_chart_height(len(plotted_frequency), 0.25, minimum_height=5.0)
 
     fig5, ax1 = plt.subplots(figsize=(fig_width, fig_height), layout="tight")
     plt.figtext(0.01,
                 0.01,
                 f'Excludes {len(concepts_none_list)} items with None value '
-                f'out of {len(concepts_dictionary)} total items',
+                f'out of {work_aggregates.total_count} total items',
                 horizontalalignment='left',
                 size='x-small')
-    ax1.barh(list(sorted_concepts_frequency.keys())[-20:], list(sorted_concepts_frequency.values())[-20:])
-    ax1.set_title("Twenty Most Frequent Concepts\n(with alphabetical ordering)")
+    ax1.barh(list(plotted_frequency.keys()), list(plotted_frequency.values()))
+    ax1.set_title(f"{top_count} Most Frequent Concepts\n(with alphabetical ordering)")
     ax1.set_ylabel("Concept")
     ax1.set_xlabel("Frequency")
     ax1.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
     ax1.tick_params(axis='x', labelbottom=True)
     ax1.tick_params(axis='y', labelsize='x-small')
-    ax1.set_ylim(-1, 20)
+    ax1.set_ylim(-1, max(top_count, len(plotted_frequency)))
     ax1.bar_label(ax1.containers[0], label_type='edge', padding=0.5)
     # plt.show()
 
     return fig5, sorted_concepts_frequency, concepts_none_list
 
 
+def create_topic_frequency_plot(topic_hierarchy: TopicHierarchy,
+                                level: str = "domain",
+                                parent_level: str = None,
+                                parent_label: str = None,
+                                top_count: int = TOPIC_CHART_TOP_CATEGORIES):
+    """
+    Creates frequency plot for one level of the topic hierarchy, optionally drilled down into one parent, e.g. the
+    fields of one domain. Counts every topic assigned to a work, see topic_hierarchy.roll_up().
+
+    :param topic_hierarchy: index from build_topic_hierarchy()
+    :param level: level to plot: "domain", "field", "subfield" or "topic"
+    :param parent_level: broader level to drill down from, or None for all topics
+    :param parent_label: display name of the parent at parent_level
+    :param top_count: number of categories drawn as their own bar
+    :return: plot of topic frequency and sorted frequency dictionary
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+
+    sorted_topic_frequency = roll_up(topic_hierarchy, level, parent_level, parent_label)
+    plotted_frequency = top_categories(sorted_topic_frequency, top_count, TOPIC_LEVEL_NAMES[level])
+
+    fig_height = bar_chart_height(len(plotted_frequency), 0.3)
+    fig_width = min(CHART_MAX_WIDTH, max(8.0, fig_height))
+
+    fig8, ax8 = plt.subplots(figsize=(fig_width, fig_height), layout="constrained")
+    ax8.barh(list(plotted_frequency.keys()), list(plotted_frequency.values()))
+    ax8.set_title(f"Frequency of Topic {level.capitalize()}s"
+                  + (f"\nwithin {parent_level} {parent_label}" if parent_level is not None else ""))
+    plt.figtext(0.01,
+                0.01,
+                f'Excludes {topic_hierarchy.none_count} items with None value '
+                f'out of {topic_hierarchy.work_count} total items',
+                horizontalalignment='left',
+                size='x-small')
+    ax8.set_ylabel(level.capitalize())
+    ax8.set_xlabel("Frequency")
+    ax8.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    ax8.tick_params(axis='y', labelsize='x-small')
+    if ax8.containers:
+        ax8.bar_label(ax8.containers[0], label_type='edge', padding=0.5)
+    # plt.show()
+
+    return fig8, sorted_topic_frequency
+
+
 def main():
-    print("Reading input list...")
-    input_list = read_input_file(filename="data/zotero-export.txt")
-    print("Input list read.")
-    print("Cleaning input list...")
-    cleaned_input_list = clean_input_list(input_list)
-    print("Input list cleaned.")
-    print("Querying OpenAlex...")
-    authorships_dictionary, concepts_dictionary, keywords_dictionary, topics_dictionary, type_dictionary, \
-        publication_year_dictionary, primary_location_dictionary, identifier_with_error_list \
-        = query_open_alex(cleaned_input_list)
-    print("OpenAlex queried.")
+    parser = argparse.ArgumentParser(description="Queries OpenAlex for the DOIs in a file and plots the results.")
+    parser.add_argument("filename", nargs="?", default="data/zotero-export.txt", help="DOI file")
+    parser.add_argument("--load-snapshot", metavar="PATH", help="plot a saved snapshot instead of querying OpenAlex")
+    parser.add_argument("--save-snapshot", metavar="PATH", help="save the query result as a snapshot")
+    parser.add_argument("--update", action="store_true",
+                        help="with --load-snapshot, update the snapshot to the DOI file, querying only added DOIs")
+    parser.add_argument("--offline-index", metavar="DIRECTORY",
+                        help="look DOIs up in an offline index of a local OpenAlex snapshot (see offline_index.py) "
+                             "instead of querying OpenAlex")
+    parser.add_argument("--format", choices=["text", "csv", "ris", "bibtex"], default=None,
+                        help="input file format; guessed from the file extension by default")
+    parser.add_argument("--metrics-json", metavar="PATH", help="write the run metrics as JSON")
+    parser.add_argument("--metrics-prometheus", metavar="PATH", help="write the run metrics in Prometheus text format")
+    args = parser.parse_args()
+    run_metrics = RunMetrics()
+    offline_index = None
+    if args.offline_index:
+        from offline_index import OfflineIndex
+
+        offline_index = OfflineIndex(args.offline_index)
+
+    if args.load_snapshot:
+        print("Loading snapshot...")
+        with run_metrics.stage("read"):
+            loaded_snapshot = load_snapshot(args.load_snapshot)
+        work_store = loaded_snapshot['work_store']
+        identifier_with_error_list = loaded_snapshot['identifier_with_error_list']
+        print(f"Snapshot of {loaded_snapshot['created']} loaded.")
+    if args.load_snapshot and args.update:
+        print("Reading input list...")
+        with run_metrics.stage("read"):
+            input_list = read_input_file(filename=args.filename, input_format=args.format)
+        with run_metrics.stage("clean"):
+            added_list, removed_list = diff_input_list(work_store, clean_input_list(input_list))
+            work_store = remove_works(work_store, removed_list)
+        print(f"{len(added_list)} DOIs added and {len(removed_list)} removed since the snapshot.")
+        print("Querying OpenAlex...")
+        with run_metrics.stage("fetch"):
+            work_store, identifier_with_error_list = query_open_alex(added_list,
+                                                                     cache=WorkCache(),
+                                                                     statistics=run_metrics,
+                                                                     work_store=work_store,
+                                                                     offline_index=offline_index)
+        print("OpenAlex queried.")
+    elif not args.load_snapshot:
+        print("Reading input list...")
+        with run_metrics.stage("read"):
+            input_list = read_input_file(filename=args.filename, input_format=args.format)
+        print("Input list read.")
+        print("Cleaning input list...")
+        with run_metrics.stage("clean"):
+            cleaned_input_list = clean_input_list(input_list)
+        print("Input list cleaned.")
+        print("Querying OpenAlex...")
+        with run_metrics.stage("fetch"):
+            work_store, identifier_with_error_list = query_open_alex(cleaned_input_list,
+                                                                     cache=WorkCache(),
+                                                                     statistics=run_metrics,
+                                                                     offline_index=offline_index)
+        print("OpenAlex queried.")
     if len(identifier_with_error_list) != 1:
         print(f"{len(identifier_with_error_list)} DOIs with errors: {identifier_with_error_list}")
     else:
         print(f"{len(identifier_with_error_list)} DOI with errors: {identifier_with_error_list}")
+    if args.save_snapshot:
+        save_snapshot(args.save_snapshot, work_store, identifier_with_error_list, run_metrics)
+        print(f"Snapshot saved to {args.save_snapshot}.")
 
     print("Creating visualizations ...")
-    type_frequency_plot, type_frequency_pie_chart = \
-        create_type_frequency_plot(type_dictionary, primary_location_dictionary)[0:2]
-    year_frequency_plot = create_year_frequency_plot(publication_year_dictionary)[0]
-    keyword_frequency_plot = create_keyword_frequency_plot(keywords_dictionary)[0]
-    concepts_frequency_plot = create_concepts_frequency_plot(concepts_dictionary)[0]
-    primary_location_frequency_plot = create_primary_location_frequency_plot(primary_location_dictionary)[0]
+    with run_metrics.stage("aggregate"):
+        work_aggregates = aggregate_works(work_store)
+        authorship_network = build_authorship_network(work_store)
+        topic_hierarchy = build_topic_hierarchy(work_store)
+    with run_metrics.stage("render"):
+        type_frequency_plot, type_frequency_pie_chart = create_type_frequency_plot(work_aggregates)[0:2]
+        year_frequency_plot = create_year_frequency_plot(work_aggregates)[0]
+        keyword_frequency_plot = create_keyword_frequency_plot(work_aggregates)[0]
+        concepts_frequency_plot = create_concepts_frequency_plot(work_aggregates)[0]
+        primary_location_frequency_plot = create_primary_location_frequency_plot(work_aggregates)[0]
+        authorship_network_plot = create_authorship_network_plot(authorship_network)
+        topic_frequency_plot = create_topic_frequency_plot(topic_hierarchy, "field")[0]
     print("Visualizations created.")
 
+    print()
+    print(run_metrics.summary_table())
+    if args.metrics_json:
+        with open(args.metrics_json, "w") as file:
+            file.write(run_metrics.to_json())
+    if args.metrics_prometheus:
+        with open(args.metrics_prometheus, "w") as file:
+            file.write(run_metrics.to_prometheus())
+
     type_frequency_plot.show()
     type_frequency_pie_chart.show()
     year_frequency_plot.show()
     keyword_frequency_plot.show()
     concepts_frequency_plot.show()
     primary_location_frequency_plot.show()
+    authorship_network_plot.show()
+    topic_frequency_plot.show()
 
 
 if __name__ == '__main__':
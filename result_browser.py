@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import weakref
+
+from work_store import WorkStore, NONE_CODE
+
+RESULT_COLUMNS = ["DOI", "Type", "Year", "Venue", "Authors", "Keywords", "Concepts", "Topics"]
+RESULT_PAGE_SIZES = [25, 50, 100]
+EXPORT_CHUNK_ROWS = 500  # Rows serialized per chunk of a streamed export.
+MAX_LISTED_AUTHORS = 3
+
+search_text_memo = weakref.WeakKeyDictionary()
+
+
+def row_values(work_store: WorkStore, row: int):
+    """
+    Formats one work as the display values of RESULT_COLUMNS.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param row: row number of the work
+    :return: list of strings
+    """
+    type_code = work_store.type_codes[row]
+    year_code = work_store.year_codes[row]
+    venue_code = work_store.venue_codes[row]
+    # OpenAlex leaves some author and topic names out; those are skipped rather than shown as blanks.
+    author_names = [authorship["author"]["display_name"] for authorship in work_store.authorships[row] or []
+                    if (authorship.get("author") or {}).get("display_name")]
+    if len(author_names) > MAX_LISTED_AUTHORS:
+        author_names = author_names[:MAX_LISTED_AUTHORS] + [f"et al. ({len(author_names)} authors)"]
+    keywords = work_store.keyword_labels(row)
+    concepts = work_store.concept_labels(row)
+    topics = work_store.topics[row]
+    return [work_store.identifiers[row],
+            "" if type_code == NONE_CODE else work_store.type_index.labels[type_code],
+            "" if year_code == NONE_CODE else str(work_store.year_index.labels[year_code]),
+            "" if venue_code == NONE_CODE else work_store.venue_index.labels[venue_code],
+            "; ".join(author_names),
+            "; ".join(keywords or []),
+            "; ".join(concepts or []),
+            "; ".join(topic["display_name"] for topic in topics or [] if topic.get("display_name"))]
+
+
+def search_texts(work_store: WorkStore):
+    """
+    Returns the lowercase text each row is filtered on. The texts are memoized per WorkStore and only computed for
+    rows added since the last call.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :return: list of strings indexed by row
+    """
+    text_list = search_text_memo.setdefault(work_store, [])
+    for row in range(len(text_list), len(work_store)):
+        text_list.append("\0".join(row_values(work_store, row)).lower())
+    return text_list
+
+
+def filter_rows(work_store: WorkStore, query: str = ""):
+    """
+    Finds the rows matching a filter query. A row matches if every whitespace-separated term of the query occurs,
+    case-insensitively, in one of its display values.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param query: filter query; empty to match every row
+    :return: range or list of matching row numbers, in input order
+    """
+    terms = (query or "").lower().split()
+    if not terms:
+        return range(len(work_store))
+    return [row for row, text in enumerate(search_texts(work_store)) if all(term in text for term in terms)]
+
+
+def page_count(row_count: int, page_size: int):
+    """
+    :param row_count: number of rows
+    :param page_size: rows per page
+    :return: number of pages, at least 1
+    """
+    return max(1, -(-row_count // page_size))
+
+
+def result_page(work_store: WorkStore, row_list, page_number: int, page_size: int):
+    """
+    Formats one page of rows. Only the rows on the page are serialized.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param row_list: matching row numbers, see filter_rows()
+    :param page_number: page number starting at 1; clamped to the existing pages
+    :param page_size: rows per page
+    :return: clamped page number and list of row value lists, see row_values()
+    """
+    page_number = min(max(1, page_number), page_count(len(row_list), page_size))
+    start = (page_number - 1) * page_size
+    return page_number, [row_values(work_store, row) for row in row_list[start:start + page_size]]
+
+
+def iter_export_csv(work_store: WorkStore, row_list=None):
+    """
+    Serializes works as CSV with the RESULT_COLUMNS, chunk by chunk, so exports of any size can be streamed.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param row_list: row numbers to export, or None for every row
+    :return: generator of CSV text chunks
+    """
+    if row_list is None:
+        row_list = range(len(work_store))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(RESULT_COLUMNS)
+    for i, row in enumerate(row_list):
+        writer.writerow(row_values(work_store, row))
+        if (i + 1) % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_export_json_lines(work_store: WorkStore, row_list=None):
+    """
+    Serializes works as JSON Lines, one object per work with its identifier and all stored Work object fields (see
+    WorkStore.work_dictionary()), chunk by chunk, so exports of any size can be streamed.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param row_list: row numbers to export, or None for every row
+    :return: generator of JSON Lines text chunks
+    """
+    if row_list is None:
+        row_list = range(len(work_store))
+    line_list = []
+    for row in row_list:
+        line_list.append(json.dumps({"identifier": work_store.identifiers[row], **work_store.work_dictionary(row)}))
+        if len(line_list) == EXPORT_CHUNK_ROWS:
+            yield "\n".join(line_list) + "\n"
+            line_list = []
+    if line_list:
+        yield "\n".join(line_list) + "\n"
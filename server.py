@@ -1,15 +1,83 @@
-from shiny import App, render, ui, reactive
+import io
+import os
+import threading
+
+# The app only renders figures to image bytes, so matplotlib can use the non-interactive Agg backend, which is also the
+# fastest to import.
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from shiny import render, ui, reactive, req
 from query_open_alex import *
+from authorship_analytics import (build_authorship_network, collaboration_summary, create_authorship_network_plot,
+                                  top_authors, top_institutions)
+from topic_hierarchy import TOPIC_LEVELS
+from figure_cache import FigureCache, content_hash, image_data_uri
+from jobs import JobManager, JobQueueFullError, QueryJob, QUEUED, DONE
+from offline_index import OFFLINE_INDEX_PATH, OfflineIndex
+from shared_work_store import SharedWorkStore
+from bibliography_comparison import (COMPARISON_ATTRIBUTE_NAMES, build_comparison, comparison_tables,
+                                     create_comparison_frequency_plot, create_overlap_plot, jaccard_matrix,
+                                     overlap_matrix, union_input_list, unique_list_names)
+from snapshot import SNAPSHOT_EXTENSION, load_snapshot, write_snapshot
+from result_browser import (RESULT_COLUMNS, RESULT_PAGE_SIZES, filter_rows, iter_export_csv, iter_export_json_lines,
+                            page_count, result_page)
+
+# Shared by every session so the OpenAlex request rate limit is global to the app.
+FETCH_ENGINE = FetchEngine()
+WORK_CACHE = WorkCache()
+# Works queried by several sessions are fetched once and kept in memory once, see shared_work_store.
+SHARED_WORK_STORE = SharedWorkStore()
+# Queries are answered from a local OpenAlex snapshot instead of the API if an offline index is configured.
+# Lookups are read in-process: forking a process pool from the server's threads could deadlock the children.
+OFFLINE_INDEX = OfflineIndex(OFFLINE_INDEX_PATH, max_workers=1) if OFFLINE_INDEX_PATH else None
+FIGURE_CACHE = FigureCache()
+JOB_MANAGER = JobManager()
+DIAGNOSTICS_INTERVAL = 5.0  # Seconds between refreshes of the run diagnostics.
+QUERY_POLL_INTERVAL = 1.0  # Seconds between refreshes of the partial results of a running query.
+TOPIC_LEVEL_CHOICES = {"domain": "Domains", "field": "Fields", "subfield": "Subfields", "topic": "Topics"}
+ALL_TOPICS_CHOICE = ""  # Value of the topic parent choice that shows the whole level.
+INPUT_TYPE_FORMATS = {"Text": "text", "Zotero CSV": "csv", "RIS": "ris", "BibTeX": "bibtex"}
+# Modules imported lazily by the query and plot functions. They are loaded on a background thread once the first session
+# starts, so the server starts quickly and the first query does not wait for them either.
+PRELOAD_MODULES = ["numpy", "matplotlib.pyplot", "matplotlib.ticker", "requests"]
+preload_started = threading.Event()
+
+
+def preload_modules():
+    """
+    Imports PRELOAD_MODULES on a background thread, once per process.
+
+    :return: None
+    """
+    if preload_started.is_set():
+        return
+    preload_started.set()
+
+    def run():
+        for name in PRELOAD_MODULES:
+            __import__(name)
+
+    threading.Thread(target=run, name="preload-modules", daemon=True).start()
 
 
 def server(input, output, session):
+    preload_modules()
+
     @reactive.calc
     def app_read_input_file():
-        if (input.type() == "Text") & (bool(input.user_file())):
-            file = input.user_file()
-            input_list = read_input_file(file[0]["datapath"])
-            cleaned_input_list = clean_input_list(input_list)
-            return {'clean_input_list': cleaned_input_list}
+        if (input.type() in INPUT_TYPE_FORMATS) & (bool(input.user_file())):
+            file_list = input.user_file()
+            run_metrics = RunMetrics()
+            with run_metrics.stage("read"):
+                input_lists = [list(iter_input_file(file["datapath"], INPUT_TYPE_FORMATS[input.type()]))
+                               for file in file_list]
+            with run_metrics.stage("clean"):
+                # Several files are compared; their union is queried once.
+                cleaned_input_lists = dict(zip(unique_list_names([file["name"] for file in file_list]),
+                                               map(clean_input_list, input_lists)))
+                cleaned_input_list = union_input_list(cleaned_input_lists)
+            return {'clean_input_list': cleaned_input_list, 'input_lists': cleaned_input_lists,
+                    'run_metrics': run_metrics}
         else:
             return {'clean_input_list': 'Input file is invalid.'}
 
@@ -18,90 +86,364 @@ def server(input, output, session):
     def app_clean_input_list():
         return f"{app_read_input_file()['clean_input_list']}"
 
-    @reactive.calc
+    query_job = reactive.value(None)
+    query_result = reactive.value(None)
+    query_progress = {}
+
+    @reactive.effect
     @reactive.event(input.query_button)
-    def app_query():
-        p = ui.Progress()
-        p.set(message="Computing, please wait...")
+    def app_start_query():
         query_input = app_read_input_file()['clean_input_list']
+        if not isinstance(query_input, list):
+            return
+        run_metrics = app_read_input_file()['run_metrics'].copy()
+        if query_job.get() is not None:
+            JOB_MANAGER.cancel(query_job.get())
+        with reactive.isolate():
+            previous_result = query_result.get()
+        work_store = None
+        if input.incremental_query() and previous_result is not None and previous_result['status'] == DONE:
+            with run_metrics.stage("clean"):
+                query_input, removed_list = diff_input_list(previous_result['work_store'], query_input)
+                work_store = remove_works(previous_result['work_store'], removed_list)
+            ui.notification_show(f"Updating the previous result: {len(query_input)} DOIs to query, "
+                                 f"{len(removed_list)} removed.")
+        try:
+            job = JOB_MANAGER.submit(QueryJob(session.id, query_input, engine=FETCH_ENGINE, cache=WORK_CACHE,
+                                              run_metrics=run_metrics, work_store=work_store,
+                                              offline_index=OFFLINE_INDEX, shared_store=SHARED_WORK_STORE))
+        except JobQueueFullError:
+            ui.notification_show("The server is busy with other queries. Please try again in a few minutes.",
+                                 type="warning")
+            return
+        if query_progress.get('progress') is not None:
+            query_progress['progress'].close()
+        query_progress['progress'] = ui.Progress(min=0, max=max(1, len(query_input)))
+        query_progress['progress'].set(0, message="Waiting for other queries to finish...")
+        query_progress['version'] = None
+        query_job.set(job)
+
+    @reactive.effect
+    def app_poll_query():
+        job = query_job.get()
+        # A finished job's final result has been delivered; there is nothing left to poll.
+        if job is None or query_progress.get('delivered') is job:
+            return
+        snapshot = job.snapshot()
+        if (snapshot['version'], snapshot['queue_position']) != query_progress['version']:
+            query_progress['version'] = (snapshot['version'], snapshot['queue_position'])
+            query_result.set(snapshot)
+            if snapshot['status'] == QUEUED:
+                query_progress['progress'].set(0,
+                                               message="Waiting for other queries to finish...",
+                                               detail=f"Position {snapshot['queue_position']} in the queue")
+            else:
+                query_progress['progress'].set(snapshot['completed_count'],
+                                               message="Querying OpenAlex...",
+                                               detail=f"{snapshot['completed_count']} of {snapshot['total_count']} "
+                                                      f"DOIs ({snapshot['rate']:.1f} DOIs/s)")
+        if snapshot['done']:
+            query_progress['delivered'] = job
+            query_progress['progress'].close()
+            query_progress['progress'] = None
+            if snapshot['error'] is not None:
+                ui.notification_show(f"Query failed: {snapshot['error']}", type="error")
+        else:
+            reactive.invalidate_later(QUERY_POLL_INTERVAL)
+
+    @reactive.effect
+    @reactive.event(input.snapshot_file)
+    def app_load_snapshot():
+        file = input.snapshot_file()
+        if not file:
+            return
+        if query_job.get() is not None:
+            JOB_MANAGER.cancel(query_job.get())
+            query_job.set(None)
+        if query_progress.get('progress') is not None:
+            query_progress['progress'].close()
+            query_progress['progress'] = None
+        run_metrics = RunMetrics()
+        try:
+            with run_metrics.stage("read"):
+                loaded_snapshot = load_snapshot(file[0]["datapath"])
+        except (OSError, ValueError) as error:
+            ui.notification_show(f"Snapshot could not be opened: {error}", type="error")
+            return
+        work_store = loaded_snapshot['work_store']
+        query_result.set({'work_store': work_store,
+                          'identifier_with_error_list': loaded_snapshot['identifier_with_error_list'],
+                          'query_statistics': loaded_snapshot['query_statistics'],
+                          'run_metrics': run_metrics,
+                          'completed_count': len(work_store) + len(loaded_snapshot['identifier_with_error_list']),
+                          'total_count': len(work_store) + len(loaded_snapshot['identifier_with_error_list']),
+                          'rate': 0.0,
+                          'status': DONE,
+                          'queue_position': None,
+                          'error': None,
+                          'version': 0,
+                          'done': True})
 
-        authorships_dictionary, \
-            concepts_dictionary, \
-            keywords_dictionary, \
-            topics_dictionary, \
-            type_dictionary, \
-            publication_year_dictionary, \
-            primary_location_dictionary, \
-            identifier_with_error_list = query_open_alex(query_input)
-        p.close()
-
-        return {'authorships_dictionary': authorships_dictionary,
-                'concepts_dictionary': concepts_dictionary,
-                'keywords_dictionary': keywords_dictionary,
-                'topics_dictionary': topics_dictionary,
-                'type_dictionary': type_dictionary,
-                'publication_year_dictionary': publication_year_dictionary,
-                'primary_location_dictionary': primary_location_dictionary,
-                'identifier_with_error_list': identifier_with_error_list}
+    @reactive.calc
+    def app_query():
+        return req(query_result.get())
+
+    @render.download(filename=f"computable-bibliography{SNAPSHOT_EXTENSION}")
+    def app_download_snapshot():
+        buffer = io.BytesIO()
+        write_snapshot(buffer,
+                       app_query()['work_store'],
+                       app_query()['identifier_with_error_list'],
+                       app_query()['query_statistics'])
+        yield buffer.getvalue()
+
+    @session.on_ended
+    def app_cancel_query():
+        JOB_MANAGER.cancel_session(session.id)
 
     @output
     @render.text
     def app_query_errors():
+        query_statistics = app_query()['query_statistics']
+        cache_text = f"Cache: {query_statistics['cache_hits']} hits, {query_statistics['cache_misses']} misses"
         if len(app_query()['identifier_with_error_list']) != 1:
             return f"{len(app_query()['identifier_with_error_list'])} DOIs with errors: \n \
-                {app_query()['identifier_with_error_list']}"
+                {app_query()['identifier_with_error_list']} \n{cache_text}"
         else:
             return f"{len(app_query()['identifier_with_error_list'])} DOI with errors: \n \
-                {app_query()['identifier_with_error_list']}"
+                {app_query()['identifier_with_error_list']} \n{cache_text}"
+
+    @reactive.calc
+    def app_result_rows():
+        return filter_rows(app_query()['work_store'], input.result_filter())
 
     @output
-    @render.text
+    @render.ui
     def app_query_result():
-        return (f"Authorships: {app_query()['authorships_dictionary']} \n"
-                f"Concepts: {app_query()['concepts_dictionary']} \n"
-                f"Keywords: {app_query()['keywords_dictionary']} \n"
-                f"Topics: {app_query()['topics_dictionary']} \n"
-                f"Type: {app_query()['type_dictionary']} \n"
-                f"Publication Year: {app_query()['publication_year_dictionary']} \n"
-                f"Primary Location: {app_query()['primary_location_dictionary']} \n")
+        work_store = app_query()['work_store']
+        row_list = app_result_rows()
+        page_size = int(input.result_page_size())
+        page_number, page_rows = result_page(work_store, row_list, input.result_page() or 1, page_size)
+        start = (page_number - 1) * page_size
+        summary = (f"Showing {start + 1 if page_rows else 0}-{start + len(page_rows)} of {len(row_list)} works"
+                   + (f" (filtered from {len(work_store)})" if len(row_list) != len(work_store) else "")
+                   + f", page {page_number} of {page_count(len(row_list), page_size)}")
+        return ui.TagList(
+            ui.p(summary),
+            ui.tags.table(
+                {"class": "table table-sm table-striped"},
+                ui.tags.thead(ui.tags.tr(*[ui.tags.th(column) for column in RESULT_COLUMNS])),
+                ui.tags.tbody(*[ui.tags.tr(*[ui.tags.td(value) for value in values]) for values in page_rows]),
+            ),
+        )
+
+    @render.download(filename="computable-bibliography-results.csv")
+    def app_download_results_csv():
+        yield from iter_export_csv(app_query()['work_store'], app_result_rows())
+
+    @render.download(filename="computable-bibliography-results.jsonl")
+    def app_download_results_json_lines():
+        yield from iter_export_json_lines(app_query()['work_store'], app_result_rows())
+
+    @reactive.calc
+    def app_aggregates():
+        with app_query()['run_metrics'].stage("aggregate"):
+            return aggregate_works(app_query()['work_store'])
+
+    def render_cached_plot(name: str, data_hash: str, create_figure):
+        width = req(input[f".clientdata_output_{name}_width"]())
+        height = req(input[f".clientdata_output_{name}_height"]())
+        pixel_ratio = input[".clientdata_pixelratio"]() or 1.0
+        image = FIGURE_CACHE.get_or_render(name, data_hash, create_figure, width, height, pixel_ratio,
+                                           statistics=app_query()['run_metrics'])
+        return ui.img(src=image_data_uri(image), alt=name, style="width: 100%; height: 100%;")
 
     @output
-    @render.plot
+    @render.ui
     def type_frequency():
-        fig1, fig2, sorted_type_frequency, type_none_list = \
-            create_type_frequency_plot(app_query()['type_dictionary'], app_query()['primary_location_dictionary'])
-        return fig1
+        work_aggregates = app_aggregates()
+        return render_cached_plot('type_frequency',
+                                  content_hash(work_aggregates.type_frequency,
+                                               len(work_aggregates.type_none_list),
+                                               work_aggregates.total_count),
+                                  lambda: create_type_frequency_bar_chart(work_aggregates))
 
     @output
-    @render.plot
+    @render.ui
     def type_frequency_pie():
-        fig1, fig2, sorted_type_frequency, type_none_list = \
-            create_type_frequency_plot(app_query()['type_dictionary'], app_query()['primary_location_dictionary'])
-        return fig2
+        work_aggregates = app_aggregates()
+        return render_cached_plot('type_frequency_pie',
+                                  content_hash(work_aggregates.type_frequency,
+                                               len(work_aggregates.type_none_list),
+                                               work_aggregates.total_count),
+                                  lambda: create_type_frequency_pie_chart(work_aggregates))
 
     @output
-    @render.plot
+    @render.ui
     def year_frequency():
-        fig3, sorted_year_frequency = create_year_frequency_plot(app_query()['publication_year_dictionary'])
-        return fig3
+        work_aggregates = app_aggregates()
+        return render_cached_plot('year_frequency',
+                                  content_hash(work_aggregates.year_frequency,
+                                               len(work_aggregates.year_none_list),
+                                               work_aggregates.total_count),
+                                  lambda: create_year_frequency_plot(work_aggregates)[0])
 
     @output
-    @render.plot
+    @render.ui
     def keyword_frequency():
-        fig4, sorted_keyword_frequency, keyword_none_list = create_keyword_frequency_plot(
-            app_query()['keywords_dictionary'])
-        return fig4
+        work_aggregates = app_aggregates()
+        return render_cached_plot('keyword_frequency',
+                                  content_hash(work_aggregates.keyword_frequency,
+                                               work_aggregates.keyword_names,
+                                               len(work_aggregates.keyword_none_list),
+                                               work_aggregates.total_count),
+                                  lambda: create_keyword_frequency_plot(work_aggregates)[0])
 
     @output
-    @render.plot
+    @render.ui
     def concepts_frequency():
-        fig5, sorted_concepts_frequency, concepts_none_list = create_concepts_frequency_plot(
-            app_query()['concepts_dictionary'])
-        return fig5
+        work_aggregates = app_aggregates()
+        return render_cached_plot('concepts_frequency',
+                                  content_hash(work_aggregates.concepts_frequency,
+                                               work_aggregates.concepts_names,
+                                               len(work_aggregates.concepts_none_list),
+                                               work_aggregates.total_count),
+                                  lambda: create_concepts_frequency_plot(work_aggregates)[0])
 
     @output
-    @render.plot
+    @render.ui
     def primary_location_frequency():
-        fig6, sorted_primary_location_frequency, primary_location_none_list = \
-            create_primary_location_frequency_plot(app_query()['primary_location_dictionary'])
-        return fig6
\ No newline at end of file
+        work_aggregates = app_aggregates()
+        return render_cached_plot('primary_location_frequency',
+                                  content_hash(work_aggregates.primary_location_frequency,
+                                               work_aggregates.primary_location_names,
+                                               len(work_aggregates.primary_location_none_list),
+                                               work_aggregates.total_count),
+                                  lambda: create_primary_location_frequency_plot(work_aggregates)[0])
+
+    @reactive.calc
+    def app_authorship_network():
+        with app_query()['run_metrics'].stage("aggregate"):
+            return build_authorship_network(app_query()['work_store'])
+
+    @output
+    @render.ui
+    def authorship_network():
+        network = app_authorship_network()
+        return render_cached_plot('authorship_network',
+                                  content_hash(collaboration_summary(network),
+                                               top_authors(network),
+                                               top_institutions(network)),
+                                  lambda: create_authorship_network_plot(network))
+
+    @reactive.calc
+    def app_topic_hierarchy():
+        with app_query()['run_metrics'].stage("aggregate"):
+            return build_topic_hierarchy(app_query()['work_store'])
+
+    def topic_parent_level():
+        position = TOPIC_LEVELS.index(input.topic_level())
+        return TOPIC_LEVELS[position - 1] if position > 0 else None
+
+    @reactive.effect
+    def app_update_topic_parents():
+        parent_level = topic_parent_level()
+        choices = {ALL_TOPICS_CHOICE: "All"}
+        if parent_level is not None:
+            parent_frequency = roll_up(app_topic_hierarchy(), parent_level)
+            choices.update({label: f"{label} ({count})" for label, count in reversed(parent_frequency.items())})
+        with reactive.isolate():
+            selected = input.topic_parent() if input.topic_parent() in choices else ALL_TOPICS_CHOICE
+        ui.update_select("topic_parent",
+                         label=f"Within {parent_level}:" if parent_level is not None else "Within:",
+                         choices=choices,
+                         selected=selected)
+
+    @output
+    @render.ui
+    def topic_frequency():
+        topic_hierarchy = app_topic_hierarchy()
+        level = input.topic_level()
+        parent_level = topic_parent_level()
+        parent_label = input.topic_parent() or None
+        if parent_label is None:
+            parent_level = None
+        return render_cached_plot('topic_frequency',
+                                  content_hash(level,
+                                               parent_level,
+                                               parent_label,
+                                               roll_up(topic_hierarchy, level, parent_level, parent_label),
+                                               topic_hierarchy.none_count,
+                                               topic_hierarchy.work_count),
+                                  lambda: create_topic_frequency_plot(topic_hierarchy, level, parent_level,
+                                                                      parent_label)[0])
+
+    @reactive.calc
+    def app_comparison():
+        input_lists = app_read_input_file().get('input_lists') or {}
+        req(len(input_lists) > 1)
+        with app_query()['run_metrics'].stage("aggregate"):
+            return build_comparison(app_query()['work_store'], input_lists)
+
+    @output
+    @render.text
+    def app_comparison_summary():
+        input_lists = app_read_input_file().get('input_lists') or {}
+        if len(input_lists) < 2:
+            return "Upload two or more DOI files to compare them."
+        comparison = app_comparison()
+        overlaps = overlap_matrix(comparison)
+        similarities = jaccard_matrix(comparison)
+        lines = [f"{name}: {comparison.doi_counts[i]} DOIs, {overlaps[i, i]} works"
+                 for i, name in enumerate(comparison.list_names)]
+        pairs = sorted(((similarities[i, j], i, j) for i in range(len(comparison))
+                        for j in range(i + 1, len(comparison))), reverse=True)
+        lines.append("")
+        lines.extend(f"{comparison.list_names[i]} & {comparison.list_names[j]}: {overlaps[i, j]} shared works, "
+                     f"Jaccard {similarity:.3f}" for similarity, i, j in pairs)
+        return "\n".join(lines)
+
+    @output
+    @render.ui
+    def comparison_overlap():
+        comparison = app_comparison()
+        return render_cached_plot('comparison_overlap',
+                                  content_hash(comparison.list_names, overlap_matrix(comparison).tolist()),
+                                  lambda: create_overlap_plot(comparison))
+
+    @output
+    @render.ui
+    def comparison_frequency():
+        comparison = app_comparison()
+        attribute = input.comparison_attribute()
+        keys, labels, counts = comparison_tables(comparison)[attribute]
+        return render_cached_plot('comparison_frequency',
+                                  content_hash(attribute, comparison.list_names, keys, labels, counts.tolist()),
+                                  lambda: create_comparison_frequency_plot(comparison, attribute))
+
+    @output
+    @render.text
+    def app_run_diagnostics():
+        app_aggregates()
+        reactive.invalidate_later(DIAGNOSTICS_INTERVAL)
+        statistics = FIGURE_CACHE.statistics()
+        shared_statistics = SHARED_WORK_STORE.statistics()
+        return (f"{app_query()['run_metrics'].summary_table()}\n\n"
+                f"Figure cache: {statistics['hits']} hits, {statistics['misses']} misses "
+                f"({statistics['hit_rate']:.0%} hit rate), {statistics['entries']} figures, "
+                f"{statistics['bytes'] / 1024 / 1024:.1f} of {statistics['max_bytes'] / 1024 / 1024:.0f} MB, "
+                f"{statistics['evictions']} evictions \n"
+                f"Render time: {statistics['render_seconds']:.2f} s for {statistics['render_count']} figures "
+                f"({statistics['mean_render_seconds'] * 1000:.0f} ms per figure)\n"
+                f"Shared works: {shared_statistics['entries']} works of {shared_statistics['owners']} sessions, "
+                f"{shared_statistics['bytes'] / 1024 / 1024:.1f} of {shared_statistics['max_bytes'] / 1024 / 1024:.0f} "
+                f"MB ({shared_statistics['unreferenced_bytes'] / 1024 / 1024:.1f} MB unreferenced), "
+                f"{shared_statistics['evictions']} evictions, {shared_statistics['unstored']} works not stored")
+
+    @render.download(filename="run-metrics.json")
+    def app_download_metrics_json():
+        yield app_query()['run_metrics'].to_json()
+
+    @render.download(filename="run-metrics.prom")
+    def app_download_metrics_prometheus():
+        yield app_query()['run_metrics'].to_prometheus()
@@ -0,0 +1,290 @@
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import CancelledError, Future, wait, FIRST_COMPLETED
+
+from query_open_alex import CACHED_BATCH_SIZE, normalize_doi, iter_query_open_alex
+
+SHARED_STORE_MAX_BYTES = 256 * 1024 * 1024  # Estimated size of all works kept in the store, referenced or not.
+# Size estimate of a decoded Work object (see record_size()), measured on Work objects projected to WORK_FIELDS.
+SHARED_RECORD_BASE_BYTES = 1024
+SHARED_RECORD_ITEM_BYTES = 900  # Per authorship, concept, keyword or topic, which are nested dictionaries.
+
+
+def record_size(record: dict):
+    """
+    Estimates the memory used by a decoded Work object without walking it.
+
+    :param record: Work object
+    :return: estimated size in bytes
+    """
+    return SHARED_RECORD_BASE_BYTES + SHARED_RECORD_ITEM_BYTES * sum(len(record.get(field) or [])
+                                                                     for field in ["authorships", "concepts",
+                                                                                   "keywords", "topics"])
+
+
+class SharedWorkStore:
+    """
+    Process-wide store of Work objects shared by every session of the app, keyed by normalized DOI (see
+    query_open_alex.normalize_doi()). Work objects are treated as immutable, so the WorkStores of all sessions that
+    queried a DOI share the same authorships and topics instead of holding one copy each.
+
+    Sessions (owners) hold references to the works they queried. Works nobody references stay in the store for later
+    queries. max_bytes bounds the estimated size of all stored works: when it is exceeded, the least recently used
+    unreferenced works are dropped, and while the referenced works alone exceed it, newly fetched works are handed to
+    the queries waiting for them but not stored for later queries. DOIs being fetched are tracked as in-flight futures,
+    so a query asking for a DOI another query is fetching waits for that fetch instead of sending its own request;
+    see iter_query_shared(). statistics() reports the store's size for diagnostics.
+
+    The store is thread-safe.
+    """
+
+    def __init__(self, max_bytes: int = SHARED_STORE_MAX_BYTES):
+        """
+        :param max_bytes: budget for the estimated size of all stored works
+        """
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.records = OrderedDict()  # Normalized DOI to (Work object, estimated size), least recently used first.
+        self.reference_counts = Counter()
+        self.owner_dois = {}
+        self.in_flight = {}
+        self.total_bytes = 0
+        self.unreferenced_bytes = 0
+        self.eviction_count = 0
+        self.unstored_count = 0
+
+    def add_reference(self, owner, doi: str):
+        """
+        Records that an owner uses a stored work. Must be called with the lock held.
+
+        :param owner: owner, e.g. a session ID
+        :param doi: normalized DOI of a stored work
+        :return: None
+        """
+        owner_dois = self.owner_dois.setdefault(owner, set())
+        if doi in owner_dois:
+            return
+        owner_dois.add(doi)
+        self.reference_counts[doi] += 1
+        if self.reference_counts[doi] == 1:
+            self.unreferenced_bytes -= self.records[doi][1]
+
+    def claim(self, owner, doi_list: list):
+        """
+        Splits DOIs into stored works, DOIs other queries are fetching, and DOIs the caller has to fetch. The
+        caller's DOIs become in-flight until passed to publish(), fail() or abandon().
+
+        :param owner: owner of the query, who gets a reference to the stored works
+        :param doi_list: list of normalized DOIs
+        :return: dictionary of DOI to stored Work object, dictionary of DOI to Future of another query's fetch, and
+        list of DOIs claimed by the caller
+        """
+        stored = {}
+        waiting = {}
+        claimed = []
+        with self.lock:
+            for doi in dict.fromkeys(doi_list):
+                entry = self.records.get(doi)
+                if entry is not None:
+                    self.records.move_to_end(doi)
+                    self.add_reference(owner, doi)
+                    stored[doi] = entry[0]
+                elif doi in self.in_flight:
+                    waiting[doi] = self.in_flight[doi]
+                else:
+                    self.in_flight[doi] = Future()
+                    claimed.append(doi)
+        return stored, waiting, claimed
+
+    def publish(self, owner, work_dictionary: dict):
+        """
+        Stores fetched works, referenced by the owner that fetched them, and hands them to the queries waiting for
+        them. Works that do not fit in max_bytes, even after evicting unreferenced works, are only handed over.
+
+        :param owner: owner of the query that fetched the works
+        :param work_dictionary: dictionary of normalized DOI to Work object
+        :return: None
+        """
+        futures = []
+        with self.lock:
+            sizes = {doi: record_size(record) for doi, record in work_dictionary.items() if doi not in self.records}
+            self.evict(self.max_bytes - sum(sizes.values()))  # Makes room for the batch at once.
+            for doi, record in work_dictionary.items():
+                if doi in sizes:
+                    if self.total_bytes + sizes[doi] <= self.max_bytes:
+                        self.records[doi] = (record, sizes[doi])
+                        self.total_bytes += sizes[doi]
+                        self.unreferenced_bytes += sizes[doi]
+                    else:
+                        self.unstored_count += 1
+                if doi in self.records:
+                    self.add_reference(owner, doi)
+                future = self.in_flight.pop(doi, None)
+                if future is not None:
+                    futures.append((future, record))
+        for future, record in futures:
+            future.set_result(record)
+
+    def fail(self, doi_list: list):
+        """
+        Ends the fetch of DOIs that had errors; the queries waiting for them report them as errors too.
+
+        :param doi_list: list of normalized DOIs claimed by the caller
+        :return: None
+        """
+        with self.lock:
+            futures = [self.in_flight.pop(doi) for doi in doi_list if doi in self.in_flight]
+        for future in futures:
+            future.set_result(None)
+
+    def abandon(self, doi_list: list):
+        """
+        Ends the fetch of DOIs that were not fetched, e.g. because the query was cancelled. Queries waiting for them
+        fetch them themselves.
+
+        :param doi_list: list of normalized DOIs claimed by the caller
+        :return: None
+        """
+        with self.lock:
+            futures = [self.in_flight.pop(doi) for doi in doi_list if doi in self.in_flight]
+        for future in futures:
+            future.cancel()
+            future.set_running_or_notify_cancel()  # Wakes the queries blocked in concurrent.futures.wait().
+
+    def add_references(self, owner, doi_list: list):
+        """
+        :param owner: owner, e.g. a session ID
+        :param doi_list: list of normalized DOIs; DOIs no longer stored are skipped
+        :return: None
+        """
+        with self.lock:
+            for doi in doi_list:
+                if doi in self.records:
+                    self.add_reference(owner, doi)
+
+    def release(self, owner):
+        """
+        Drops every reference of an owner, e.g. when a session ends, then evicts unreferenced works over the budget.
+
+        :param owner: owner, e.g. a session ID
+        :return: None
+        """
+        with self.lock:
+            for doi in self.owner_dois.pop(owner, ()):
+                self.reference_counts[doi] -= 1
+                if self.reference_counts[doi] == 0:
+                    del self.reference_counts[doi]
+                    self.unreferenced_bytes += self.records[doi][1]
+            self.evict()
+
+    def evict(self, max_bytes: int = None):
+        """
+        Drops the least recently used unreferenced works until the estimated size of all stored works is within
+        max_bytes, or no unreferenced works are left. Must be called with the lock held.
+
+        :param max_bytes: size to shrink the store to, by default the store's max_bytes
+        :return: None
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if self.total_bytes <= max_bytes or self.unreferenced_bytes == 0:
+            return
+        for doi in [doi for doi in self.records if doi not in self.reference_counts]:
+            size = self.records.pop(doi)[1]
+            self.total_bytes -= size
+            self.unreferenced_bytes -= size
+            self.eviction_count += 1
+            if self.total_bytes <= max_bytes:
+                break
+
+    def statistics(self):
+        """
+        :return: dictionary of the number of stored works, their estimated size in bytes (in total and of the
+        unreferenced works), max_bytes, the number of owners, in-flight DOIs, evicted works and works not stored
+        because the budget was full
+        """
+        with self.lock:
+            return {"entries": len(self.records),
+                    "bytes": self.total_bytes,
+                    "unreferenced_bytes": self.unreferenced_bytes,
+                    "max_bytes": self.max_bytes,
+                    "owners": len(self.owner_dois),
+                    "in_flight": len(self.in_flight),
+                    "evictions": self.eviction_count,
+                    "unstored": self.unstored_count}
+
+    def __len__(self):
+        return len(self.records)
+
+
+def iter_query_shared(shared_store: SharedWorkStore, owner, cleaned_input_list: list, **query_arguments):
+    """
+    Runs iter_query_open_alex() through a shared work store, yielding the same batches. Works already in the store
+    are yielded first without a lookup. DOIs another query is fetching are not requested again; their works are
+    yielded when that fetch completes. Only the remaining identifiers are queried, and their works are published to
+    the store for the other queries. If the query fetching a DOI is cancelled, the waiting queries fetch it
+    themselves.
+
+    Works are shared as returned, so query_arguments must not change select_fields between queries of one store.
+
+    :param shared_store: process-wide SharedWorkStore
+    :param owner: owner of the query, e.g. the session ID, who gets a reference to every work yielded
+    :param cleaned_input_list: cleaned input list of DOIs, see query_open_alex.clean_input_list()
+    :param query_arguments: keyword arguments of iter_query_open_alex(); statistics is also updated with
+    "shared_hits" and "shared_waits", the number of identifiers served by the store and by another query's fetch
+    :return: generator of (list of (identifier, Work object) pairs, list of identifiers with errors) tuples
+    """
+    statistics = query_arguments.get("statistics")
+    if statistics is None:
+        statistics = query_arguments["statistics"] = Counter()
+    identifier_dois = {identifier: normalize_doi(identifier) for identifier in cleaned_input_list}
+    stored, waiting, claimed = shared_store.claim(owner, [doi for doi in identifier_dois.values() if doi is not None])
+    claimed_set = set(claimed)
+    try:
+        stored_work_list = [(identifier, stored[doi]) for identifier, doi in identifier_dois.items() if doi in stored]
+        statistics["shared_hits"] += len(stored_work_list)
+        for i in range(0, len(stored_work_list), CACHED_BATCH_SIZE):
+            yield stored_work_list[i:i + CACHED_BATCH_SIZE], []
+
+        fetch_identifier_list = [identifier for identifier, doi in identifier_dois.items()
+                                 if doi is None or doi in claimed_set]
+        for work_list, error_list in iter_query_open_alex(fetch_identifier_list, **query_arguments):
+            fetched_work_dictionary = {identifier_dois[identifier]: result for identifier, result in work_list
+                                       if identifier_dois[identifier] in claimed_set}
+            failed_doi_list = [identifier_dois[identifier] for identifier in error_list
+                               if identifier_dois[identifier] in claimed_set]
+            shared_store.publish(owner, fetched_work_dictionary)
+            shared_store.fail(failed_doi_list)
+            claimed_set.difference_update(fetched_work_dictionary)
+            claimed_set.difference_update(failed_doi_list)
+            yield work_list, error_list
+    finally:
+        shared_store.abandon(list(claimed_set))
+
+    doi_identifiers = {}
+    for identifier, doi in identifier_dois.items():
+        if doi in waiting:
+            doi_identifiers.setdefault(doi, []).append(identifier)
+    statistics["shared_waits"] += sum(len(identifier_list) for identifier_list in doi_identifiers.values())
+    future_dois = {future: doi for doi, future in waiting.items()}
+    abandoned_identifier_list = []
+    while future_dois:
+        done, _ = wait(future_dois, return_when=FIRST_COMPLETED)
+        work_list = []
+        error_list = []
+        for future in done:
+            doi = future_dois.pop(future)
+            try:
+                result = future.result()
+            except CancelledError:
+                abandoned_identifier_list.extend(doi_identifiers[doi])
+                continue
+            if result is None:
+                error_list.extend(doi_identifiers[doi])
+            else:
+                work_list.extend((identifier, result) for identifier in doi_identifiers[doi])
+        shared_store.add_references(owner, [identifier_dois[identifier] for identifier, _ in work_list])
+        if work_list or error_list:
+            yield work_list, error_list
+    if abandoned_identifier_list:
+        yield from iter_query_shared(shared_store, owner, abandoned_identifier_list, **query_arguments)
@@ -0,0 +1,252 @@
+import datetime
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+
+from work_aggregates import WorkAggregates, aggregate_works, aggregates_memo
+from work_store import CategoryIndex, WorkStore
+
+SNAPSHOT_MAGIC = b"CBSNAP1\n"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSION = ".cbsnap"
+SNAPSHOT_BLOCK_ROWS = 1024  # Rows of authorships and topics per compressed block, decoded on first access.
+CATEGORY_INDEX_NAMES = ["type_index", "year_index", "venue_index", "venue_type_index", "keyword_index",
+                        "concept_index"]
+CODE_COLUMN_NAMES = ["type_codes", "year_codes", "venue_codes", "venue_type_codes", "keyword_codes",
+                     "keyword_offsets", "keyword_none", "concept_codes", "concept_offsets", "concept_none"]
+ROW_LIST_NAMES = ["authorships", "topics"]
+AGGREGATE_TABLE_NAMES = ["type_frequency", "year_frequency", "primary_location_frequency", "keyword_frequency",
+                         "concepts_frequency"]
+AGGREGATE_LIST_NAMES = ["type_none_list", "year_none_list", "primary_location_none_list", "keyword_none_list",
+                        "concepts_none_list"]
+AGGREGATE_NAME_NAMES = ["primary_location_names", "keyword_names", "concepts_names"]
+
+
+class LazyRowList:
+    """
+    List-like column of JSON values (e.g. the authorships of each work) read from a snapshot file. Rows are stored in
+    compressed blocks that are decoded on first access, so loading a snapshot does not decode every row. Rows
+    appended after loading are kept in memory.
+    """
+
+    def __init__(self, buffer, block_offsets: list, row_count: int, block_rows: int = SNAPSHOT_BLOCK_ROWS):
+        """
+        :param buffer: bytes-like object holding the blocks, e.g. a memory-mapped snapshot file
+        :param block_offsets: start offset of each block in buffer, followed by the end offset of the last block
+        :param row_count: number of rows in the blocks
+        :param block_rows: number of rows per block
+        """
+        self.buffer = buffer
+        self.block_offsets = block_offsets
+        self.row_count = row_count
+        self.block_rows = block_rows
+        self.decoded_blocks = {}
+        self.appended_rows = []
+
+    def block(self, block_number: int):
+        rows = self.decoded_blocks.get(block_number)
+        if rows is None:
+            start, end = self.block_offsets[block_number], self.block_offsets[block_number + 1]
+            rows = json.loads(zlib.decompress(self.buffer[start:end]))
+            self.decoded_blocks[block_number] = rows
+        return rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        if index >= self.row_count:
+            return self.appended_rows[index - self.row_count]
+        return self.block(index // self.block_rows)[index % self.block_rows]
+
+    def __len__(self):
+        return self.row_count + len(self.appended_rows)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, value):
+        self.appended_rows.append(value)
+
+    def copy(self):
+        """
+        :return: copy sharing the immutable stored blocks
+        """
+        row_list = LazyRowList(self.buffer, self.block_offsets, self.row_count, self.block_rows)
+        row_list.decoded_blocks = self.decoded_blocks
+        row_list.appended_rows = list(self.appended_rows)
+        return row_list
+
+
+def table_to_pairs(table: dict):
+    """
+    :param table: frequency dictionary, possibly with non-string keys (e.g. publication years)
+    :return: list of [key, value] pairs, which keep key types and order in JSON
+    """
+    return [[key, value] for key, value in table.items()]
+
+
+def write_snapshot(file,
+                   work_store: WorkStore,
+                   identifier_with_error_list: list = None,
+                   query_statistics: Counter = None):
+    """
+    Writes a query result to a binary file object in the snapshot format: a magic line, the length of a JSON header,
+    the header (category labels, error list, statistics, aggregates and the layout of the data section) and the data
+    section. The data section holds the identifiers and the raw bytes of every code column, 8-byte aligned, followed
+    by the authorships and topics in zlib-compressed JSON blocks of SNAPSHOT_BLOCK_ROWS rows.
+
+    :param file: binary file object open for writing
+    :param work_store: WorkStore to save
+    :param identifier_with_error_list: list of identifiers with errors
+    :param query_statistics: counter of the query, e.g. cache hits and misses
+    :return: number of bytes written
+    """
+    data = io.BytesIO()
+
+    def add_section(payload: bytes):
+        data.write(b"\0" * (-data.tell() % 8))
+        offset = data.tell()
+        data.write(payload)
+        return [offset, len(payload)]
+
+    columns = {"identifiers": add_section("\0".join(work_store.identifiers).encode("utf-8"))}
+    for name in CODE_COLUMN_NAMES:
+        column = getattr(work_store, name)
+        columns[name] = add_section(column.tobytes()) + [column.typecode, column.itemsize]
+    row_lists = {}
+    for name in ROW_LIST_NAMES:
+        row_list = getattr(work_store, name)
+        block_offsets = []
+        for start in range(0, len(row_list), SNAPSHOT_BLOCK_ROWS):
+            block = zlib.compress(json.dumps(row_list[start:start + SNAPSHOT_BLOCK_ROWS],
+                                             separators=(",", ":")).encode("utf-8"))
+            block_offsets.append(data.tell())
+            data.write(block)
+        block_offsets.append(data.tell())
+        row_lists[name] = block_offsets
+
+    work_aggregates = aggregate_works(work_store)
+    header = {"version": SNAPSHOT_VERSION,
+              "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+              "byteorder": sys.byteorder,
+              "row_count": len(work_store),
+              "block_rows": SNAPSHOT_BLOCK_ROWS,
+              "category_indexes": {name: {"labels": getattr(work_store, name).labels,
+                                          "ids": getattr(work_store, name).ids,
+                                          "keys": getattr(work_store, name).keys}
+                                   for name in CATEGORY_INDEX_NAMES},
+              "columns": columns,
+              "row_lists": row_lists,
+              "identifier_with_error_list": list(identifier_with_error_list or []),
+              "query_statistics": dict(query_statistics or {}),
+              "aggregates": {"total_count": work_aggregates.total_count,
+                             **{name: table_to_pairs(getattr(work_aggregates, name))
+                                for name in AGGREGATE_TABLE_NAMES},
+                             **{name: getattr(work_aggregates, name) for name in AGGREGATE_LIST_NAMES},
+                             **{name: getattr(work_aggregates, name) for name in AGGREGATE_NAME_NAMES}}}
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    prefix = SNAPSHOT_MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes
+    prefix += b"\0" * (-len(prefix) % 8)
+    file.write(prefix)
+    file.write(data.getbuffer())
+    return len(prefix) + data.tell()
+
+
+def save_snapshot(path: str,
+                  work_store: WorkStore,
+                  identifier_with_error_list: list = None,
+                  query_statistics: Counter = None):
+    """
+    Saves a query result to a snapshot file, see write_snapshot(). The file is replaced atomically.
+
+    :param path: snapshot file path, by convention ending in SNAPSHOT_EXTENSION
+    :param work_store: WorkStore to save
+    :param identifier_with_error_list: list of identifiers with errors
+    :param query_statistics: counter of the query, e.g. cache hits and misses
+    :return: number of bytes written
+    """
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        byte_count = write_snapshot(file, work_store, identifier_with_error_list, query_statistics)
+    os.replace(temporary_path, path)
+    return byte_count
+
+
+def load_snapshot(path: str):
+    """
+    Loads a snapshot file saved by save_snapshot(). The file is memory-mapped: code columns are copied into the
+    WorkStore's arrays in one step each, and authorships and topics are decoded lazily (see LazyRowList). The saved
+    aggregates are registered with aggregate_works(), so they are not recomputed (except for snapshots saved before
+    the tables were keyed by canonical ID).
+
+    :param path: snapshot file path
+    :return: dictionary of the query result WorkStore, error list, query statistics and aggregates. Raises ValueError
+    if the file is not a snapshot.
+    """
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a bibliography snapshot.")
+    header_length = struct.unpack_from("<Q", buffer, len(SNAPSHOT_MAGIC))[0]
+    header_start = len(SNAPSHOT_MAGIC) + 8
+    header = json.loads(buffer[header_start:header_start + header_length])
+    if header["version"] > SNAPSHOT_VERSION:
+        raise ValueError(f"{path} was saved by a newer version of the app.")
+    data_start = header_start + header_length + (-(header_start + header_length) % 8)
+    data = memoryview(buffer)[data_start:]
+
+    work_store = WorkStore()
+    offset, length = header["columns"]["identifiers"]
+    identifiers = bytes(data[offset:offset + length]).decode("utf-8").split("\0") if header["row_count"] else []
+    work_store.identifiers = identifiers
+    work_store.rows = {identifier: row for row, identifier in enumerate(identifiers)}
+    for name in CATEGORY_INDEX_NAMES:
+        category_index = CategoryIndex()
+        category_index.labels = header["category_indexes"][name]["labels"]
+        category_index.ids = header["category_indexes"][name]["ids"]
+        # Snapshots saved before venues, keywords and concepts were normalized key every value by its label.
+        category_index.keys = header["category_indexes"][name].get("keys", category_index.labels)
+        category_index.codes = {key: code for code, key in enumerate(category_index.keys)}
+        setattr(work_store, name, category_index)
+    for name in CODE_COLUMN_NAMES:
+        offset, length, typecode, itemsize = header["columns"][name]
+        column = array(typecode)
+        if column.itemsize != itemsize:
+            raise ValueError(f"{path} was saved on a platform with a different {typecode!r} array item size.")
+        column.frombytes(data[offset:offset + length])
+        if header["byteorder"] != sys.byteorder:
+            column.byteswap()
+        setattr(work_store, name, column)
+    for name in ROW_LIST_NAMES:
+        setattr(work_store, name, LazyRowList(data, header["row_lists"][name], header["row_count"],
+                                              header["block_rows"]))
+
+    saved_aggregates = header["aggregates"]
+    if all(name in saved_aggregates for name in AGGREGATE_NAME_NAMES):
+        work_aggregates = WorkAggregates()
+        work_aggregates.total_count = saved_aggregates["total_count"]
+        for name in AGGREGATE_TABLE_NAMES:
+            setattr(work_aggregates, name, {key: value for key, value in saved_aggregates[name]})
+        for name in AGGREGATE_LIST_NAMES + AGGREGATE_NAME_NAMES:
+            setattr(work_aggregates, name, saved_aggregates[name])
+        aggregates_memo[work_store] = (len(work_store), work_aggregates)
+    else:
+        # Older snapshots keyed venue, keyword and concept tables by display name; they are recounted from the columns.
+        work_aggregates = aggregate_works(work_store)
+
+    return {'work_store': work_store,
+            'identifier_with_error_list': header["identifier_with_error_list"],
+            'query_statistics': Counter(header["query_statistics"]),
+            'work_aggregates': work_aggregates,
+            'created': header["created"]}
@@ -0,0 +1,53 @@
+import hashlib
+import os
+
+import shiny
+from shiny import ui
+
+PAGE_CACHE_DIRECTORY = os.environ.get("PAGE_CACHE_DIRECTORY",
+                                      os.path.join(os.path.expanduser("~"), ".cache", "computable_bibliography",
+                                                   "pages"))
+MARKDOWN_PAGES = ["how_to_instructions.md", "example_page.md"]
+
+
+def markdown_html(text: str):
+    """
+    Renders markdown to HTML like ui.markdown(), caching the rendered HTML on disk keyed by a hash of the text and the
+    Shiny version. On a cache hit the markdown parser is not imported, which shortens cold starts of the app.
+
+    :param text: markdown text
+    :return: ui.HTML
+    """
+    digest = hashlib.blake2b(f"{shiny.__version__}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+    path = os.path.join(PAGE_CACHE_DIRECTORY, f"{digest}.html")
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return ui.HTML(file.read())
+    except OSError:
+        pass
+    html = ui.markdown(text)
+    try:
+        os.makedirs(PAGE_CACHE_DIRECTORY, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(str(html))
+        os.replace(temporary_path, path)
+    except OSError:
+        pass  # A read-only file system only costs the cache.
+    return html
+
+
+def markdown_file_html(filename: str):
+    """
+    :param filename: path to a markdown file
+    :return: ui.HTML of the rendered file, see markdown_html()
+    """
+    with open(filename, "r", encoding="utf-8") as file:
+        return markdown_html(file.read())
+
+
+if __name__ == "__main__":
+    # Prebuilds the page cache, e.g. while building a deployment image.
+    for filename in MARKDOWN_PAGES:
+        markdown_file_html(filename)
+        print(f"Rendered {filename}")
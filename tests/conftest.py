@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app's modules live at the repository root. The persistent caches default to ~/.cache and are read when their
+# modules are imported, so they are pointed at a temporary directory before any test imports them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CACHE_DIRECTORY = tempfile.mkdtemp(prefix="computable-bibliography-tests-")
+os.environ["WORK_CACHE_PATH"] = os.path.join(CACHE_DIRECTORY, "works.sqlite3")
+os.environ["PAGE_CACHE_DIRECTORY"] = os.path.join(CACHE_DIRECTORY, "pages")
+os.environ["NORMALIZATION_INDEX_PATH"] = os.path.join(CACHE_DIRECTORY, "normalization.json")
+
+
+@pytest.fixture
+def open_alex(monkeypatch):
+    """
+    :return: running benchmarks.fake_open_alex.FakeOpenAlexServer serving synthetic works, used as
+    query_open_alex.OPEN_ALEX_WORKS_URL for the test
+    """
+    import query_open_alex
+    from benchmarks.fake_open_alex import FakeOpenAlexServer
+
+    with FakeOpenAlexServer(fixtures=[]) as fake_server:
+        monkeypatch.setattr(query_open_alex, "OPEN_ALEX_WORKS_URL", fake_server.url)
+        yield fake_server
+
+SYNTHETIC_WORK_COUNT = 400
+
+
+def special_works():
+    """
+    :return: dictionary of identifier to Work object with the values synthetic works lack: missing keyword and concept
+    lists, and two distinct venues that share a display name
+    """
+    from benchmarks.fake_open_alex import create_synthetic_work
+
+    base = create_synthetic_work("10.5555/special")
+    return {"10.5555/no-values": {**base, "type": None, "publication_year": None, "primary_location": None,
+                                  "keywords": None, "concepts": None},
+            **{f"10.5555/proceedings-{name}": {**base, "type": "article", "primary_location": {"source": {
+                "id": f"https://openalex.org/SP{name}", "display_name": "Proceedings", "issn_l": None,
+                "type": "conference"}}} for name in "ab"}}
+
+
+@pytest.fixture
+def work_store():
+    """
+    :return: WorkStore of SYNTHETIC_WORK_COUNT synthetic works and special_works(), with its own normalization index
+    """
+    from benchmarks.fake_open_alex import create_synthetic_work
+    from normalization_index import NormalizationIndex
+    from work_store import WorkStore
+
+    store = WorkStore(NormalizationIndex())
+    for number in range(SYNTHETIC_WORK_COUNT):
+        store.add_work(f"https://doi.org/10.5555/{number}", create_synthetic_work(f"10.5555/{number}"))
+    for identifier, work in special_works().items():
+        store.add_work(identifier, work)
+    return store
@@ -0,0 +1,49 @@
+import pytest
+
+from authorship_analytics import build_authorship_network, collaboration_summary, top_authors, top_institutions
+from work_store import WorkStore
+
+
+def authorship(author: str, institution: str = None):
+    return {"author": {"id": f"https://openalex.org/{author}", "display_name": f"Author {author}"},
+            "institutions": [] if institution is None else [{"id": f"https://openalex.org/{institution}",
+                                                             "display_name": f"Institution {institution}"}]}
+
+
+@pytest.fixture
+def network_store():
+    authorship_lists = [[authorship("A1", "I1"), authorship("A2", "I1")],
+                        [authorship("A2"), authorship("A3", "I2")],
+                        [authorship("A4")],
+                        [],
+                        [authorship("A1", "I1"), authorship("A1", "I1")]]
+    store = WorkStore()
+    for number, authorships in enumerate(authorship_lists):
+        store.add_work(f"10.5555/{number}", {"type": "article", "publication_year": 2020, "primary_location": None,
+                                             "authorships": authorships, "keywords": [], "concepts": [],
+                                             "topics": []})
+    return store
+
+
+def test_network_counts_authors_institutions_and_components(network_store):
+    network = build_authorship_network(network_store)
+
+    assert top_authors(network) == {"Author A1": 2, "Author A2": 2, "Author A3": 1, "Author A4": 1}
+    assert top_institutions(network) == {"Institution I1": 2, "Institution I2": 1}
+    assert dict(zip(network.author_names, network.coauthor_degrees.tolist())) == {
+        "Author A1": 1, "Author A2": 2, "Author A3": 1, "Author A4": 0}
+    assert sorted(network.component_sizes.tolist()) == [1, 3]
+
+    summary = collaboration_summary(network)
+    assert (summary["works"], summary["authorships"], summary["authors"]) == (5, 7, 4)
+    assert summary["mean_authors_per_work"] == pytest.approx(1.5)
+    assert summary["degree_of_collaboration"] == pytest.approx(0.5)
+    assert summary["largest_component_authors"] == 3
+
+
+def test_large_author_lists_are_left_out_of_degrees(network_store):
+    network = build_authorship_network(network_store, max_coauthors=1)
+
+    assert network.coauthor_degrees.tolist() == [0, 0, 0, 0]
+    assert network.excluded_work_count == 2
+    assert sorted(network.component_sizes.tolist()) == [1, 3]
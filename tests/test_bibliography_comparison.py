@@ -0,0 +1,46 @@
+import itertools
+
+import pytest
+
+from bibliography_comparison import (COMPARISON_ATTRIBUTES, build_comparison, comparison_names, jaccard_matrix,
+                                     list_frequency, overlap_matrix)
+from work_aggregates import aggregate_works
+
+
+@pytest.fixture
+def cleaned_input_lists(work_store):
+    identifiers = work_store.identifiers
+    return {"first": identifiers[:250] + ["10.5555/missing-1"],
+            "second": identifiers[150:] + ["10.5555/missing-1", "10.5555/missing-2"],
+            "third": identifiers[::7],
+            "empty": []}
+
+
+def test_overlaps_match_set_intersections(work_store, cleaned_input_lists):
+    comparison = build_comparison(work_store, cleaned_input_lists)
+    overlaps = overlap_matrix(comparison)
+    similarities = jaccard_matrix(comparison)
+
+    found_sets = [set(cleaned_input_list) & set(work_store.identifiers)
+                  for cleaned_input_list in cleaned_input_lists.values()]
+    for (i, first), (j, second) in itertools.product(enumerate(found_sets), repeat=2):
+        assert overlaps[i, j] == len(first & second)
+        union = len(first | second)
+        assert similarities[i, j] == pytest.approx(len(first & second) / union if union else 0.0)
+    assert comparison.doi_counts == [len(cleaned_input_list) for cleaned_input_list in cleaned_input_lists.values()]
+
+
+def test_list_frequencies_match_aggregates_of_each_list(work_store, cleaned_input_lists):
+    comparison = build_comparison(work_store, cleaned_input_lists)
+
+    for j, cleaned_input_list in enumerate(cleaned_input_lists.values()):
+        list_store = work_store.subset([work_store.rows[identifier] for identifier in cleaned_input_list
+                                        if identifier in work_store])
+        work_aggregates = aggregate_works(list_store)
+        for attribute in COMPARISON_ATTRIBUTES:
+            frequency = list_frequency(comparison, attribute, j)
+            assert frequency == getattr(work_aggregates, f"{attribute}_frequency"), attribute
+            assert list(frequency.values()) == sorted(frequency.values(), reverse=True)
+            names = getattr(work_aggregates, f"{attribute}_names", None)
+            if names is not None:
+                assert {key: comparison_names(comparison, attribute)[key] for key in frequency} == names
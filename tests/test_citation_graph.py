@@ -0,0 +1,33 @@
+from citation_graph import expand_citation_graph
+from query_open_alex import clean_input_list
+
+
+def test_references_of_the_seed_works_are_added_with_edges(open_alex):
+    graph = expand_citation_graph(clean_input_list(["10.5555/1", "10.5555/2", "10.5555/missing-1"]),
+                                  direction="references")
+    seed_works = [open_alex.work("10.5555/1"), open_alex.work("10.5555/2")]
+    expected_edges = {(work["id"], reference_id) for work in seed_works for reference_id in work["referenced_works"]}
+
+    assert graph.seed_count == 2 and graph.identifier_with_error_list == ["https://doi.org/10.5555/missing-1"]
+    assert set(graph.node_index.labels[:2]) == {work["id"] for work in seed_works}
+    assert set(graph.node_index.labels[2:]) == {target for _, target in expected_edges}
+    assert list(graph.depths) == [0, 0] + [1] * (len(graph) - 2)
+    labels = graph.node_index.labels
+    assert {(labels[source], labels[target]) for source, target in zip(graph.edge_sources, graph.edge_targets)
+            } >= expected_edges
+    assert graph.failed_batch_count == 0 and not graph.truncated
+
+
+def test_crawl_stops_at_max_nodes(open_alex):
+    graph = expand_citation_graph(clean_input_list([f"10.5555/{number}" for number in range(5)]), max_nodes=8)
+
+    assert len(graph) == 8 and graph.truncated
+
+
+def test_fetched_works_are_bounded_by_max_nodes(open_alex):
+    graph = expand_citation_graph(clean_input_list([f"10.5555/budget-{number}" for number in range(30)]),
+                                  max_nodes=100)
+
+    assert len(graph) == 100 and graph.truncated
+    assert open_alex.statistics["works"] <= 100
+    assert graph.failed_batch_count == 0
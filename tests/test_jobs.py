@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from jobs import CANCELLED, DONE, JobManager, JobQueueFullError, QueryJob
+
+
+class BlockingJob(QueryJob):
+    """
+    Job that occupies a worker until released, to keep later jobs queued.
+    """
+
+    def __init__(self, session_id: str):
+        super().__init__(session_id, [])
+        self.release = threading.Event()
+
+    def run(self):
+        self.release.wait(10)
+        with self.lock:
+            self.finish(DONE)
+
+
+def wait_until(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def busy_manager():
+    """
+    :return: JobManager with one worker, busy with a BlockingJob until the test ends
+    """
+    manager = JobManager(max_running=1, max_queued=4)
+    blocking_job = manager.submit(BlockingJob("blocking"))
+    wait_until(lambda: manager.statistics()["running"] == 1)
+    yield manager
+    blocking_job.release.set()
+
+
+def test_job_collects_query_results(open_alex):
+    manager = JobManager(max_running=1)
+    job = manager.submit(QueryJob("session", ["10.5555/a", "10.5555/b", "10.5555/missing-1"]))
+    wait_until(lambda: job.done)
+    snapshot = job.snapshot()
+
+    assert snapshot["status"] == DONE
+    assert sorted(snapshot["work_store"].identifiers) == ["10.5555/a", "10.5555/b"]
+    assert snapshot["identifier_with_error_list"] == ["10.5555/missing-1"]
+    assert snapshot["completed_count"] == snapshot["total_count"] == 3
+    assert manager.jobs("session") == [job]
+
+
+def test_queued_jobs_take_turns_across_sessions(busy_manager):
+    first_jobs = [busy_manager.submit(QueryJob("first", [])) for _ in range(3)]
+    second_job = busy_manager.submit(QueryJob("second", []))
+
+    assert [job.queue_position for job in first_jobs] == [1, 3, 4]
+    assert second_job.queue_position == 2
+    assert busy_manager.statistics()["waiting_sessions"] == 2
+
+
+def test_full_queue_rejects_jobs(busy_manager):
+    for _ in range(4):
+        busy_manager.submit(QueryJob("session", []))
+
+    with pytest.raises(JobQueueFullError):
+        busy_manager.submit(QueryJob("other", []))
+
+
+def test_cancelled_jobs_leave_the_queue(busy_manager):
+    for _ in range(3):
+        for _ in range(4):
+            job = busy_manager.submit(QueryJob("session", []))
+        busy_manager.cancel(job)
+        assert job.status == CANCELLED and job.queue_position is None
+        busy_manager.cancel_session("session")
+
+    assert busy_manager.statistics()["queued"] == 0
+    jobs = [busy_manager.submit(QueryJob("other", [])) for _ in range(4)]
+    assert [job.queue_position for job in jobs] == [1, 2, 3, 4]
@@ -0,0 +1,69 @@
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import offline_index as offline_index_module
+from benchmarks.fake_open_alex import create_synthetic_work
+from offline_index import OfflineIndex, ingest_snapshot
+
+
+def write_snapshot_file(path: str, work_list: list):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        for work in work_list:
+            file.write(json.dumps(work) + "\n")
+
+
+@pytest.fixture
+def offline_index(tmp_path):
+    """
+    :return: OfflineIndex of two snapshot files; the newer one updates the work of 10.5555/1
+    """
+    snapshot_directory = tmp_path / "works"
+    write_snapshot_file(str(snapshot_directory / "updated_date=2024-01-01" / "part_000.gz"),
+                        [create_synthetic_work(f"10.5555/{number}") for number in range(20)]
+                        + [{**create_synthetic_work("10.5555/no-doi"), "doi": None}])
+    write_snapshot_file(str(snapshot_directory / "updated_date=2025-01-01" / "part_000.gz"),
+                        [{**create_synthetic_work("10.5555/1"), "publication_year": 2025}])
+    assert ingest_snapshot([str(snapshot_directory)], str(tmp_path / "index"), max_workers=1) == 21
+    index = OfflineIndex(str(tmp_path / "index"))
+    yield index
+    index.close()
+
+
+def test_lookup_returns_the_newest_version_of_each_work(offline_index):
+    work_dictionary = offline_index.lookup(["10.5555/0", "10.5555/1", "10.5555/missing-1", "10.5555/0"])
+
+    assert sorted(work_dictionary) == ["10.5555/0", "10.5555/1"]
+    assert work_dictionary["10.5555/0"]["id"] == create_synthetic_work("10.5555/0")["id"]
+    assert work_dictionary["10.5555/1"]["publication_year"] == 2025
+    assert offline_index.lookup([]) == {}
+
+
+def test_iter_query_reports_missing_identifiers(offline_index):
+    identifier_list = ["https://doi.org/10.5555/2", "10.5555/3", "10.5555/no-doi", "not-a-doi"]
+    batches = list(offline_index.iter_query(identifier_list, batch_size=1))
+
+    assert [identifier for work_list, _ in batches for identifier, _ in work_list] == identifier_list[:2]
+    assert [identifier for _, error_list in batches for identifier in error_list] == identifier_list[2:]
+    with pytest.raises(ValueError):
+        list(offline_index.iter_query(identifier_list, select_fields=["abstract_inverted_index"]))
+
+
+def test_single_worker_lookups_stay_in_process(offline_index, tmp_path, monkeypatch):
+    def no_process_pool(*args, **kwargs):
+        raise AssertionError("lookup started a process pool")
+
+    monkeypatch.setattr(offline_index_module, "OFFLINE_PARALLEL_MIN_LOOKUPS", 1)
+    monkeypatch.setattr(offline_index_module, "ProcessPoolExecutor", no_process_pool)
+    index = OfflineIndex(str(tmp_path / "index"), max_workers=1)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(index.lookup, [["10.5555/1", "10.5555/2"]] * 32))
+    assert len(index.shard_buffers) == 2
+    index.close()
+
+    assert all(sorted(work_dictionary) == ["10.5555/1", "10.5555/2"] for work_dictionary in results)
+    assert all(work_dictionary["10.5555/1"]["publication_year"] == 2025 for work_dictionary in results)
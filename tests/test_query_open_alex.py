@@ -0,0 +1,31 @@
+from query_open_alex import normalize_doi, query_open_alex
+
+
+def test_batch_results_are_matched_to_identifiers(open_alex):
+    identifier_list = ["https://doi.org/10.5555/Alpha", "doi:10.5555/alpha", "10.5555/beta",
+                       "https://doi.org/10.5555/missing-1"]
+    work_store, identifier_with_error_list = query_open_alex(identifier_list)
+    type_dictionary, publication_year_dictionary = work_store.to_dictionaries()[4:6]
+
+    assert identifier_with_error_list == ["https://doi.org/10.5555/missing-1"]
+    assert sorted(work_store.identifiers) == sorted(identifier_list[:3])
+    for identifier in identifier_list[:3]:
+        expected = open_alex.work(normalize_doi(identifier))
+        assert type_dictionary[identifier] == expected["type"]
+        assert publication_year_dictionary[identifier] == expected["publication_year"]
+
+
+def test_dois_that_cannot_be_joined_are_queried_singly(open_alex):
+    identifier_list = ["10.5555/a|b", "10.5555/c", "10.5555/missing-2"]
+    work_store, identifier_with_error_list = query_open_alex(identifier_list)
+
+    assert identifier_with_error_list == ["10.5555/missing-2"]
+    assert sorted(work_store.identifiers) == ["10.5555/a|b", "10.5555/c"]
+
+
+def test_each_batch_is_one_request(open_alex):
+    identifier_list = [f"10.5555/batch-{number}" for number in range(151)]
+    work_store, identifier_with_error_list = query_open_alex(identifier_list, batch_size=50, requests_per_second=1000)
+
+    assert identifier_with_error_list == [] and len(work_store.identifiers) == 151
+    assert open_alex.statistics["requests"] == 4
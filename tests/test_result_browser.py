@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+
+import pytest
+
+from normalization_index import NormalizationIndex
+from result_browser import (RESULT_COLUMNS, filter_rows, iter_export_csv, iter_export_json_lines, result_page,
+                            row_values)
+from work_store import WorkStore
+
+
+def result_work(**fields):
+    """
+    :return: Work object with no values, updated with fields
+    """
+    return {"type": None, "publication_year": None, "primary_location": None, "authorships": [], "keywords": None,
+            "concepts": None, "topics": None, **fields}
+
+
+@pytest.fixture
+def result_store():
+    store = WorkStore(NormalizationIndex())
+    store.add_work("10.5555/full", result_work(
+        type="article",
+        publication_year=2021,
+        primary_location={"source": {"id": "https://openalex.org/S1", "display_name": "Journal of Tests",
+                                     "issn_l": "1234-5678", "type": "journal"}},
+        authorships=[{"author": {"id": f"https://openalex.org/A{number}", "display_name": name}}
+                     for number, name in enumerate(["Ada Lovelace", "Alan Turing", "Grace Hopper", "Edsger Dijkstra",
+                                                    "Barbara Liskov"])],
+        keywords=[{"id": "https://openalex.org/keywords/graph-theory", "display_name": "Graph theory"}],
+        concepts=[{"id": "https://openalex.org/C1", "display_name": "Mathematics"},
+                  {"id": "https://openalex.org/C2", "display_name": "Computer science"}],
+        topics=[{"id": "https://openalex.org/T1", "display_name": "Networks"}]))
+    store.add_work("10.5555/empty", result_work())
+    store.add_work("10.5555/unnamed", result_work(
+        authorships=[{"author": {"id": "https://openalex.org/A5", "display_name": None}},
+                     {"author": {"id": "https://openalex.org/A6", "display_name": "Alan Kay"}}],
+        topics=[{"id": "https://openalex.org/T2", "display_name": None}]))
+    return store
+
+
+def test_row_values_format_each_column(result_store):
+    assert row_values(result_store, 0) == ["10.5555/full", "article", "2021", "Journal of Tests",
+                                           "Ada Lovelace; Alan Turing; Grace Hopper; et al. (5 authors)",
+                                           "Graph theory", "Mathematics; Computer science", "Networks"]
+    assert row_values(result_store, 1) == ["10.5555/empty", "", "", "", "", "", "", ""]
+    assert row_values(result_store, 2) == ["10.5555/unnamed", "", "", "", "Alan Kay", "", "", ""]
+
+
+def test_filter_rows_matches_every_term(result_store):
+    assert list(filter_rows(result_store, "")) == [0, 1, 2]
+    assert filter_rows(result_store, "graph ADA") == [0]
+    assert filter_rows(result_store, "graph missing-term") == []
+
+
+def test_result_page_is_clamped(result_store):
+    assert result_page(result_store, [0, 1, 2], 5, 1) == (3, [row_values(result_store, 2)])
+    assert result_page(result_store, [], 1, 25) == (1, [])
+
+
+def test_exports_contain_every_row(result_store):
+    csv_rows = list(csv.reader(io.StringIO("".join(iter_export_csv(result_store)))))
+    assert csv_rows == [RESULT_COLUMNS] + [row_values(result_store, row) for row in range(3)]
+
+    json_lines = "".join(iter_export_json_lines(result_store, [1])).splitlines()
+    assert [json.loads(line)["identifier"] for line in json_lines] == ["10.5555/empty"]
@@ -0,0 +1,60 @@
+from shared_work_store import SharedWorkStore, record_size
+
+WORKS = {f"10.5555/{name}": {"id": f"https://openalex.org/W{number}"} for number, name in enumerate("abcd", 1)}
+
+
+def test_claim_splits_stored_in_flight_and_claimed_dois():
+    shared_store = SharedWorkStore()
+    stored, waiting, claimed = shared_store.claim("first", ["10.5555/a", "10.5555/b", "10.5555/a"])
+    assert (stored, waiting, claimed) == ({}, {}, ["10.5555/a", "10.5555/b"])
+
+    stored, waiting, claimed = shared_store.claim("second", ["10.5555/a", "10.5555/c"])
+    assert stored == {} and list(waiting) == ["10.5555/a"] and claimed == ["10.5555/c"]
+
+    shared_store.publish("first", {"10.5555/a": WORKS["10.5555/a"]})
+    assert waiting["10.5555/a"].result(timeout=1) is WORKS["10.5555/a"]
+    stored, waiting, claimed = shared_store.claim("third", ["10.5555/a"])
+    assert stored == {"10.5555/a": WORKS["10.5555/a"]} and waiting == {} and claimed == []
+    assert shared_store.statistics()["in_flight"] == 2
+
+
+def test_failed_dois_are_errors_for_waiting_queries():
+    shared_store = SharedWorkStore()
+    shared_store.claim("first", ["10.5555/a"])
+    _, waiting, _ = shared_store.claim("second", ["10.5555/a"])
+
+    shared_store.fail(["10.5555/a"])
+    assert waiting["10.5555/a"].result(timeout=1) is None
+    assert len(shared_store) == 0
+    assert shared_store.claim("third", ["10.5555/a"])[2] == ["10.5555/a"]
+
+
+def test_abandoned_dois_are_claimed_again():
+    shared_store = SharedWorkStore()
+    shared_store.claim("first", ["10.5555/a", "10.5555/b"])
+    _, waiting, _ = shared_store.claim("second", ["10.5555/a"])
+
+    shared_store.abandon(["10.5555/a", "10.5555/b"])
+    assert waiting["10.5555/a"].cancelled()
+    assert shared_store.statistics()["in_flight"] == 0
+    assert shared_store.claim("second", ["10.5555/a"])[2] == ["10.5555/a"]
+
+
+def test_stored_works_stay_within_max_bytes():
+    size = record_size(WORKS["10.5555/a"])
+    shared_store = SharedWorkStore(max_bytes=2 * size)
+    shared_store.claim("first", ["10.5555/a", "10.5555/b", "10.5555/c"])
+    shared_store.publish("first", {doi: WORKS[doi] for doi in ["10.5555/a", "10.5555/b", "10.5555/c"]})
+
+    statistics = shared_store.statistics()
+    assert statistics["entries"] == 2 and statistics["bytes"] == 2 * size and statistics["unstored"] == 1
+
+    shared_store.release("first")
+    assert shared_store.statistics()["unreferenced_bytes"] == 2 * size
+    shared_store.claim("second", ["10.5555/d"])
+    shared_store.publish("second", {"10.5555/d": WORKS["10.5555/d"]})
+
+    statistics = shared_store.statistics()
+    assert statistics["bytes"] <= statistics["max_bytes"]
+    assert statistics["evictions"] == 1
+    assert shared_store.claim("third", ["10.5555/a", "10.5555/d"])[0] == {"10.5555/d": WORKS["10.5555/d"]}
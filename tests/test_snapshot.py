@@ -0,0 +1,41 @@
+from collections import Counter
+
+import pytest
+
+import snapshot
+from snapshot import load_snapshot, save_snapshot
+from work_aggregates import aggregate_works, aggregates_memo, count_rows, sort_tables
+
+
+def test_snapshot_round_trip(work_store, tmp_path):
+    path = str(tmp_path / "result.cbsnap")
+    identifier_with_error_list = ["10.5555/missing-1", "not a doi"]
+    save_snapshot(path, work_store, identifier_with_error_list, Counter(requests=9, cache_hits=3))
+    loaded = load_snapshot(path)
+    loaded_store = loaded["work_store"]
+
+    assert loaded_store.identifiers == work_store.identifiers
+    assert loaded_store.to_dictionaries() == work_store.to_dictionaries()
+    assert loaded["identifier_with_error_list"] == identifier_with_error_list
+    assert loaded["query_statistics"] == Counter(requests=9, cache_hits=3)
+    assert aggregates_memo[loaded_store][1] is loaded["work_aggregates"]
+    assert vars(loaded["work_aggregates"]) == vars(aggregate_works(work_store))
+    assert vars(loaded["work_aggregates"]) == vars(sort_tables(count_rows(loaded_store)))
+
+
+def test_snapshot_without_names_is_reaggregated(work_store, tmp_path, monkeypatch):
+    path = str(tmp_path / "old.cbsnap")
+    monkeypatch.setattr(snapshot, "AGGREGATE_NAME_NAMES", [])
+    save_snapshot(path, work_store)
+    monkeypatch.undo()
+    loaded = load_snapshot(path)
+
+    assert vars(loaded["work_aggregates"]) == vars(aggregate_works(work_store))
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "dois.txt"
+    path.write_text("10.5555/1\n")
+
+    with pytest.raises(ValueError):
+        load_snapshot(str(path))
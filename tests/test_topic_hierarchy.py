@@ -0,0 +1,40 @@
+import pytest
+
+from topic_hierarchy import build_topic_hierarchy, child_level, roll_up
+from work_store import WorkStore
+
+
+def topic(number: int, subfield: int, field: int, domain: int):
+    return {"id": f"https://openalex.org/T{number}", "display_name": f"Topic {number}",
+            "subfield": {"id": f"https://openalex.org/subfields/{subfield}", "display_name": f"Subfield {subfield}"},
+            "field": {"id": f"https://openalex.org/fields/{field}", "display_name": f"Field {field}"},
+            "domain": {"id": f"https://openalex.org/domains/{domain}", "display_name": f"Domain {domain}"}}
+
+
+@pytest.fixture
+def topic_store():
+    topics = {1: topic(1, 1, 1, 1), 2: topic(2, 2, 1, 1), 3: topic(3, 3, 2, 2)}
+    topic_lists = [[topics[1], topics[3]], [topics[2]], [topics[3]], []]
+    store = WorkStore()
+    for number, topic_list in enumerate(topic_lists):
+        store.add_work(f"10.5555/{number}", {"type": "article", "publication_year": 2020, "primary_location": None,
+                                             "authorships": [], "keywords": [], "concepts": [], "topics": topic_list})
+    return store
+
+
+def test_topics_roll_up_to_every_level(topic_store):
+    hierarchy = build_topic_hierarchy(topic_store)
+
+    assert roll_up(hierarchy, "topic") == {"Topic 1": 1, "Topic 2": 1, "Topic 3": 2}
+    assert roll_up(hierarchy, "field") == {"Field 1": 2, "Field 2": 2}
+    assert roll_up(hierarchy, "domain", primary_only=True) == {"Domain 2": 1, "Domain 1": 2}
+    assert hierarchy.none_count == 1
+
+
+def test_drill_down_counts_the_children_of_one_parent(topic_store):
+    hierarchy = build_topic_hierarchy(topic_store)
+
+    assert roll_up(hierarchy, "field", "domain", "Domain 1") == {"Field 1": 2}
+    assert roll_up(hierarchy, "subfield", "field", "Field 1") == {"Subfield 1": 1, "Subfield 2": 1}
+    assert roll_up(hierarchy, "topic", "domain", "Unknown domain") == {}
+    assert child_level("domain") == "field" and child_level("topic") is None
@@ -0,0 +1,48 @@
+from work_aggregates import (WorkAggregates, aggregate_works, aggregates_memo, count_rows, display_frequency,
+                             remove_works, sort_tables)
+
+
+def recomputed(work_store):
+    """
+    :return: aggregates counted from every row, bypassing the memoized aggregates
+    """
+    return sort_tables(count_rows(work_store))
+
+
+def assert_same_aggregates(work_aggregates: WorkAggregates, expected: WorkAggregates):
+    for name, value in vars(expected).items():
+        assert getattr(work_aggregates, name) == value, name
+        if name.endswith("_frequency"):
+            assert list(getattr(work_aggregates, name)) == list(value), f"{name} order"
+
+
+def test_remove_works_matches_full_recompute(work_store):
+    aggregate_works(work_store)
+    removed = [identifier for identifier in work_store.identifiers[::3] if identifier.startswith("https://doi.org/")]
+    removed += ["10.5555/no-values", "10.5555/proceedings-a", "10.5555/not-in-store"]
+    pruned_store = remove_works(work_store, removed)
+
+    assert len(pruned_store) == len(work_store) - len(set(removed) & set(work_store.identifiers))
+    assert aggregates_memo[pruned_store][0] == len(pruned_store)
+    assert_same_aggregates(aggregate_works(pruned_store), recomputed(pruned_store))
+    venue_names = aggregate_works(pruned_store).primary_location_names
+    assert "https://openalex.org/SPa" not in venue_names and "https://openalex.org/SPb" in venue_names
+
+
+def test_added_works_are_combined_with_memoized_aggregates(work_store):
+    identifiers = list(work_store.identifiers)
+    partial_store = work_store.subset(list(range(len(identifiers) // 2)))
+    aggregate_works(partial_store)
+    for row in range(len(identifiers) // 2, len(identifiers)):
+        partial_store.add_work(identifiers[row], work_store.work_dictionary(row))
+
+    assert_same_aggregates(aggregate_works(partial_store), recomputed(partial_store))
+    assert_same_aggregates(aggregate_works(partial_store), recomputed(work_store))
+
+
+def test_venues_sharing_a_name_are_counted_separately(work_store):
+    work_aggregates = aggregate_works(work_store)
+    venues = display_frequency(work_aggregates.primary_location_frequency, work_aggregates.primary_location_names)
+
+    assert venues["Proceedings (SPa)"] == 1
+    assert venues["Proceedings (SPb)"] == 1
@@ -0,0 +1,80 @@
+import json
+import types
+import zlib
+
+import pytest
+
+import work_cache
+from work_cache import WorkCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(work_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def stored_size(work: dict):
+    return len(zlib.compress(json.dumps(work, separators=(",", ":")).encode("utf-8")))
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = WorkCache(":memory:", ttl=60)
+    cache.put("10.5555/a", {"id": "W1"})
+    cache.put("10.5555/b", {"id": "W2"}, ttl=600)
+
+    clock[0] += 59
+    assert cache.get_many(["10.5555/a", "10.5555/b"]) == {"10.5555/a": {"id": "W1"}, "10.5555/b": {"id": "W2"}}
+    clock[0] += 1
+    assert cache.get("10.5555/a") is None
+    assert cache.get("10.5555/b") == {"id": "W2"}
+    assert len(cache) == 1
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    works = {f"10.5555/{name}": {"id": f"W{number}"} for number, name in enumerate("abc", 1)}
+    cache = WorkCache(":memory:", max_bytes=2 * stored_size(works["10.5555/a"]))
+    for doi in ["10.5555/a", "10.5555/b"]:
+        cache.put(doi, works[doi])
+        clock[0] += 1
+    assert cache.get("10.5555/a") == works["10.5555/a"]  # Now more recently used than b.
+    clock[0] += 1
+    cache.put("10.5555/c", works["10.5555/c"])
+
+    assert cache.get_many(list(works)) == {"10.5555/a": works["10.5555/a"], "10.5555/c": works["10.5555/c"]}
+
+
+def test_put_replaces_entries():
+    cache = WorkCache(":memory:")
+    cache.put("10.5555/a", {"id": "W1"})
+    cache.put_many({"10.5555/a": {"id": "W2"}})
+
+    assert cache.get("10.5555/a") == {"id": "W2"}
+    assert len(cache) == 1
+
+
+def test_running_total_tracks_stored_sizes(clock):
+    replacement = {"id": "W1", "title": "A longer replacement work"}
+    cache = WorkCache(":memory:", ttl=60)
+    cache.put_many({"10.5555/a": {"id": "W1"}, "10.5555/b": {"id": "W2"}})
+    cache.put("10.5555/a", replacement, ttl=600)
+    assert cache.total_bytes == cache.stored_bytes() == stored_size({"id": "W2"}) + stored_size(replacement)
+
+    clock[0] += 60
+    assert cache.get("10.5555/b") is None
+    cache.invalidate(["10.5555/a", "10.5555/missing"])
+    assert cache.total_bytes == cache.stored_bytes() == 0
+
+
+def test_table_is_only_scanned_over_budget(clock):
+    work = {"id": "W1"}
+    cache = WorkCache(":memory:", max_bytes=2 * stored_size(work))
+    statements = []
+    cache.connection.set_trace_callback(statements.append)
+    cache.put_many({"10.5555/a": work, "10.5555/b": work})
+    assert not any("SUM(size)" in statement or "ORDER BY" in statement for statement in statements)
+
+    cache.put("10.5555/c", work)
+    assert any("SUM(size)" in statement for statement in statements)
+    assert len(cache) == 2 and cache.total_bytes == cache.stored_bytes()
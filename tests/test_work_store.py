@@ -0,0 +1,16 @@
+from normalization_index import NormalizationIndex
+from work_store import WorkStore
+
+
+def test_values_without_id_or_name_are_left_out_of_labels():
+    store = WorkStore(NormalizationIndex())
+    unnamed = {"id": None, "display_name": None}
+    keyword = {"id": "https://openalex.org/keywords/k", "display_name": "Keyword"}
+    concept = {"id": "https://openalex.org/C1", "display_name": "Concept"}
+    store.add_work("10.5555/unnamed", {"type": "article", "publication_year": 2020, "primary_location": None,
+                                       "authorships": [], "topics": [], "keywords": [unnamed, keyword],
+                                       "concepts": [concept, unnamed]})
+
+    assert store.keyword_labels(0) == ["Keyword"]
+    assert store.concept_labels(0) == ["Concept"]
+    assert store.work_dictionary(0)["keywords"] == [keyword]
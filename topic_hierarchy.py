@@ -0,0 +1,120 @@
+import weakref
+from array import array
+
+from work_store import CategoryIndex, WorkStore, NONE_CODE
+
+TOPIC_LEVELS = ["domain", "field", "subfield", "topic"]  # From the broadest to the narrowest level.
+
+topic_hierarchy_memo = weakref.WeakKeyDictionary()
+
+
+class TopicHierarchy:
+    """
+    Index of the OpenAlex topic hierarchy (domain > field > subfield > topic) of a WorkStore, built by
+    build_topic_hierarchy(). Every level is interned as integer codes, and ancestor_codes[level][t] is the code at that
+    level of the ancestor of topic code t, so a topic table rolls up to any level with one array reduction.
+
+    Topics of each work are stored in CSR form: work i has the topic codes
+    work_topics[work_topic_offsets[i]:work_topic_offsets[i + 1]], the first of which is its primary topic.
+    """
+
+    def __init__(self):
+        self.indexes = {level: CategoryIndex() for level in TOPIC_LEVELS}
+        self.ancestor_codes = {}
+        self.work_topic_offsets = None
+        self.work_topics = None
+        self.topic_counts = None
+        self.primary_topic_counts = None
+        self.work_count = 0
+        self.none_count = 0
+
+
+def build_topic_hierarchy(work_store: WorkStore):
+    """
+    Builds the topic hierarchy index of a WorkStore in one pass over its topics, then counts the works per topic with
+    np.bincount. The result is memoized per WorkStore and rebuilt only if works have been added since.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :return: TopicHierarchy
+    """
+    import numpy as np
+
+    memoized = topic_hierarchy_memo.get(work_store)
+    if memoized is not None and memoized[0] == len(work_store):
+        return memoized[1]
+
+    hierarchy = TopicHierarchy()
+    topic_index = hierarchy.indexes["topic"]
+    ancestor_columns = {level: array("i") for level in TOPIC_LEVELS[:-1]}
+    work_topic_offsets = array("q", [0])
+    work_topics = array("i")
+    for topics in work_store.topics:
+        if not topics:
+            hierarchy.none_count += 1
+        for topic in topics or []:
+            topic_code = topic_index.intern(topic.get("display_name"), topic.get("id"))
+            if topic_code == NONE_CODE:
+                continue
+            if topic_code == len(ancestor_columns["domain"]):
+                for level, column in ancestor_columns.items():
+                    ancestor = topic.get(level) or {}
+                    column.append(hierarchy.indexes[level].intern(ancestor.get("display_name"), ancestor.get("id")))
+            work_topics.append(topic_code)
+        work_topic_offsets.append(len(work_topics))
+
+    topic_count = len(topic_index)
+    hierarchy.work_count = len(work_topic_offsets) - 1
+    hierarchy.work_topic_offsets = np.array(work_topic_offsets, dtype=np.int64)
+    hierarchy.work_topics = np.array(work_topics, dtype=np.int32)
+    hierarchy.ancestor_codes = {level: np.array(column, dtype=np.int32) for level, column in ancestor_columns.items()}
+    hierarchy.ancestor_codes["topic"] = np.arange(topic_count, dtype=np.int32)
+    hierarchy.topic_counts = np.bincount(hierarchy.work_topics, minlength=topic_count)
+    has_topic = np.diff(hierarchy.work_topic_offsets) > 0
+    hierarchy.primary_topic_counts = np.bincount(hierarchy.work_topics[hierarchy.work_topic_offsets[:-1][has_topic]],
+                                                 minlength=topic_count)
+
+    topic_hierarchy_memo[work_store] = (len(work_store), hierarchy)
+    return hierarchy
+
+
+def roll_up(hierarchy: TopicHierarchy,
+            level: str,
+            parent_level: str = None,
+            parent_label: str = None,
+            primary_only: bool = False):
+    """
+    Rolls the topic counts up to a level of the hierarchy with a single scatter-add (np.bincount with weights),
+    optionally only within one parent, e.g. the fields of one domain.
+
+    By default every topic assigned to a work is counted, so a work with topics in two fields counts once for each
+    field; with primary_only, each work counts once, for its primary topic.
+
+    :param hierarchy: TopicHierarchy from build_topic_hierarchy()
+    :param level: level to count, see TOPIC_LEVELS
+    :param parent_level: broader level to drill down from, or None for all topics
+    :param parent_label: display name of the parent at parent_level
+    :param primary_only: count only the primary topic of each work
+    :return: dictionary of label to frequency for labels that occur, sorted by ascending frequency like the tables of
+    aggregate_works()
+    """
+    import numpy as np
+
+    counts = hierarchy.primary_topic_counts if primary_only else hierarchy.topic_counts
+    ancestors = hierarchy.ancestor_codes[level]
+    keep = ancestors != NONE_CODE
+    if parent_level is not None:
+        parent_code = hierarchy.indexes[parent_level].codes.get(parent_label, NONE_CODE)
+        keep &= hierarchy.ancestor_codes[parent_level] == parent_code
+    labels = hierarchy.indexes[level].labels
+    level_counts = np.bincount(ancestors[keep], weights=counts[keep], minlength=len(labels))
+    frequency = {labels[code]: int(level_counts[code]) for code in np.flatnonzero(level_counts)}
+    return dict(sorted(frequency.items(), key=lambda x: (x[1], x[0])))
+
+
+def child_level(level: str):
+    """
+    :param level: level of the hierarchy, see TOPIC_LEVELS
+    :return: next narrower level, or None for topics
+    """
+    position = TOPIC_LEVELS.index(level)
+    return TOPIC_LEVELS[position + 1] if position + 1 < len(TOPIC_LEVELS) else None
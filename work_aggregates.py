@@ -0,0 +1,317 @@
+import weakref
+from collections import Counter
+
+from work_store import CategoryIndex, WorkStore, NONE_CODE
+
+JOURNAL_ARTICLE_LABEL = 'journal\narticle'
+CONFERENCE_PROCEEDING_LABEL = 'conference\nproceeding'
+
+
+class WorkAggregates:
+    """
+    Frequency tables and None lists for every plot, computed once per WorkStore by aggregate_works(). The
+    create_*_frequency_plot functions only render these tables.
+
+    Venue, keyword and concept tables are keyed by the canonical key of each value (see WorkStore), so distinct values
+    that share a display name are counted separately. The *_names dictionaries map these keys to display names, which
+    are only resolved when rendering, see display_frequency().
+    """
+
+    def __init__(self):
+        self.total_count = 0
+        self.type_frequency = {}
+        self.type_none_list = []
+        self.year_frequency = {}
+        self.year_none_list = []
+        self.primary_location_frequency = {}
+        self.primary_location_names = {}
+        self.primary_location_none_list = []
+        self.keyword_frequency = {}
+        self.keyword_names = {}
+        self.keyword_none_list = []
+        self.concepts_frequency = {}
+        self.concepts_names = {}
+        self.concepts_none_list = []
+
+
+aggregates_memo = weakref.WeakKeyDictionary()
+
+
+def column_array(column, dtype, rows=None):
+    """
+    Copies a WorkStore column, or the values of some of its rows, into a NumPy array. The temporary zero-copy view is
+    released immediately, so the column can still grow afterward.
+
+    :param column: array.array column of a WorkStore
+    :param dtype: NumPy dtype matching the column's typecode
+    :param rows: row numbers to copy, as a range or a list; None for every row
+    :return: NumPy array
+    """
+    import numpy as np
+
+    if rows is None:
+        return np.frombuffer(column, dtype=dtype).copy()
+    if isinstance(rows, range) and rows.step == 1:
+        return np.frombuffer(column[rows.start:rows.stop], dtype=dtype).copy()
+    return np.fromiter((column[row] for row in rows), dtype=dtype, count=len(rows))
+
+
+def flat_codes(codes, offsets, rows=None):
+    """
+    Copies the codes of some rows of a flat code column with row offsets (keywords or concepts) into a NumPy array.
+
+    :param codes: flat array.array code column
+    :param offsets: array.array row offsets of the code column
+    :param rows: row numbers to copy, as a range or a list; None for every row
+    :return: NumPy array of codes
+    """
+    import numpy as np
+
+    if rows is None:
+        return column_array(codes, np.intc)
+    if isinstance(rows, range) and rows.step == 1:
+        return np.frombuffer(codes[offsets[rows.start]:offsets[rows.stop]], dtype=np.intc).copy()
+    return np.fromiter((code for row in rows for code in codes[offsets[row]:offsets[row + 1]]), dtype=np.intc)
+
+
+def count_codes(codes: "numpy.ndarray", keys: list):
+    """
+    Counts categorical codes with np.bincount, skipping NONE_CODE.
+
+    :param codes: array of codes into keys
+    :param keys: list of keys indexed by code, e.g. the keys of a CategoryIndex
+    :return: dictionary of key to frequency for keys that occur
+    """
+    import numpy as np
+
+    counts = np.bincount(codes[codes != NONE_CODE], minlength=len(keys))
+    return {keys[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+
+def key_names(frequency: dict, category_index: CategoryIndex):
+    """
+    :param frequency: frequency dictionary keyed by the keys of category_index, see count_codes()
+    :param category_index: venue, keyword or concept index of a WorkStore
+    :return: dictionary of key to canonical display name for the keys of the table
+    """
+    labels = category_index.labels
+    codes = category_index.codes
+    return {key: labels[codes[key]] for key in frequency}
+
+
+def display_labels(keys: list, names: dict):
+    """
+    Resolves canonical keys to display names for rendering. Keys that share a display name, e.g. two different
+    venues named "Proceedings", keep one label each, told apart by the end of their key.
+
+    :param keys: canonical keys, see WorkStore
+    :param names: dictionary of key to display name; keys without a name, e.g. "Other", are shown as they are
+    :return: list of display labels, in the order of keys
+    """
+    labels = [names.get(key, key) for key in keys]
+    label_counts = Counter(labels)
+    return [f"{label} ({str(key).rsplit('/', 1)[-1]})" if label_counts[label] > 1 else label
+            for key, label in zip(keys, labels)]
+
+
+def display_frequency(frequency: dict, names: dict):
+    """
+    :param frequency: frequency dictionary keyed by canonical key
+    :param names: dictionary of key to display name, e.g. WorkAggregates.primary_location_names
+    :return: frequency dictionary keyed by display label in the same order, see display_labels()
+    """
+    return dict(zip(display_labels(list(frequency), names), frequency.values()))
+
+
+def none_list(identifiers: list, is_none: "numpy.ndarray"):
+    """
+    :param identifiers: identifiers of the rows the mask refers to
+    :param is_none: boolean mask over rows
+    :return: list of identifiers of the rows in the mask
+    """
+    import numpy as np
+
+    return [identifiers[row] for row in np.flatnonzero(is_none)]
+
+
+def sort_tables(work_aggregates: WorkAggregates):
+    """
+    Sorts the frequency tables in place as displayed by the create_*_frequency_plot functions.
+
+    :param work_aggregates: WorkAggregates with unsorted tables
+    :return: work_aggregates
+    """
+    work_aggregates.type_frequency = dict(sorted(work_aggregates.type_frequency.items(),
+                                                 key=lambda x: (x[1], x[0]), reverse=True))
+    work_aggregates.year_frequency = dict(sorted(work_aggregates.year_frequency.items(),
+                                                 key=lambda x: (x[1], x[0]), reverse=True))
+    # Tables keyed by canonical key are sorted by display name, then key, as the names are displayed.
+    venue_names = work_aggregates.primary_location_names
+    keyword_names = work_aggregates.keyword_names
+    concept_names = work_aggregates.concepts_names
+    work_aggregates.primary_location_frequency = dict(sorted(work_aggregates.primary_location_frequency.items(),
+                                                             key=lambda x: (x[1], venue_names[x[0]].lower(), x[0])))
+    work_aggregates.keyword_frequency = dict(sorted(work_aggregates.keyword_frequency.items(),
+                                                    key=lambda x: (x[1], keyword_names[x[0]], x[0])))
+    work_aggregates.concepts_frequency = dict(sorted(work_aggregates.concepts_frequency.items(),
+                                                     key=lambda x: (x[1], concept_names[x[0]], x[0])))
+    return work_aggregates
+
+
+def split_type_codes(work_store: WorkStore,
+                     type_codes: "numpy.ndarray",
+                     venue_codes: "numpy.ndarray",
+                     venue_type_codes: "numpy.ndarray"):
+    """
+    Separates articles into journal articles and conference proceedings using the type of their primary location;
+    articles with a primary location of another type get NONE_CODE, so they are left out of the item type table.
+
+    :param work_store: WorkStore the codes come from
+    :param type_codes: item type codes of some rows
+    :param venue_codes: venue codes of the same rows
+    :param venue_type_codes: venue type codes of the same rows
+    :return: array of item type codes and the list of labels they index
+    """
+    type_count = len(work_store.type_index)
+    journal_type_code = type_count
+    conference_type_code = type_count + 1
+    type_labels = work_store.type_index.labels + [JOURNAL_ARTICLE_LABEL, CONFERENCE_PROCEEDING_LABEL]
+    article_with_source = (type_codes == work_store.type_index.codes.get('article', -2)) & (venue_codes != NONE_CODE)
+    is_journal = venue_type_codes == work_store.venue_type_index.codes.get('journal', -2)
+    is_conference = venue_type_codes == work_store.venue_type_index.codes.get('conference', -2)
+    split_codes = type_codes.copy()
+    split_codes[article_with_source] = NONE_CODE
+    split_codes[article_with_source & is_journal] = journal_type_code
+    split_codes[article_with_source & is_conference] = conference_type_code
+    return split_codes, type_labels
+
+
+def count_rows(work_store: WorkStore, rows=None):
+    """
+    Computes unsorted frequency tables and None lists over some rows of a WorkStore with np.bincount. Only the
+    selected rows are read, so the cost is proportional to their number.
+
+    Articles are separated into journal articles and conference proceedings, see split_type_codes().
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param rows: row numbers to count, as a range or a list; None for every row
+    :return: WorkAggregates with unsorted tables
+    """
+    import numpy as np
+
+    type_codes = column_array(work_store.type_codes, np.intc, rows)
+    venue_codes = column_array(work_store.venue_codes, np.intc, rows)
+    venue_type_codes = column_array(work_store.venue_type_codes, np.intc, rows)
+    year_codes = column_array(work_store.year_codes, np.intc, rows)
+    keyword_codes = flat_codes(work_store.keyword_codes, work_store.keyword_offsets, rows)
+    concept_codes = flat_codes(work_store.concept_codes, work_store.concept_offsets, rows)
+    keyword_none = column_array(work_store.keyword_none, np.int8, rows).astype(bool)
+    concept_none = column_array(work_store.concept_none, np.int8, rows).astype(bool)
+    identifiers = work_store.identifiers if rows is None else [work_store.identifiers[row] for row in rows]
+
+    split_codes, type_labels = split_type_codes(work_store, type_codes, venue_codes, venue_type_codes)
+
+    work_aggregates = WorkAggregates()
+    work_aggregates.total_count = len(identifiers)
+    work_aggregates.type_frequency = count_codes(split_codes, type_labels)
+    work_aggregates.type_none_list = none_list(identifiers, type_codes == NONE_CODE)
+    work_aggregates.year_frequency = count_codes(year_codes, work_store.year_index.keys)
+    work_aggregates.year_none_list = none_list(identifiers, year_codes == NONE_CODE)
+    work_aggregates.primary_location_frequency = count_codes(venue_codes, work_store.venue_index.keys)
+    work_aggregates.primary_location_names = key_names(work_aggregates.primary_location_frequency,
+                                                       work_store.venue_index)
+    work_aggregates.primary_location_none_list = none_list(identifiers, venue_codes == NONE_CODE)
+    work_aggregates.keyword_frequency = count_codes(keyword_codes, work_store.keyword_index.keys)
+    work_aggregates.keyword_names = key_names(work_aggregates.keyword_frequency, work_store.keyword_index)
+    work_aggregates.keyword_none_list = none_list(identifiers, keyword_none)
+    work_aggregates.concepts_frequency = count_codes(concept_codes, work_store.concept_index.keys)
+    work_aggregates.concepts_names = key_names(work_aggregates.concepts_frequency, work_store.concept_index)
+    work_aggregates.concepts_none_list = none_list(identifiers, concept_none)
+    return work_aggregates
+
+
+def combine_aggregates(work_aggregates: WorkAggregates, delta: WorkAggregates, subtract: bool = False):
+    """
+    Adds or subtracts the tables of some rows (see count_rows()) to or from aggregates, with Counter arithmetic, so
+    the cost is proportional to the number of categories rather than the number of works.
+
+    :param work_aggregates: aggregates to update; not modified
+    :param delta: aggregates of the rows added or removed
+    :param subtract: True if the rows of delta are removed
+    :return: new sorted WorkAggregates
+    """
+    combined = WorkAggregates()
+    for name, value in vars(work_aggregates).items():
+        delta_value = getattr(delta, name)
+        if name == "total_count":
+            combined.total_count = value - delta_value if subtract else value + delta_value
+        elif name.endswith("_none_list"):
+            removed = set(delta_value)
+            setattr(combined, name, [identifier for identifier in value if identifier not in removed]
+                    if subtract else value + delta_value)
+        elif name.endswith("_names"):
+            # Each *_names dictionary follows its table in vars(), so it is pruned to the categories that are left.
+            names = {**value, **delta_value}
+            frequency = getattr(combined, name[:-len("_names")] + "_frequency")
+            setattr(combined, name, {key: names[key] for key in frequency})
+        elif subtract:
+            setattr(combined, name, dict(Counter(value) - Counter(delta_value)))
+        else:
+            setattr(combined, name, dict(Counter(value) + Counter(delta_value)))
+    return sort_tables(combined)
+
+
+def aggregate_works(work_store: WorkStore):
+    """
+    Computes the frequency tables and None lists for all plots in one pass over the WorkStore's code columns, using
+    np.bincount, see count_rows(). The result is memoized per WorkStore; if works have been added since, only the
+    added rows are counted and combined with the memoized tables.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :return: WorkAggregates with tables sorted as displayed by the create_*_frequency_plot functions
+    """
+    memoized = aggregates_memo.get(work_store)
+    if memoized is not None and memoized[0] == len(work_store):
+        return memoized[1]
+    if memoized is not None and memoized[0] < len(work_store):
+        work_aggregates = combine_aggregates(memoized[1], count_rows(work_store, range(memoized[0], len(work_store))))
+    else:
+        work_aggregates = sort_tables(count_rows(work_store))
+
+    aggregates_memo[work_store] = (len(work_store), work_aggregates)
+    return work_aggregates
+
+
+def inherit_aggregates(source_store: WorkStore, work_store: WorkStore):
+    """
+    Lets a WorkStore that starts with the rows of another, e.g. a later copy of a growing store, reuse the other's
+    memoized aggregates, so aggregate_works() only counts the rows added since.
+
+    :param source_store: WorkStore whose rows work_store starts with
+    :param work_store: WorkStore to register the aggregates for
+    :return: None
+    """
+    memoized = aggregates_memo.get(source_store)
+    if memoized is not None and work_store not in aggregates_memo and memoized[0] <= len(work_store):
+        aggregates_memo[work_store] = memoized
+
+
+def remove_works(work_store: WorkStore, identifiers):
+    """
+    Returns a copy of a WorkStore without some works. The aggregates of the copy are derived from the memoized
+    aggregates of the store by subtracting the removed rows, so they are not recomputed from all rows.
+
+    :param work_store: WorkStore of Work objects from OpenAlex
+    :param identifiers: identifiers of the works to remove; identifiers not in the store are ignored
+    :return: new WorkStore
+    """
+    removed_rows = sorted(work_store.rows[identifier] for identifier in set(identifiers) if identifier in work_store)
+    work_aggregates = aggregate_works(work_store)
+    if removed_rows:
+        removed_row_set = set(removed_rows)
+        pruned_store = work_store.subset([row for row in range(len(work_store)) if row not in removed_row_set])
+        work_aggregates = combine_aggregates(work_aggregates, count_rows(work_store, removed_rows), subtract=True)
+    else:
+        pruned_store = work_store.copy()
+    aggregates_memo[pruned_store] = (len(pruned_store), work_aggregates)
+    return pruned_store
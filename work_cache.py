@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+WORK_CACHE_PATH = os.environ.get("WORK_CACHE_PATH",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "computable_bibliography",
+                                              "works.sqlite3"))
+WORK_CACHE_TTL = 30 * 24 * 60 * 60  # Seconds a cached Work object stays valid, OpenAlex updates works regularly.
+WORK_CACHE_MAX_BYTES = 512 * 1024 * 1024
+SQLITE_MAX_PARAMETERS = 900  # Stays below SQLite's default limit of 999 parameters per statement.
+
+
+class WorkCache:
+    """
+    Persistent on-disk cache of OpenAlex Work objects keyed by normalized DOI (see query_open_alex.normalize_doi()).
+    Work objects are stored as compressed JSON in SQLite with a per-entry expiry time. The stored size is kept as a
+    running total; when it exceeds max_bytes, expired entries and then the least recently used entries are evicted.
+
+    The cache is thread-safe and can be shared by several queries, e.g. every session of the Shiny app.
+    """
+
+    def __init__(self,
+                 path: str = WORK_CACHE_PATH,
+                 ttl: float = WORK_CACHE_TTL,
+                 max_bytes: int = WORK_CACHE_MAX_BYTES):
+        """
+        :param path: path to the SQLite database file, created if it does not exist; ":memory:" for a temporary cache
+        :param ttl: default number of seconds an entry stays valid
+        :param max_bytes: maximum total size of the stored (compressed) Work objects
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS works ("
+                                "doi TEXT PRIMARY KEY, "
+                                "work BLOB NOT NULL, "
+                                "size INTEGER NOT NULL, "
+                                "expires_at REAL NOT NULL, "
+                                "last_access REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS works_last_access ON works (last_access)")
+        self.connection.commit()
+        self.total_bytes = self.stored_bytes()
+
+    def stored_bytes(self):
+        """
+        Sums the size of every entry, scanning the whole table. Must be called with the lock held, except in __init__().
+
+        :return: total size of the stored (compressed) Work objects
+        """
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM works").fetchone()[0]
+
+    def stored_sizes(self, doi_list: list):
+        """
+        Must be called with the lock held.
+
+        :param doi_list: list of normalized DOIs
+        :return: dictionary of normalized DOI to stored size, for the DOIs in the cache
+        """
+        size_dictionary = {}
+        for i in range(0, len(doi_list), SQLITE_MAX_PARAMETERS):
+            chunk = doi_list[i:i + SQLITE_MAX_PARAMETERS]
+            size_dictionary.update(self.connection.execute(
+                f"SELECT doi, size FROM works WHERE doi IN ({','.join('?' * len(chunk))})", chunk))
+        return size_dictionary
+
+    def get_many(self, doi_list: list):
+        """
+        Looks up cached Work objects. Expired entries are removed and count as missing.
+
+        :param doi_list: list of normalized DOIs
+        :return: dictionary of normalized DOI to Work object for the DOIs found in the cache
+        """
+        now = time.time()
+        work_dictionary = {}
+        expired_doi_list = []
+        with self.lock:
+            for i in range(0, len(doi_list), SQLITE_MAX_PARAMETERS):
+                chunk = doi_list[i:i + SQLITE_MAX_PARAMETERS]
+                rows = self.connection.execute(
+                    f"SELECT doi, work, size, expires_at FROM works WHERE doi IN ({','.join('?' * len(chunk))})", chunk)
+                for doi, work, size, expires_at in rows:
+                    if expires_at <= now:
+                        expired_doi_list.append(doi)
+                        self.total_bytes -= size
+                    else:
+                        work_dictionary[doi] = json.loads(zlib.decompress(work))
+            self.connection.executemany("UPDATE works SET last_access = ? WHERE doi = ?",
+                                        [(now, doi) for doi in work_dictionary])
+            self.connection.executemany("DELETE FROM works WHERE doi = ?", [(doi,) for doi in expired_doi_list])
+            self.connection.commit()
+        return work_dictionary
+
+    def get(self, doi: str):
+        """
+        Looks up one cached Work object.
+
+        :param doi: normalized DOI
+        :return: Work object, or None if it is not cached or has expired
+        """
+        return self.get_many([doi]).get(doi)
+
+    def put_many(self, work_dictionary: dict, ttl: float = None):
+        """
+        Stores Work objects, replacing existing entries, then evicts least recently used entries if the cache is over
+        its size limit.
+
+        :param work_dictionary: dictionary of normalized DOI to Work object
+        :param ttl: number of seconds the entries stay valid; defaults to the cache's ttl
+        :return: None
+        """
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        row_list = []
+        for doi, work in work_dictionary.items():
+            compressed_work = zlib.compress(json.dumps(work, separators=(",", ":")).encode("utf-8"))
+            row_list.append((doi, compressed_work, len(compressed_work), expires_at, now))
+        with self.lock:
+            # Replaced entries no longer count towards the total.
+            self.total_bytes -= sum(self.stored_sizes(list(work_dictionary)).values())
+            self.connection.executemany("INSERT OR REPLACE INTO works (doi, work, size, expires_at, last_access) "
+                                        "VALUES (?, ?, ?, ?, ?)", row_list)
+            self.total_bytes += sum(row[2] for row in row_list)
+            self.evict()
+            self.connection.commit()
+
+    def put(self, doi: str, work: dict, ttl: float = None):
+        """
+        Stores one Work object.
+
+        :param doi: normalized DOI
+        :param work: Work object
+        :param ttl: number of seconds the entry stays valid; defaults to the cache's ttl
+        :return: None
+        """
+        self.put_many({doi: work}, ttl)
+
+    def evict(self):
+        """
+        If the cache is over max_bytes, removes expired entries, then least recently used entries until the cache is
+        within max_bytes. The table is only scanned when the running total is over max_bytes; the total is then
+        recounted, which also picks up entries written by other processes sharing the file. Must be called with the
+        lock held.
+
+        :return: None
+        """
+        if self.total_bytes <= self.max_bytes:
+            return
+        self.connection.execute("DELETE FROM works WHERE expires_at <= ?", (time.time(),))
+        self.total_bytes = self.stored_bytes()
+        if self.total_bytes <= self.max_bytes:
+            return
+        evicted_doi_list = []
+        for doi, size in self.connection.execute("SELECT doi, size FROM works ORDER BY last_access"):
+            if self.total_bytes <= self.max_bytes:
+                break
+            evicted_doi_list.append((doi,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM works WHERE doi = ?", evicted_doi_list)
+
+    def invalidate(self, doi_list: list):
+        """
+        Removes entries, e.g. for works known to have changed in OpenAlex.
+
+        :param doi_list: list of normalized DOIs
+        :return: None
+        """
+        with self.lock:
+            self.total_bytes -= sum(self.stored_sizes(list(doi_list)).values())
+            self.connection.executemany("DELETE FROM works WHERE doi = ?", [(doi,) for doi in doi_list])
+            self.connection.commit()
+
+    def clear(self):
+        """
+        Removes every entry.
+
+        :return: None
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM works")
+            self.connection.commit()
+            self.total_bytes = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the database connection.
+
+        :return: None
+        """
+        with self.lock:
+            self.connection.close()
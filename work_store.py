@@ -0,0 +1,310 @@
+from array import array
+
+from normalization_index import NormalizationIndex, default_normalization_index
+
+NONE_CODE = -1  # Code stored for a missing (None) categorical value.
+
+
+class CategoryIndex:
+    """
+    Interns categorical values (item types, years, venues, keywords, concepts) as small integer codes, so that each
+    distinct value is stored once no matter how many works share it. Values are keyed by their label, or by an
+    explicit key, e.g. the normalized key of a venue (see normalization_index.NormalizationIndex); codes may also map
+    further alias keys to the same code.
+    """
+
+    __slots__ = ("labels", "ids", "keys", "codes")
+
+    def __init__(self):
+        self.labels = []
+        self.ids = []
+        self.keys = []
+        self.codes = {}
+
+    def intern(self, label, openalex_id: str = None, key=None):
+        """
+        Returns the code of a value, adding it to the index if it is new.
+
+        :param label: value to intern, e.g. a display name or a publication year
+        :param openalex_id: OpenAlex ID of the value, recorded the first time the value is seen
+        :param key: key identifying the value, or None to use the label
+        :return: integer code, or NONE_CODE if label is None
+        """
+        if label is None:
+            return NONE_CODE
+        if key is None:
+            key = label
+        code = self.codes.get(key)
+        if code is None:
+            code = len(self.labels)
+            self.codes[key] = code
+            self.labels.append(label)
+            self.ids.append(openalex_id)
+            self.keys.append(key)
+        return code
+
+    def copy(self):
+        """
+        :return: independent copy of the index
+        """
+        category_index = CategoryIndex()
+        category_index.labels = list(self.labels)
+        category_index.ids = list(self.ids)
+        category_index.keys = list(self.keys)
+        category_index.codes = dict(self.codes)
+        return category_index
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class WorkStore:
+    """
+    Compact columnar store of the Work objects returned by OpenAlex, replacing one dictionary per attribute keyed by
+    the same identifiers. Each work is a row; identifiers are stored once and categorical attributes are stored as
+    integer codes into CategoryIndex tables. Keywords and concepts are stored as one flat code column with row offsets
+    (row i owns codes[offsets[i]:offsets[i + 1]]).
+
+    Venues, keywords and concepts are interned by their normalized key, so aliases of one venue, keyword or concept
+    share a code and its canonical display name (see normalization_index.NormalizationIndex). Authorships and topics
+    are kept as returned by OpenAlex.
+    """
+
+    def __init__(self, normalization_index: NormalizationIndex = None):
+        """
+        :param normalization_index: lookup table of canonical venues, keywords and concepts, or None for the table of
+        the process, see normalization_index.default_normalization_index()
+        """
+        self.normalization_index = normalization_index
+        self.identifiers = []
+        self.rows = {}
+        self.type_index = CategoryIndex()
+        self.year_index = CategoryIndex()
+        self.venue_index = CategoryIndex()
+        self.venue_type_index = CategoryIndex()
+        self.keyword_index = CategoryIndex()
+        self.concept_index = CategoryIndex()
+        self.type_codes = array("i")
+        self.year_codes = array("i")
+        self.venue_codes = array("i")
+        self.venue_type_codes = array("i")
+        self.keyword_codes = array("i")
+        self.keyword_offsets = array("q", [0])
+        self.keyword_none = array("b")
+        self.concept_codes = array("i")
+        self.concept_offsets = array("q", [0])
+        self.concept_none = array("b")
+        self.authorships = []
+        self.topics = []
+
+    def add_work(self, identifier: str, result: dict):
+        """
+        Adds the attributes of one OpenAlex Work object as a new row. Identifiers already in the store are skipped.
+
+        :param identifier: input identifier the Work object was returned for
+        :param result: Work object from OpenAlex
+        :return: None. Raises KeyError if the Work object is missing an attribute, see
+        query_open_alex.is_complete_work().
+        """
+        if identifier in self.rows:
+            return
+        authorships = result["authorships"]
+        concepts = result["concepts"]
+        keywords = result["keywords"]
+        topics = result["topics"]
+        item_type = result["type"]
+        publication_year = result["publication_year"]
+        primary_location = result["primary_location"]
+        source = primary_location["source"] if primary_location is not None else None
+
+        self.rows[identifier] = len(self.identifiers)
+        self.identifiers.append(identifier)
+        self.type_codes.append(self.type_index.intern(item_type))
+        self.year_codes.append(self.year_index.intern(publication_year))
+        if source is None:
+            self.venue_codes.append(NONE_CODE)
+            self.venue_type_codes.append(NONE_CODE)
+        else:
+            self.venue_codes.append(self.intern_normalized(self.venue_index, "venue", source, source.get("issn_l")))
+            self.venue_type_codes.append(self.venue_type_index.intern(source["type"]))
+        self.keyword_none.append(keywords is None)
+        for keyword in keywords or []:
+            self.keyword_codes.append(self.intern_normalized(self.keyword_index, "keyword", keyword))
+        self.keyword_offsets.append(len(self.keyword_codes))
+        self.concept_none.append(concepts is None)
+        for concept in concepts or []:
+            self.concept_codes.append(self.intern_normalized(self.concept_index, "concept", concept))
+        self.concept_offsets.append(len(self.concept_codes))
+        self.authorships.append(authorships)
+        self.topics.append(topics)
+
+    def intern_normalized(self, category_index: CategoryIndex, kind: str, value: dict, issn_l: str = None):
+        """
+        Interns a venue, keyword or concept by its normalized key. The OpenAlex ID (or display name) of the value is
+        recorded as an alias of its code, so the normalization index is only consulted once per distinct value.
+
+        :param category_index: venue_index, keyword_index or concept_index
+        :param kind: "venue", "keyword" or "concept"
+        :param value: source, keyword or concept object of a Work object
+        :param issn_l: ISSN-L of a venue, or None
+        :return: integer code, or NONE_CODE if the value has neither an ID nor a display name
+        """
+        alias = value.get("id") or value["display_name"]
+        code = category_index.codes.get(alias)
+        if code is None:
+            if self.normalization_index is None:
+                self.normalization_index = default_normalization_index()
+            key, openalex_id, label = self.normalization_index.canonical(kind, value.get("id"), value["display_name"],
+                                                                         issn_l)
+            code = category_index.intern(label, openalex_id, key)
+            if code != NONE_CODE:
+                category_index.codes[alias] = code
+        return code
+
+    def keyword_labels(self, row: int):
+        """
+        :param row: row number of a work
+        :return: list of keyword display names of the work, or None if OpenAlex returned None
+        """
+        if self.keyword_none[row]:
+            return None
+        labels = self.keyword_index.labels
+        return [labels[code] for code in self.keyword_codes[self.keyword_offsets[row]:self.keyword_offsets[row + 1]]
+                if code != NONE_CODE]
+
+    def concept_labels(self, row: int):
+        """
+        :param row: row number of a work
+        :return: list of concept display names of the work, or None if OpenAlex returned None
+        """
+        if self.concept_none[row]:
+            return None
+        labels = self.concept_index.labels
+        return [labels[code] for code in self.concept_codes[self.concept_offsets[row]:self.concept_offsets[row + 1]]
+                if code != NONE_CODE]
+
+    def copy(self):
+        """
+        Copies the store, e.g. to hand a consistent snapshot of a running query to another thread.
+
+        :return: independent copy of the store
+        """
+        work_store = WorkStore(self.normalization_index)
+        for name, value in vars(self).items():
+            if isinstance(value, CategoryIndex):
+                setattr(work_store, name, value.copy())
+            elif isinstance(value, dict):
+                setattr(work_store, name, dict(value))
+            elif isinstance(value, (array, list)):
+                setattr(work_store, name, value[:])
+            elif hasattr(value, "copy"):  # E.g. snapshot.LazyRowList columns of a loaded snapshot.
+                setattr(work_store, name, value.copy())
+        return work_store
+
+    def subset(self, rows: list):
+        """
+        Copies some rows of the store into a new store, e.g. to drop works removed from the input list. Code columns
+        are gathered with NumPy; the category indexes are copied whole, so codes keep their meaning.
+
+        :param rows: row numbers to keep, in the order of the new store
+        :return: new store
+        """
+        import numpy as np
+
+        row_array = np.asarray(rows, dtype=np.int64)
+        work_store = WorkStore(self.normalization_index)
+        for name, value in vars(self).items():
+            if isinstance(value, CategoryIndex):
+                setattr(work_store, name, value.copy())
+        work_store.identifiers = [self.identifiers[row] for row in rows]
+        work_store.rows = {identifier: row for row, identifier in enumerate(work_store.identifiers)}
+        for name in ["type_codes", "year_codes", "venue_codes", "venue_type_codes", "keyword_none", "concept_none"]:
+            column = getattr(self, name)
+            setattr(work_store, name, array(column.typecode, np.frombuffer(column, dtype=column.typecode)[row_array]
+                                            .tobytes()))
+        for codes_name, offsets_name in [("keyword_codes", "keyword_offsets"), ("concept_codes", "concept_offsets")]:
+            codes = getattr(self, codes_name)
+            offsets = np.frombuffer(getattr(self, offsets_name), dtype=np.int64)
+            lengths = offsets[row_array + 1] - offsets[row_array]
+            subset_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=subset_offsets[1:])
+            # Position of every kept code in the source column: its row's source offset plus its rank in the row.
+            positions = (np.repeat(offsets[row_array] - subset_offsets[:-1], lengths)
+                         + np.arange(subset_offsets[-1], dtype=np.int64))
+            setattr(work_store, codes_name, array(codes.typecode, np.frombuffer(codes, dtype=codes.typecode)[positions]
+                                                  .tobytes()))
+            setattr(work_store, offsets_name, array("q", subset_offsets.tobytes()))
+        work_store.authorships = [self.authorships[row] for row in rows]
+        work_store.topics = [self.topics[row] for row in rows]
+        return work_store
+
+    def work_dictionary(self, row: int):
+        """
+        Rebuilds the Work object fields of one row, in the shape returned by OpenAlex. Keywords, concepts and primary
+        locations only include the attributes kept in the store, with their canonical IDs and display names.
+
+        :param row: row number of a work
+        :return: dictionary of "authorships", "concepts", "keywords", "topics", "type", "publication_year" and
+        "primary_location"
+        """
+        type_code = self.type_codes[row]
+        year_code = self.year_codes[row]
+        venue_code = self.venue_codes[row]
+        if venue_code == NONE_CODE:
+            primary_location = {"source": None}
+        else:
+            venue_type_code = self.venue_type_codes[row]
+            primary_location = {"source": {
+                "id": self.venue_index.ids[venue_code],
+                "display_name": self.venue_index.labels[venue_code],
+                "type": None if venue_type_code == NONE_CODE else self.venue_type_index.labels[venue_type_code]}}
+        concept_codes = self.concept_codes[self.concept_offsets[row]:self.concept_offsets[row + 1]]
+        keyword_codes = self.keyword_codes[self.keyword_offsets[row]:self.keyword_offsets[row + 1]]
+        return {"authorships": self.authorships[row],
+                "concepts": None if self.concept_none[row] else [
+                    {"id": self.concept_index.ids[code], "display_name": self.concept_index.labels[code]}
+                    for code in concept_codes if code != NONE_CODE],
+                "keywords": None if self.keyword_none[row] else [
+                    {"id": self.keyword_index.ids[code], "display_name": self.keyword_index.labels[code]}
+                    for code in keyword_codes if code != NONE_CODE],
+                "topics": self.topics[row],
+                "type": None if type_code == NONE_CODE else self.type_index.labels[type_code],
+                "publication_year": None if year_code == NONE_CODE else self.year_index.labels[year_code],
+                "primary_location": primary_location}
+
+    def to_dictionaries(self):
+        """
+        Rebuilds one dictionary per attribute keyed by identifier, in the shape of the OpenAlex Work object fields, e.g.
+        for printing. See work_dictionary().
+
+        :return: authorships, concepts, keywords, topics, type, publication year and primary location dictionaries
+        """
+        authorships_dictionary = {}
+        concepts_dictionary = {}
+        keywords_dictionary = {}
+        topics_dictionary = {}
+        type_dictionary = {}
+        publication_year_dictionary = {}
+        primary_location_dictionary = {}
+        for row, identifier in enumerate(self.identifiers):
+            work = self.work_dictionary(row)
+            authorships_dictionary[identifier] = work["authorships"]
+            concepts_dictionary[identifier] = work["concepts"]
+            keywords_dictionary[identifier] = work["keywords"]
+            topics_dictionary[identifier] = work["topics"]
+            type_dictionary[identifier] = work["type"]
+            publication_year_dictionary[identifier] = work["publication_year"]
+            primary_location_dictionary[identifier] = work["primary_location"]
+        return (authorships_dictionary,
+                concepts_dictionary,
+                keywords_dictionary,
+                topics_dictionary,
+                type_dictionary,
+                publication_year_dictionary,
+                primary_location_dictionary)
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __contains__(self, identifier):
+        return identifier in self.rows